@@ -0,0 +1,210 @@
+#!/usr/bin/env python
+# micro benchmark and regression check of the DXT5 codec in read_scmap.py
+
+import importlib
+import json
+import math
+import os
+import platform
+import random
+import sys
+import time
+
+import mirror_map
+from mirror_transform import symmetry_targets
+import synthetic_map
+from read_scmap import EmbeddedScMapDDSImage
+
+TEXTURES = [ 'noise', 'flat', 'gradient', 'normal_map' ]
+
+def main():
+
+    from docopt import docopt
+    doc = '''
+    Usage:
+        {name} [options]
+
+    Options:
+        -h, --help                 Show this screen and exit.
+        --size=<n>                 Texture width and height [default: 256]
+        --textures=<list>          Textures to run [default: {textures}]
+        --axes=<list>              Mirror axes for block mirror [default: x,y,xy,yx]
+        --repeat=<n>               Runs per measurement, fastest run is reported [default: 3]
+        --seed=<n>                 Random seed [default: 0]
+        --backend=<module:class>   Codec to compare against the scalar reference in read_scmap.py,
+                                   a class providing get_block, set_block, unpack_alpha, unpack_color,
+                                   pack_alpha, pack_color and as_uncompressed like EmbeddedScMapDDSImage
+        --output=<path>            Write results as JSON
+    '''.format(name=os.path.basename(sys.argv[0]),textures=','.join(TEXTURES))
+    args = docopt(doc, sys.argv[1:])
+
+    size = int(args['--size'])
+    if size % 4:
+        raise Exception("Texture size has to be a multiple of 4")
+    repeat = int(args['--repeat'])
+    axes = args['--axes'].split(',')
+    codecs = { 'reference': EmbeddedScMapDDSImage }
+    if args['--backend']:
+        codecs['backend'] = load_backend( args['--backend'] )
+
+    results = {}
+    print("{: <12} {: <10} {: >12} {: >12} {: >12} {: >12} {: >8} {: >8}".format(
+        'texture', 'codec', 'decode b/s', 'encode b/s', 'mirror b/s', 'uncomp. b/s', 'PSNR', 'max abs' ))
+    for texture in args['--textures'].split(','):
+        pixels = generate_texture( texture, size, random.Random( int(args['--seed']) ) )
+        results[texture] = {}
+        for name, codec in sorted( codecs.items() ):
+            result = benchmark_codec( codec, pixels, size, axes, repeat )
+            results[texture][name] = result
+            print("{: <12} {: <10} {: >12.0f} {: >12.0f} {: >12.0f} {: >12.0f} {: >8} {: >8}".format(
+                texture, name,
+                result['decode_blocks_per_second'], result['encode_blocks_per_second'],
+                result['mirror_blocks_per_second'], result['as_uncompressed_blocks_per_second'],
+                'inf' if result['psnr'] is None else '{:.2f}'.format(result['psnr']), result['max_abs_error'] ))
+        if 'backend' in codecs:
+            mismatches = compare_codecs( EmbeddedScMapDDSImage, codecs['backend'], pixels, size )
+            results[texture]['mismatches'] = mismatches
+            for stage in sorted( mismatches ):
+                if mismatches[stage]:
+                    print("{: <12} backend differs from reference in {} for {} blocks".format( texture, stage, mismatches[stage] ))
+
+    if args['--output']:
+        with open( args['--output'], 'w' ) as output:
+            json.dump( {
+                'python': platform.python_version(),
+                'platform': platform.platform(),
+                'size': size,
+                'results': results,
+            }, output, indent=2 )
+
+def load_backend( name ):
+    module_name, _, class_name = name.partition(':')
+    return getattr( importlib.import_module( module_name ), class_name or 'EmbeddedScMapDDSImage' )
+
+# rgba pixels in rows of width size
+def generate_texture( texture, size, rng ):
+    if texture == 'noise':
+        return [ tuple( rng.randrange( 256 ) for _ in range( 4 ) ) for _ in range( size*size ) ]
+    elif texture == 'flat':
+        color = tuple( rng.randrange( 256 ) for _ in range( 4 ) )
+        return [ color ] * ( size*size )
+    elif texture == 'gradient':
+        scale = 255 / max( size-1, 1 )
+        return [ ( round( x*scale ), round( y*scale ), round( (x+y)*scale/2 ), round( 255 - x*scale ) )
+            for y in range( size ) for x in range( size ) ]
+    elif texture == 'normal_map':
+        # normals of a wavy height field, x in alpha and y in green like the scmap normal maps
+        pixels = []
+        for y in range( size ):
+            for x in range( size ):
+                dx = math.cos( x / 7.0 ) * math.sin( y / 11.0 ) * 0.8
+                dy = math.sin( x / 7.0 ) * math.cos( y / 11.0 ) * 0.8
+                length = math.sqrt( dx*dx + dy*dy + 1 )
+                pixels.append( ( 255, round( ( dy/length + 1 ) * 127.5 ), 0, round( ( dx/length + 1 ) * 127.5 ) ) )
+        return pixels
+    raise Exception("Unknown texture {}".format(texture))
+
+def block_pixels( pixels, size, block_x, block_y ):
+    offset = block_y*4*size + block_x*4
+    return [ pixels[offset+y*size+x] for y in range( 4 ) for x in range( 4 ) ]
+
+def blocks_of( size ):
+    return [ (x,y) for y in range( size//4 ) for x in range( size//4 ) ]
+
+def empty_dxt5_image( codec, size ):
+    return codec( bytearray( synthetic_map.dds_header( size, size, 1, True ) + bytes( size*size ) ) )
+
+def encode_block( codec, pixels ):
+    a0, a1, alphas = codec.pack_alpha( [ pixel[3] for pixel in pixels ] )
+    c0, c1, colors = codec.pack_color( [ pixel[0:3] for pixel in pixels ] )
+    return ( a0, a1, alphas, c0, c1, colors )
+
+def decode_block( codec, image, x, y ):
+    block_data = list( image.get_block( x, y, 0 ) )
+    colors = codec.unpack_color( block_data )
+    alphas = codec.unpack_alpha( block_data )
+    return [ ( color[0], color[1], color[2], alpha ) for color, alpha in zip( colors, alphas ) ]
+
+def encode( codec, pixels, size ):
+    image = empty_dxt5_image( codec, size )
+    for x, y in blocks_of( size ):
+        image.set_block( x, y, 0, encode_block( codec, block_pixels( pixels, size, x, y ) ) )
+    return image
+
+def decode( codec, image, size ):
+    decoded = [ None ] * ( size*size )
+    for x, y in blocks_of( size ):
+        block = decode_block( codec, image, x, y )
+        for i in range( 16 ):
+            decoded[ ( y*4 + i//4 ) * size + x*4 + i%4 ] = block[i]
+    return decoded
+
+def best_time( repeat, func, *args ):
+    best = None
+    for _ in range( repeat ):
+        start = time.perf_counter()
+        ret = func( *args )
+        elapsed = time.perf_counter() - start
+        best = elapsed if best is None else min( best, elapsed )
+    return best, ret
+
+def round_trip_error( pixels, decoded ):
+    squared_error = 0
+    max_abs_error = 0
+    for pixel, decoded_pixel in zip( pixels, decoded ):
+        for a, b in zip( pixel, decoded_pixel ):
+            error = abs( a - round( b ) )
+            squared_error += error*error
+            max_abs_error = max( max_abs_error, error )
+    mse = squared_error / ( len( pixels ) * 4 )
+    psnr = None if mse == 0 else 10 * math.log10( 255*255 / mse )
+    return psnr, max_abs_error
+
+def benchmark_codec( codec, pixels, size, axes, repeat ):
+    blocks_count = ( size//4 ) ** 2
+    encode_time, image = best_time( repeat, encode, codec, pixels, size )
+    decode_time, decoded = best_time( repeat, decode, codec, image, size )
+    uncompress_time, _ = best_time( repeat, image.as_uncompressed )
+    # lookup tables are built on first use, that shouldn't count against the first codec measured
+    for axis in axes:
+        for target in symmetry_targets( axis ):
+            mirror_map.dxt5_index_tables( target )
+    mirror_time = 0
+    for axis in axes:
+        mirror_image = codec( bytearray( image.data ) )
+        elapsed, _ = best_time( repeat, mirror_map.mirror_compressed_dds_image, mirror_image, axis, 1 )
+        mirror_time += elapsed
+    psnr, max_abs_error = round_trip_error( pixels, decoded )
+    return {
+        'blocks': blocks_count,
+        'decode_blocks_per_second': blocks_count / decode_time,
+        'encode_blocks_per_second': blocks_count / encode_time,
+        'mirror_blocks_per_second': blocks_count * len( axes ) / mirror_time if mirror_time else 0,
+        'as_uncompressed_blocks_per_second': blocks_count / uncompress_time,
+        'psnr': psnr,
+        'max_abs_error': max_abs_error,
+    }
+
+# count blocks where backend and reference don't produce the same values
+def compare_codecs( reference, backend, pixels, size ):
+    mismatches = { 'encode': 0, 'set_block': 0, 'get_block': 0, 'decode': 0 }
+    reference_image = empty_dxt5_image( reference, size )
+    backend_image = empty_dxt5_image( backend, size )
+    for x, y in blocks_of( size ):
+        pixels_of_block = block_pixels( pixels, size, x, y )
+        reference_block = encode_block( reference, pixels_of_block )
+        if encode_block( backend, pixels_of_block ) != reference_block:
+            mismatches['encode'] += 1
+        reference_image.set_block( x, y, 0, reference_block )
+        backend_image.set_block( x, y, 0, reference_block )
+        if bytes( backend_image.data[-size*size:] ) != bytes( reference_image.data[-size*size:] ):
+            mismatches['set_block'] += 1
+            backend_image.data[:] = reference_image.data
+        if list( backend_image.get_block( x, y, 0 ) ) != list( reference_image.get_block( x, y, 0 ) ):
+            mismatches['get_block'] += 1
+        if decode_block( backend, reference_image, x, y ) != decode_block( reference, reference_image, x, y ):
+            mismatches['decode'] += 1
+    return mismatches
+
+if __name__ == '__main__':
+    main()
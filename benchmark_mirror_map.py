@@ -0,0 +1,183 @@
+#!/usr/bin/env python
+# end to end benchmark of mirror_map.py phases on synthetic maps
+
+import contextlib
+import io
+import json
+import os
+import platform
+import random
+import shutil
+import sys
+import tempfile
+import time
+
+import mirror_map
+import save_lua
+import synthetic_map
+
+PHASES = [ 'parse', 'images', 'decals', 'props', 'write', 'save_lua' ]
+
+def main():
+
+    from docopt import docopt
+    doc = '''
+    Usage:
+        {name} [options]
+
+    Options:
+        -h, --help                 Show this screen and exit.
+        --sizes=<list>             Map sizes, 256 up to 4096 [default: 256,512,1024]
+        --versions=<list>          scmap file minor versions [default: {versions}]
+        --axes=<list>              Mirror axes [default: x,y,xy,yx]
+        --keep-side=<1|2>          side=1|2 [default: 1]
+        --props=<n>                Number of props per map [default: 1000]
+        --decals=<n>               Number of decals per map [default: 100]
+        --markers=<n>              Number of mass markers per map [default: 100]
+        --units=<n>                Number of units per map [default: 10]
+        --normal-maps=<n>          Number of normal maps per map [default: 1]
+        --strata-uncompressed      Store strata masks as uncompressed dds
+        --repeat=<n>               Runs per case, fastest run is reported [default: 1]
+        --work-dir=<path>          Keep generated maps here instead of a temporary directory
+        --output=<path>            Write results as JSON
+        --baseline=<path>          Compare results against JSON written by --output
+        --tolerance=<factor>       Slowdown factor counted as regression [default: 1.25]
+        --min-delta=<seconds>      Ignore slowdowns smaller than this [default: 0.05]
+        --verbose                  Show progress messages of mirror_map.py
+    '''.format(name=os.path.basename(sys.argv[0]),versions=','.join(map(str,synthetic_map.SUPPORTED_FILE_VERSIONS_MINOR)))
+    args = docopt(doc, sys.argv[1:])
+
+    sizes = [ int(s) for s in args['--sizes'].split(',') ]
+    versions = [ int(v) for v in args['--versions'].split(',') ]
+    axes = args['--axes'].split(',')
+    map_options = {
+        'props_count': int(args['--props']),
+        'decals_count': int(args['--decals']),
+        'markers_count': int(args['--markers']),
+        'units_count': int(args['--units']),
+        'normal_maps_count': int(args['--normal-maps']),
+        'strata_uncompressed': args['--strata-uncompressed'],
+    }
+    for axis in axes:
+        if axis not in mirror_map.MIRROR_AXES:
+            raise Exception("Unknown mirror axis {}".format(axis))
+
+    work_directory = args['--work-dir'] or tempfile.mkdtemp( prefix='benchmark_mirror_map_' )
+    try:
+        results = run_benchmarks( work_directory, sizes, versions, axes, int(args['--keep-side']),
+            map_options, int(args['--repeat']), args['--verbose'] )
+    finally:
+        if not args['--work-dir']:
+            shutil.rmtree( work_directory, ignore_errors=True )
+
+    report = {
+        'python': platform.python_version(),
+        'platform': platform.platform(),
+        'options': dict( map_options, sizes=sizes, versions=versions, axes=axes, keep_side=int(args['--keep-side']) ),
+        'results': results,
+    }
+    if args['--output']:
+        with open( args['--output'], 'w' ) as output:
+            json.dump( report, output, indent=2 )
+
+    if args['--baseline']:
+        with open( args['--baseline'] ) as baseline:
+            regressions = compare_results( json.load( baseline )['results'], results,
+                float(args['--tolerance']), float(args['--min-delta']) )
+        if regressions:
+            print("{} regressions".format(len(regressions)))
+            sys.exit( 1 )
+
+def run_benchmarks( work_directory, sizes, versions, axes, keep_side, map_options, repeat, verbose ):
+    results = {}
+    path_to_env_scd = os.path.join( work_directory, 'gamedata_d{}'.format(map_options['decals_count']), 'env.scd' )
+    if not os.path.exists( path_to_env_scd ):
+        synthetic_map.generate_env_scd( random.Random( 0 ), path_to_env_scd, map_options['decals_count'] )
+    print("{: <20} {}".format( 'case', ' '.join( '{: >9}'.format( phase ) for phase in PHASES + ['total'] ) ))
+    for size in sizes:
+        for file_version_minor in versions:
+            path_to_scmap = synthetic_scmap( work_directory, size, file_version_minor, map_options )
+            for axis in axes:
+                case = 'v{}_{}_{}'.format( file_version_minor, size, axis )
+                timings = None
+                for _ in range( repeat ):
+                    run_timings = benchmark_map( path_to_scmap, path_to_env_scd, work_directory, axis, keep_side, verbose )
+                    if timings is None:
+                        timings = run_timings
+                    else:
+                        timings = { phase: min( timings[phase], run_timings[phase] ) for phase in timings }
+                results[case] = timings
+                print("{: <20} {}".format( case, ' '.join( '{: >9.3f}'.format( timings[phase] ) for phase in PHASES + ['total'] ) ))
+    return results
+
+# generated maps are kept in the work directory, building big ones takes a while
+def synthetic_scmap( work_directory, size, file_version_minor, map_options ):
+    name = 'synthetic_v{}_{}_p{props_count}_d{decals_count}_m{markers_count}_u{units_count}_n{normal_maps_count}{}'.format(
+        file_version_minor, size, '_u' if map_options['strata_uncompressed'] else '', **map_options )
+    path_to_scmap = os.path.join( work_directory, 'maps', '{}.scmap'.format( name ) )
+    if not os.path.exists( path_to_scmap ):
+        synthetic_map.write_synthetic_map( os.path.dirname( path_to_scmap ), name, size, file_version_minor,
+            seed=size*100+file_version_minor, **map_options )
+    return path_to_scmap
+
+def benchmark_map( path_to_scmap, path_to_env_scd, work_directory, mirror_axis, keep_side, verbose ):
+    timings = {}
+    scmap_name = os.path.splitext( os.path.basename( path_to_scmap ) )[0]
+    path_to_save_lua = os.path.join( os.path.dirname( path_to_scmap ), '{}_save.lua'.format( scmap_name ) )
+    # mirrored decals are reused if they exist, so every run needs an empty output directory
+    new_map_directory = tempfile.mkdtemp( prefix='out_', dir=work_directory )
+    path_to_new_scmap = os.path.join( new_map_directory, 'mirrored.scmap' )
+
+    messages = io.StringIO()
+    try:
+        with contextlib.redirect_stdout( sys.stdout if verbose else messages ):
+            start = time.perf_counter()
+            map_infos = mirror_map.read_map_infos( path_to_scmap )
+            timings['parse'] = time.perf_counter() - start
+
+            images_start = time.perf_counter()
+            images = map_infos['images']
+            for name in images:
+                start = time.perf_counter()
+                mirror_map.mirror_scmap_image( name, images[name], mirror_axis, keep_side )
+                timings['image/{}'.format(name)] = time.perf_counter() - start
+            timings['images'] = time.perf_counter() - images_start
+
+            start = time.perf_counter()
+            mirror_map.mirror_decals( map_infos, mirror_axis, path_to_env_scd, new_map_directory, '/maps/mirrored' )
+            timings['decals'] = time.perf_counter() - start
+
+            start = time.perf_counter()
+            mirror_map.mirror_props( map_infos, mirror_axis )
+            timings['props'] = time.perf_counter() - start
+
+            start = time.perf_counter()
+            mirror_map.write_output_scmap( path_to_scmap, path_to_new_scmap, map_infos )
+            timings['write'] = time.perf_counter() - start
+
+            start = time.perf_counter()
+            scenario = mirror_map.mirror_stuff_in_save_lua( path_to_save_lua, None, map_infos, mirror_axis, mirror_map.mirror_position3 )
+            save_lua.dumps( scenario )
+            timings['save_lua'] = time.perf_counter() - start
+    finally:
+        shutil.rmtree( new_map_directory, ignore_errors=True )
+
+    timings['total'] = sum( timings[phase] for phase in PHASES )
+    return timings
+
+def compare_results( baseline, results, tolerance, min_delta ):
+    regressions = []
+    for case in sorted( results ):
+        if case not in baseline:
+            continue
+        for phase in sorted( results[case] ):
+            if phase not in baseline[case]:
+                continue
+            old, new = baseline[case][phase], results[case][phase]
+            if new > old * tolerance and new - old > min_delta:
+                regressions.append( ( case, phase, old, new ) )
+                print("Regression {} {}: {:.3f}s -> {:.3f}s".format( case, phase, old, new ))
+    return regressions
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,60 @@
+#!/usr/bin/env python
+# leveled events, rate limited progress and counters in place of prints,
+# printed like before and handed to callbacks as dicts
+
+import json
+import time
+
+LEVELS = { 'debug': 10, 'info': 20, 'warning': 30, 'error': 40, 'quiet': 100 }
+
+# least seconds between two progress events of the same name, first and last always get through
+PROGRESS_INTERVAL = 0.5
+
+class EventReporter( object ):
+    def __init__( self, level='info', printing=True ):
+        self.reset( level, printing )
+    # forget callbacks and counters of an earlier run
+    def reset( self, level='info', printing=True ):
+        if level not in LEVELS:
+            raise Exception("Unknown event level {}, use one of {}".format(level, ', '.join(LEVELS)))
+        self.level = LEVELS[level]
+        self.printing = printing
+        self.callbacks = []
+        self.counters = {}
+        self.progress_times = {}
+    def subscribe( self, callback ):
+        self.callbacks.append( callback )
+        return callback
+    def unsubscribe( self, callback ):
+        self.callbacks.remove( callback )
+    # every event gets counted by name, only those at or above the level get printed and passed on
+    def emit( self, level, name, message, **fields ):
+        self.counters[name] = self.counters.get( name, 0 ) + 1
+        if LEVELS[level] < self.level:
+            return
+        if self.printing:
+            print("Warning: {}".format(message) if level == 'warning' else "Error: {}".format(message) if level == 'error' else message)
+        if self.callbacks:
+            event = dict( fields, level=level, event=name, message=message, time=time.time() )
+            for callback in self.callbacks:
+                callback( event )
+    def debug( self, name, message, **fields ):
+        self.emit( 'debug', name, message, **fields )
+    def info( self, name, message, **fields ):
+        self.emit( 'info', name, message, **fields )
+    def warning( self, name, message, **fields ):
+        self.emit( 'warning', name, message, **fields )
+    def error( self, name, message, **fields ):
+        self.emit( 'error', name, message, **fields )
+    def progress( self, name, done, total, message ):
+        now = time.perf_counter()
+        if 1 < done < total and now - self.progress_times.get( name, 0 ) < PROGRESS_INTERVAL:
+            return
+        self.progress_times[name] = now
+        self.emit( 'info', name, "{} {}/{}".format( message, done, total ), done=done, total=total )
+
+# callback writing every event as a JSON line to an open text file
+def json_lines_writer( events_file ):
+    def write_event( event ):
+        events_file.write( json.dumps( event, default=str ) + '\n' )
+    return write_event
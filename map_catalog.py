@@ -0,0 +1,187 @@
+#!/usr/bin/env python
+# SQLite catalog of scmap files with their size, version, prop and decal counts, decal textures
+# and section hashes, re-scans only parse files whose size or mtime changed
+
+from concurrent.futures import ProcessPoolExecutor
+import hashlib
+import mmap
+import os
+import sqlite3
+import sys
+from read_scmap import read_scmap
+
+CATALOG_SCHEMA = '''
+CREATE TABLE IF NOT EXISTS maps (
+    path TEXT PRIMARY KEY,
+    file_size INTEGER NOT NULL,
+    mtime_ns INTEGER NOT NULL,
+    version INTEGER,
+    width INTEGER,
+    height INTEGER,
+    props_count INTEGER,
+    decals_count INTEGER,
+    error TEXT
+);
+CREATE TABLE IF NOT EXISTS decal_textures (
+    path TEXT NOT NULL,
+    texture TEXT NOT NULL,
+    decals_count INTEGER NOT NULL,
+    PRIMARY KEY ( path, texture )
+);
+CREATE INDEX IF NOT EXISTS decal_textures_by_texture ON decal_textures ( texture );
+CREATE TABLE IF NOT EXISTS sections (
+    path TEXT NOT NULL,
+    name TEXT NOT NULL,
+    start_offset INTEGER NOT NULL,
+    end_offset INTEGER NOT NULL,
+    sha256 TEXT NOT NULL,
+    PRIMARY KEY ( path, name )
+);
+'''
+
+# maps parsed per task sent to a worker process
+INDEX_CHUNK_SIZE = 8
+# results written per transaction
+COMMIT_INTERVAL = 256
+
+def main():
+
+    from docopt import docopt
+    doc = '''
+    Usage:
+        {name} <catalog> <directory>... [--workers=<n>]
+
+    Options:
+        -h, --help     Show this screen and exit.
+        --workers=<n>  Processes parsing maps, 0 for one per CPU [default: 0]
+
+    Every .scmap below the directories gets parsed into the SQLite file <catalog>,
+    unchanged files are skipped and removed ones dropped from the catalog.
+    '''.format(name=os.path.basename(sys.argv[0]))
+    args = docopt(doc)
+
+    stats = update_catalog( args['<catalog>'], args['<directory>'], int(args['--workers']) or os.cpu_count() or 1 )
+    print("{indexed} maps indexed, {unchanged} unchanged, {failed} failed, {removed} removed".format(**stats))
+
+def open_catalog( catalog_path ):
+    catalog = sqlite3.connect( catalog_path )
+    catalog.executescript( CATALOG_SCHEMA )
+    return catalog
+
+# absolute path, size and mtime of every scmap below the directories
+def scan_directories( directories ):
+    for directory in directories:
+        for root, dirnames, filenames in os.walk( directory ):
+            dirnames.sort()
+            for filename in sorted( filenames ):
+                if filename.lower().endswith( '.scmap' ):
+                    path = os.path.abspath( os.path.join( root, filename ) )
+                    stat = os.stat( path )
+                    yield path, stat.st_size, stat.st_mtime_ns
+
+def section_ranges( infos ):
+    offsets = infos['offsets']
+    ranges = [ ( name, offsets['{}_start'.format(name)], offsets['{}_end'.format(name)] ) for name in infos['images'] ]
+    ranges.append( ( 'decals', offsets['decals_start'], offsets['decals_end'] ) )
+    ranges.append( ( 'props', infos['propsBlockStartOffset'], None ) )
+    return ranges
+
+# catalog row of one map, images are skipped while parsing and only get hashed
+# straight from the mmap'd file
+def index_map( path ):
+    try:
+        infos = read_scmap( path, lazy_images=True )
+        textures = {}
+        for decal in infos['decals']:
+            for texture in decal[3:5]:
+                if texture:
+                    texture = bytes(texture).decode( errors='replace' )
+                    textures[texture] = textures.get( texture, 0 ) + 1
+        sections = []
+        with open( path, 'rb' ) as scmap:
+            with mmap.mmap( scmap.fileno(), 0, access=mmap.ACCESS_READ ) as mapped:
+                with memoryview( mapped ) as view:
+                    for name, start_offset, end_offset in section_ranges( infos ):
+                        end_offset = len(view) if end_offset is None else end_offset
+                        with view[start_offset:end_offset] as section:
+                            sections.append( ( name, start_offset, end_offset, hashlib.sha256( section ).hexdigest() ) )
+        return {
+            'version': infos['version'],
+            'width': infos['map_size'][0],
+            'height': infos['map_size'][1],
+            'props_count': len( infos['props'] ),
+            'decals_count': len( infos['decals'] ),
+            'textures': textures,
+            'sections': sections,
+            'error': None,
+        }
+    except Exception as e:
+        return { 'error': '{}: {}'.format( type(e).__name__, e ) }
+
+def index_maps( paths ):
+    return [ index_map( path ) for path in paths ]
+
+def store_map( catalog, path, file_size, mtime_ns, row ):
+    catalog.execute( 'DELETE FROM decal_textures WHERE path = ?', ( path, ) )
+    catalog.execute( 'DELETE FROM sections WHERE path = ?', ( path, ) )
+    catalog.execute( 'INSERT OR REPLACE INTO maps VALUES ( ?, ?, ?, ?, ?, ?, ?, ?, ? )', (
+        path, file_size, mtime_ns, row.get('version'), row.get('width'), row.get('height'),
+        row.get('props_count'), row.get('decals_count'), row['error'] ) )
+    catalog.executemany( 'INSERT INTO decal_textures VALUES ( ?, ?, ? )',
+        [ ( path, texture, count ) for texture, count in row.get( 'textures', {} ).items() ] )
+    catalog.executemany( 'INSERT INTO sections VALUES ( ?, ?, ?, ?, ? )',
+        [ ( path, ) + section for section in row.get( 'sections', [] ) ] )
+
+def remove_map( catalog, path ):
+    for table in ( 'maps', 'decal_textures', 'sections' ):
+        catalog.execute( 'DELETE FROM {} WHERE path = ?'.format(table), ( path, ) )
+
+# bring the catalog up to date with the scmaps below directories
+def update_catalog( catalog_path, directories, workers=1 ):
+    catalog = open_catalog( catalog_path )
+    known = { path: ( file_size, mtime_ns ) for path, file_size, mtime_ns in catalog.execute( 'SELECT path, file_size, mtime_ns FROM maps' ) }
+    stats = { 'indexed': 0, 'unchanged': 0, 'failed': 0, 'removed': 0 }
+    found = set()
+    changed = []
+    for path, file_size, mtime_ns in scan_directories( directories ):
+        found.add( path )
+        if known.get( path ) == ( file_size, mtime_ns ):
+            stats['unchanged'] += 1
+        else:
+            changed.append( ( path, file_size, mtime_ns ) )
+
+    roots = [ os.path.join( os.path.abspath( directory ), '' ) for directory in directories ]
+    for path in known:
+        if path not in found and any( path.startswith( root ) for root in roots ):
+            remove_map( catalog, path )
+            stats['removed'] += 1
+
+    chunks = [ changed[i:i+INDEX_CHUNK_SIZE] for i in range( 0, len(changed), INDEX_CHUNK_SIZE ) ]
+    if workers > 1 and len(chunks) > 1:
+        executor = ProcessPoolExecutor( max_workers=workers )
+        results = executor.map( index_maps, [ [ path for path, _, _ in chunk ] for chunk in chunks ] )
+    else:
+        executor = None
+        results = ( index_maps( [ path for path, _, _ in chunk ] ) for chunk in chunks )
+    try:
+        stored = 0
+        for chunk, rows in zip( chunks, results ):
+            for ( path, file_size, mtime_ns ), row in zip( chunk, rows ):
+                store_map( catalog, path, file_size, mtime_ns, row )
+                if row['error']:
+                    print("Warning: couldn't index {}: {}".format(path, row['error']))
+                    stats['failed'] += 1
+                else:
+                    stats['indexed'] += 1
+                stored += 1
+                if stored % COMMIT_INTERVAL == 0:
+                    catalog.commit()
+    finally:
+        if executor:
+            executor.shutdown()
+        catalog.commit()
+        catalog.close()
+    return stats
+
+if __name__ == '__main__':
+    main()
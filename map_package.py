@@ -0,0 +1,99 @@
+#!/usr/bin/env python
+# map packages are zip files holding <name>/<name>.scmap, <name>/<name>_save.lua and the decals,
+# paths like vault/package.zip/name/name.scmap point into them
+
+from contextlib import contextmanager
+import io
+import os
+import time
+from zipfile import ZipFile, ZipInfo, is_zipfile, ZIP_DEFLATED, ZIP_STORED
+
+# ( archive path, member name ) for paths into a zip file, None for anything else
+def split_package_path( path ):
+    if os.path.exists( path ):
+        return None
+    archive_path, names = path, []
+    while archive_path and not os.path.exists( archive_path ):
+        archive_path, name = os.path.split( archive_path )
+        if not name:
+            return None
+        names.insert( 0, name )
+    if names and os.path.isfile( archive_path ) and is_zipfile( archive_path ):
+        return archive_path, '/'.join( names )
+    return None
+
+# ( archive path, member name ) for output paths with a .zip component which isn't a directory,
+# the archive doesn't need to exist yet
+def split_output_package_path( path ):
+    archive_path, names = path, []
+    package = None
+    while archive_path:
+        if names and archive_path.lower().endswith( '.zip' ) and not os.path.isdir( archive_path ):
+            package = archive_path, '/'.join( names )
+        archive_path, name = os.path.split( archive_path )
+        if not name:
+            break
+        names.insert( 0, name )
+    return package
+
+def map_file_exists( path ):
+    package = split_package_path( path )
+    if package is None:
+        return os.path.exists( path )
+    archive_path, member = package
+    with ZipFile( archive_path ) as archive:
+        return member in archive.NameToInfo
+
+# the path as it is for files, a seekable stream of the member for paths into packages,
+# which read_scmap() and write_output_scmap() take as well without extracting anything
+@contextmanager
+def map_source( path ):
+    package = split_package_path( path )
+    if package is None:
+        yield path
+        return
+    archive_path, member = package
+    with ZipFile( archive_path ) as archive:
+        with archive.open( member ) as member_file:
+            yield member_file
+
+def read_map_text( path ):
+    with map_source( path ) as source:
+        if isinstance( source, str ):
+            with open( source, 'r' ) as text_file:
+                return text_file.read()
+        with io.TextIOWrapper( source ) as text_file:
+            return text_file.read()
+
+# zip package written member by member while mirroring, paths below archive_path name the members,
+# which get deflated unless they are stored
+class MapPackageWriter( object ):
+    def __init__( self, archive_path ):
+        if os.path.dirname( archive_path ):
+            os.makedirs( os.path.dirname( archive_path ), exist_ok=True )
+        self.archive_path = archive_path
+        self.archive = ZipFile( archive_path, 'w', ZIP_DEFLATED )
+    def __enter__( self ):
+        return self
+    def __exit__( self, *exc_info ):
+        self.close()
+    def close( self ):
+        self.archive.close()
+    def member_name( self, path ):
+        member = os.path.relpath( path, self.archive_path )
+        if member.startswith( os.pardir ):
+            raise Exception("{} is not inside of package {}".format(path, self.archive_path))
+        return member.replace( os.sep, '/' )
+    def member_info( self, path, stored ):
+        info = ZipInfo( self.member_name( path ), date_time=time.localtime()[:6] )
+        info.compress_type = ZIP_STORED if stored else ZIP_DEFLATED
+        info.external_attr = 0o644 << 16
+        return info
+    def contains( self, path ):
+        return self.member_name( path ) in self.archive.NameToInfo
+    # writable binary stream of a new member, its size isn't known up front
+    # so it may grow past 4 GiB
+    def open( self, path, stored=False ):
+        return self.archive.open( self.member_info( path, stored ), 'w', force_zip64=True )
+    def write( self, path, data, stored=False ):
+        self.archive.writestr( self.member_info( path, stored ), data )
@@ -7,8 +7,7 @@ SET OUTFILE=F:\Maps\2v2 sand box.v0001 - mirror\2v2 sand box.scmap
 SET OUT_VERSION=v0001
 SET MIRROR="xy"
 
-: Install lupa and docopt
-"%PYTHON%\Scripts\pip.exe" install "https://github.com/FAForever/python-wheels/releases/download/1.0.2/lupa-1.3-cp35-cp35m-win32.whl"
+: Install docopt
 "%PYTHON%\Scripts\pip.exe" install docopt
 
 : Run mirror script
@@ -17,17 +16,37 @@ SET MIRROR="xy"
 : Help text of mirror script
 :   Usage:
 :      {name} <infile> <outfile> --supcom-gamedata=<path> --mirror-axis=<axis> [options]
+:      {name} --serve [--socket=<path>]
 :
 :   Options:
 :       -h, --help                 Show this screen and exit.
-:       --mirror-axis=<axis>       axis=x|y|xy|yx
+:       --mirror-axis=<axis>       axis=x|y|xy|yx, rot2 for 180 degree and rot4 for 4-fold rotation
 :       --imagemagick=<path>       [default: /usr/bin/convert]
 :       --supcom-gamedata=<path>   Directory containing env.scd
 :       --keep-side=<1|2>          side=1|2 [default: 1]
 :       --map-version=v<n>         [default: v0001]
 :       --not-mirror-scmap-images  Don't mirror images saved in scmap
+:       --render-preview           Render preview from the mirrored heightmap instead of mirroring it
+:       --decal-workers=<n>        Processes mirroring decal textures, 0 for one per CPU [default: 0]
+:       --not-cull-mirror-side     Don't remove props, decals, units and markers on mirror side
+:       --dedup-tolerance=<units>  Drop mirrored copies closer than this to an entity of the same
+:                                  blueprint or type, 0 keeps all of them [default: 0.5]
 :       --debug-read-scmap         Debug scmap parsing
 :       --debug-decals-position    Debug decal fun
 :       --dump-scmap-images        Dump images saved in scmap
+:       --streaming                Load, mirror and write embedded images one at a time,
+:                                  heightmap and other gray images in tiles of rows
+:       --memory-budget=<MiB>      Use --streaming if mirroring all images at once needs more memory
+:       --cache-dir=<path>         Reuse mirrored images of unchanged scmap sections from earlier runs
+:       --log-level=<level>        Print events from level=debug|info|warning|error|quiet on [default: info]
+:       --events=<path>            Write every event from --log-level on as a JSON line
+:       --profile=<path>           Write wall time, cpu time and peak memory per phase as JSON
+:       --cprofile=<path>          Dump cProfile statistics of the whole run
+:       --serve                    Keep running and take jobs as JSON lines from --socket or stdin,
+:                                  see mirror_server.py and mirror_client.py
+:       --socket=<path>            Unix socket to wait for jobs on
+:
+:   <infile> and <outfile> can point into zip packages like vault/theta.zip/theta/theta.scmap,
+:   a package <outfile> gets the scmap, _save.lua and mirrored decals written straight into it.
 
 pause
@@ -0,0 +1,36 @@
+#!/usr/bin/env python
+# sends one job to mirror_map.py --serve --socket=<path> and prints its output
+
+import json
+import os
+import socket
+import sys
+
+def main():
+
+    from docopt import docopt
+    doc = '''
+    Usage:
+        {name} <socket> <mirror_map_args>...
+
+    Every argument after <socket> goes to mirror_map.py as is, relative paths are
+    taken from the current directory.
+    '''.format(name=os.path.basename(sys.argv[0]))
+    args = docopt(doc, sys.argv[1:], options_first=True)
+
+    response = send_job( args['<socket>'], args['<mirror_map_args>'] )
+    sys.stdout.write( response.get( 'output', '' ) )
+    if response['status'] != 'ok':
+        print( response.get( 'traceback' ) or response.get( 'error' ), file=sys.stderr )
+        sys.exit( 1 )
+
+def send_job( socket_path, mirror_map_args, cwd=None ):
+    job = { 'cwd': cwd or os.getcwd(), 'args': mirror_map_args }
+    with socket.socket( socket.AF_UNIX, socket.SOCK_STREAM ) as connection:
+        connection.connect( socket_path )
+        connection.sendall( ( json.dumps( job ) + '\n' ).encode() )
+        with connection.makefile( 'r' ) as responses:
+            return json.loads( responses.readline() )
+
+if __name__ == '__main__':
+    main()
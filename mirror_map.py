@@ -1,450 +1,1075 @@
 #!/usr/bin/python
 # created using python 3.6
 
-import copy
+from collections import namedtuple
+from concurrent.futures import ProcessPoolExecutor
+from contextlib import contextmanager
+import errno
 from functools import partial
+import io
 import math
 import os
-import re
-from struct import pack, unpack
+from struct import pack, unpack, Struct
 import subprocess
 import sys
 import tempfile
+import threading
 from zipfile import ZipFile
-from read_scmap import read_scmap, EmbeddedScMapGrayImage, EmbeddedScMapDDSImage
+from read_scmap import read_scmap, open_scmap, EmbeddedScMapGrayImage, EmbeddedScMapDDSImage, LazyEmbeddedImage
+from phase_profiler import PhaseProfiler
+from event_reporter import EventReporter, json_lines_writer
+from section_cache import SectionCache
+from map_package import map_file_exists, map_source, read_map_text, split_output_package_path, MapPackageWriter
+from mirror_transform import mirror_transform, symmetry_targets, unknown_mirror_axis, ROTATION_MODES, SYMMETRY_COPIES
+from preview_render import downsample_heights, render_preview, uncompressed_dds
+import save_lua
+import spatial_index
 
-def main():
+MIRROR_AXES = [ 'x', 'y', 'xy', 'yx', 'rot2', 'rot4' ]
+
+# enabled by --profile
+profiler = PhaseProfiler()
+# progress, warnings and per item events, prints at info level unless configured otherwise
+reporter = EventReporter()
+
+def main( argv=None ):
 
     from docopt import docopt
     doc = '''
     Usage:
         {name} <infile> <outfile> --supcom-gamedata=<path> --mirror-axis=<axis> [options]
+        {name} --serve [--socket=<path>]
 
     Options:
         -h, --help                 Show this screen and exit.
-        --mirror-axis=<axis>       axis=x|y|xy|yx
+        --mirror-axis=<axis>       axis=x|y|xy|yx, rot2 for 180 degree and rot4 for 4-fold rotation
         --imagemagick=<path>       [default: /usr/bin/convert]
         --supcom-gamedata=<path>   Directory containing env.scd
         --keep-side=<1|2>          side=1|2 [default: 1]
         --map-version=v<n>         [default: v0001]
         --not-mirror-scmap-images  Don't mirror images saved in scmap
+        --render-preview           Render preview from the mirrored heightmap instead of mirroring it
         --not-mirror-decals        Don't mirror decals
+        --decal-workers=<n>        Processes mirroring decal textures, 0 for one per CPU [default: 0]
         --not-mirror-props         Don't mirror props
+        --not-cull-mirror-side     Don't remove props, decals, units and markers on mirror side
+        --dedup-tolerance=<units>  Drop mirrored copies closer than this to an entity of the same
+                                   blueprint or type, 0 keeps all of them [default: 0.5]
         --debug-read-scmap         Debug scmap parsing
         --debug-decals-position    Debug decal fun
         --dump-scmap-images        Dump images saved in scmap
+        --streaming                Load, mirror and write embedded images one at a time,
+                                   heightmap and other gray images in tiles of rows
+        --memory-budget=<MiB>      Use --streaming if mirroring all images at once needs more memory
+        --cache-dir=<path>         Reuse mirrored images of unchanged scmap sections from earlier runs
+        --log-level=<level>        Print events from level=debug|info|warning|error|quiet on [default: info]
+        --events=<path>            Write every event from --log-level on as a JSON line
+        --profile=<path>           Write wall time, cpu time and peak memory per phase as JSON
+        --cprofile=<path>          Dump cProfile statistics of the whole run
+        --serve                    Keep running and take jobs as JSON lines from --socket or stdin,
+                                   see mirror_server.py and mirror_client.py
+        --socket=<path>            Unix socket to wait for jobs on
+
+    <infile> and <outfile> can point into zip packages like vault/theta.zip/theta/theta.scmap,
+    a package <outfile> gets the scmap, _save.lua and mirrored decals written straight into it.
     '''.format(name=os.path.basename(sys.argv[0]))
-    args = docopt(doc, sys.argv[1:])
+    args = docopt(doc, sys.argv[1:] if argv is None else argv)
 
-    path_to_infile_scmap = args['<infile>']
-    old_scmap_name, oldScmapExtension = os.path.splitext(os.path.basename(  path_to_infile_scmap ))
-    path_to_infile_scmap_save_lua = os.path.join( os.path.dirname(  path_to_infile_scmap ), "{}_save.lua".format(old_scmap_name) )
+    if args['--serve']:
+        import mirror_server
+        mirror_server.serve( main, args['--socket'] )
+        return
 
-    path_to_new_scmap = args['<outfile>']
-    new_scmap_name, newScmapExtension = os.path.splitext(os.path.basename(  path_to_new_scmap ))
-    new_map_directory = os.path.dirname( path_to_new_scmap )
-    if args['--map-version']:
-        decals_path_prefix = '/maps/{}.{}'.format( new_scmap_name, args['--map-version'] )
-    else:
-        decals_path_prefix = '/maps/{}'.format( new_scmap_name )
-    path_to_new_scmap_save_lua = os.path.join( os.path.dirname(  path_to_new_scmap ), "{}_save.lua".format(new_scmap_name) )
-
-    mirror_axis = args['--mirror-axis']
-    mirror_keep_side = int(args['--keep-side'])
-    ImageMagicConvert = args['--imagemagick']
-    decals_archivePath = '{}/env.scd'.format(args['--supcom-gamedata'])
-    mirror_scmap_images = not args['--not-mirror-scmap-images']
-    do_mirror_decals = not args['--not-mirror-decals']
-    do_mirror_props = not args['--not-mirror-props']
-    debug_read_scmap = args['--debug-read-scmap']
-    debug_decals_position = args['--debug-decals-position']
-    dump_scmap_images = args['--dump-scmap-images']
-
-    map_infos = read_scmap( path_to_infile_scmap, debug_print_enabled=debug_read_scmap )
+    mirrorer = Mirrorer(
+        args['--mirror-axis'],
+        keep_side=int(args['--keep-side']),
+        supcom_gamedata=args['--supcom-gamedata'],
+        map_version=args['--map-version'],
+        mirror_images=not args['--not-mirror-scmap-images'],
+        render_preview=args['--render-preview'],
+        mirror_decals=not args['--not-mirror-decals'],
+        mirror_props=not args['--not-mirror-props'],
+        cull_mirror_side=not args['--not-cull-mirror-side'],
+        dedup_tolerance=float(args['--dedup-tolerance']),
+        decal_workers=int(args['--decal-workers']) or os.cpu_count() or 1,
+        streaming=args['--streaming'],
+        memory_budget=int(args['--memory-budget'])*1024*1024 if args['--memory-budget'] else None,
+        cache_dir=args['--cache-dir'],
+        imagemagick=args['--imagemagick'],
+        dump_images=args['--dump-scmap-images'],
+        debug_read_scmap=args['--debug-read-scmap'],
+        debug_decals_position=args['--debug-decals-position'],
+    )
+
+    reporter.reset( args['--log-level'] )
+    profiler.reset( bool(args['--profile']) )
+    cprofiler = None
+    if args['--cprofile']:
+        import cProfile
+        cprofiler = cProfile.Profile()
+
+    # with --serve jobs run one after another in this process, a failed one must not
+    # leave profiling running or its event level and callbacks set for the next one
+    try:
+        profiler.start()
+        if cprofiler:
+            cprofiler.enable()
+        if args['--events']:
+            with open( args['--events'], 'w' ) as events_file:
+                reporter.subscribe( json_lines_writer( events_file ) )
+                mirrorer.mirror_file( args['<infile>'], args['<outfile>'] )
+        else:
+            mirrorer.mirror_file( args['<infile>'], args['<outfile>'] )
+    finally:
+        if cprofiler:
+            cprofiler.disable()
+        profiler.stop()
+        reporter.reset()
+
+    if cprofiler:
+        cprofiler.dump_stats( args['--cprofile'] )
+    if args['--profile']:
+        profiler.write_report( args['--profile'] )
+
+# everything main() does, configured once and reusable for any number of maps
+class Mirrorer( object ):
+    def __init__( self, mirror_axis, keep_side=1, supcom_gamedata=None, map_version='v0001',
+            mirror_images=True, render_preview=False, mirror_decals=True, mirror_props=True, cull_mirror_side=True,
+            dedup_tolerance=0.5, decal_workers=1, streaming=False, memory_budget=None, cache_dir=None,
+            imagemagick='/usr/bin/convert', dump_images=False, debug_read_scmap=False, debug_decals_position=False ):
+        if mirror_axis not in MIRROR_AXES:
+            raise unknown_mirror_axis( mirror_axis, MIRROR_AXES )
+        self.mirror_axis = mirror_axis
+        self.keep_side = keep_side
+        # env.scd holds the decal textures which get mirrored
+        self.decals_archivePath = '{}/env.scd'.format(supcom_gamedata) if supcom_gamedata else None
+        self.map_version = map_version
+        self.mirror_images = mirror_images
+        self.render_preview = render_preview
+        self.mirror_decals = mirror_decals
+        self.mirror_props = mirror_props
+        self.cull_mirror_side = cull_mirror_side
+        self.dedup_tolerance = dedup_tolerance
+        self.decal_workers = decal_workers
+        # cached sections get spliced in while writing
+        self.streaming = streaming or bool(cache_dir)
+        self.memory_budget = memory_budget
+        self.cache_dir = cache_dir
+        self.imagemagick = imagemagick
+        self.dump_images = dump_images
+        self.debug_read_scmap = debug_read_scmap
+        self.debug_decals_position = debug_decals_position
+
+    def decals_path_prefix( self, new_scmap_name ):
+        if self.map_version:
+            return '/maps/{}.{}'.format( new_scmap_name, self.map_version )
+        return '/maps/{}'.format( new_scmap_name )
+
+    def check_map( self, map_infos ):
+        if self.mirror_axis == 'rot4' and map_infos['map_size'][0] != map_infos['map_size'][1]:
+            raise Exception("4-fold rotation needs a square map, got {}x{}".format(*map_infos['map_size']))
+
+    # from the heightmap as it is in the input, mirrored like the heightmap gets mirrored
+    def rendered_preview( self, map_infos ):
+        reporter.info( 'preview', "Rendering preview" )
+        with profiler.phase('preview'):
+            return render_map_preview( map_infos, self.mirror_axis if self.mirror_images else None, self.keep_side )
+
+    def mirror_loaded_images( self, map_infos, new_map_directory, new_scmap_name ):
+        images = map_infos['images']
+        preview = self.rendered_preview( map_infos ) if self.render_preview else None
+        if self.mirror_images:
+            with profiler.phase('images'):
+                for done, name in enumerate( images, 1 ):
+                    reporter.progress( 'images', done, len(images), "Mirroring scmap images" )
+                    if name == 'preview' and preview:
+                        continue
+                    with profiler.phase(name):
+                        mirror_scmap_image( name, images[name], self.mirror_axis, self.keep_side )
+        if preview:
+            images['preview'] = preview
+
+        if self.dump_images:
+            with profiler.phase('dump_images'):
+                dump_images( map_infos['images'], new_map_directory, new_scmap_name, self.imagemagick )
+
+    # mirrored decal textures go to new_map_directory or, below its path, into package
+    def mirror_entities( self, map_infos, new_map_directory, new_scmap_name, package=None ):
+        if self.cull_mirror_side and ( self.mirror_decals or self.mirror_props ):
+            with profiler.phase('cull'):
+                cull_map_entities( map_infos, self.mirror_axis, self.keep_side, self.mirror_props, self.mirror_decals )
+
+        if self.mirror_decals:
+            reporter.info( 'decals', "Mirroring decals" )
+            with profiler.phase('decals'):
+                mirror_decals( map_infos, self.mirror_axis, self.decals_archivePath, new_map_directory, self.decals_path_prefix( new_scmap_name ),
+                    self.debug_decals_position, self.dedup_tolerance, self.decal_workers, package )
+
+        if self.mirror_props:
+            reporter.info( 'props', "Mirroring props" )
+            with profiler.phase('props'):
+                mirror_props( map_infos, self.mirror_axis, self.dedup_tolerance )
+
+        if 'debug_props' in map_infos:
+            map_infos['props'] += map_infos['debug_props']
+
+    def mirror_scenario( self, scenario, map_infos ):
+        return mirror_scenario( scenario, map_infos, self.mirror_axis, mirror_position3,
+            self.keep_side if self.cull_mirror_side else None, self.dedup_tolerance )
+
+    # mirror a map from read_map_infos() with loaded images and its save.lua scenario in place,
+    # mirrored decal textures are written to new_map_directory
+    def mirror( self, map_infos, scenario=None, new_map_directory=None, new_scmap_name='mirrored' ):
+        if self.mirror_decals and new_map_directory is None:
+            raise Exception("Mirroring decals writes textures, new_map_directory is needed")
+        self.check_map( map_infos )
+        self.mirror_loaded_images( map_infos, new_map_directory, new_scmap_name )
+        self.mirror_entities( map_infos, new_map_directory, new_scmap_name )
+        if scenario is not None:
+            with profiler.phase('save_lua'):
+                self.mirror_scenario( scenario, map_infos )
+        return map_infos, scenario
+
+    # mirror a map held in memory, scmap as in read_scmap(), returns the mirrored scmap as bytes
+    # together with the mirrored scenario
+    def mirror_buffer( self, scmap, scenario=None, new_map_directory=None, new_scmap_name='mirrored' ):
+        with profiler.phase('parse'):
+            map_infos = read_map_infos( scmap, self.debug_read_scmap )
+        self.mirror( map_infos, scenario, new_map_directory, new_scmap_name )
+        with profiler.phase('write'):
+            return write_output_scmap( scmap, None, map_infos ), scenario
+
+    # mirror scmap_source as in read_scmap() to path_to_new_scmap, images get loaded
+    # all at once or streamed while writing, with a package the output is a member of it
+    # and images get dumped next to the package
+    def mirror_scmap( self, scmap_source, path_to_new_scmap, new_map_directory, new_scmap_name, package=None ):
+        streaming = self.streaming
+        dump_directory = os.path.dirname( package.archive_path ) if package else new_map_directory
+        memory_budget = self.memory_budget
+
+        with profiler.phase('parse'):
+            map_infos = read_map_infos( scmap_source, self.debug_read_scmap, lazy_images=streaming or memory_budget is not None )
+
+        self.check_map( map_infos )
+
+        if memory_budget is not None:
+            in_memory, streamed = mirror_memory_estimate( map_infos )
+            if not streaming and in_memory > memory_budget:
+                reporter.info( 'streaming', "Mirroring all images at once needs about {} MiB, streaming images".format(in_memory//(1024*1024)), estimate=in_memory )
+                streaming = True
+            if streaming and streamed > memory_budget:
+                reporter.warning( 'memory_budget', "largest image needs about {} MiB which exceeds memory budget".format(streamed//(1024*1024)), estimate=streamed )
+            if not streaming:
+                with profiler.phase('parse'):
+                    load_images( map_infos )
+
+        if not streaming:
+            self.mirror_loaded_images( map_infos, dump_directory, new_scmap_name )
+
+        self.mirror_entities( map_infos, new_map_directory, new_scmap_name, package )
+
+        if streaming and self.render_preview:
+            map_infos['images']['preview'] = self.rendered_preview( map_infos )
+
+        with profiler.phase('write'):
+            if streaming:
+                cache = None
+                if self.cache_dir and self.mirror_images:
+                    cache = SectionCache( self.cache_dir, { 'mirror_axis': self.mirror_axis, 'keep_side': self.keep_side } )
+                image_loader = partial( load_scmap_image, map_infos['images'],
+                    mirror_axis=self.mirror_axis if self.mirror_images else None, mirror_keep_side=self.keep_side,
+                    dump_options=( dump_directory, new_scmap_name, self.imagemagick ) if self.dump_images else None,
+                    cache=cache )
+            else:
+                image_loader = None
+            if package:
+                with package.open( path_to_new_scmap ) as new_scmap:
+                    write_output_scmap( scmap_source, new_scmap, map_infos, image_loader )
+            else:
+                write_output_scmap( scmap_source, path_to_new_scmap, map_infos, image_loader )
+
+        return map_infos
+
+    # mirror <infile>.scmap and <infile>_save.lua to <outfile>.scmap and <outfile>_save.lua,
+    # both may point into zip packages
+    def mirror_file( self, path_to_infile_scmap, path_to_new_scmap ):
+        package_path = split_output_package_path( path_to_new_scmap )
+        if package_path is None:
+            self.mirror_to( path_to_infile_scmap, path_to_new_scmap )
+            return
+        with MapPackageWriter( package_path[0] ) as package:
+            self.mirror_to( path_to_infile_scmap, path_to_new_scmap, package )
+
+    # mirror_file() with the output package open, if there is one
+    def mirror_to( self, path_to_infile_scmap, path_to_new_scmap, package=None ):
+        old_scmap_name, oldScmapExtension = os.path.splitext(os.path.basename(  path_to_infile_scmap ))
+        path_to_infile_scmap_save_lua = os.path.join( os.path.dirname(  path_to_infile_scmap ), "{}_save.lua".format(old_scmap_name) )
+
+        new_scmap_name, newScmapExtension = os.path.splitext(os.path.basename(  path_to_new_scmap ))
+        new_map_directory = os.path.dirname( path_to_new_scmap )
+        path_to_new_scmap_save_lua = os.path.join( os.path.dirname(  path_to_new_scmap ), "{}_save.lua".format(new_scmap_name) )
+
+        with map_source( path_to_infile_scmap ) as scmap_source:
+            map_infos = self.mirror_scmap( scmap_source, path_to_new_scmap, new_map_directory, new_scmap_name, package )
+
+        if map_file_exists(path_to_infile_scmap_save_lua):
+            with profiler.phase('save_lua'):
+                scenario = { 'Scenario': save_lua.loads( read_map_text( path_to_infile_scmap_save_lua ) )['Scenario'] }
+                self.mirror_scenario( scenario, map_infos )
+                if package:
+                    with io.TextIOWrapper( package.open( path_to_new_scmap_save_lua ) ) as newSaveLua:
+                        save_lua.dump( newSaveLua, scenario )
+                else:
+                    with open(path_to_new_scmap_save_lua,'w') as newSaveLua:
+                        save_lua.dump( newSaveLua, scenario )
+        else:
+            reporter.warning( 'save_lua_missing', "{} does not exist.".format(path_to_infile_scmap_save_lua), path=path_to_infile_scmap_save_lua )
+
+def read_map_infos( path_to_infile_scmap, debug_read_scmap=False, lazy_images=False ):
+    map_infos = read_scmap( path_to_infile_scmap, debug_print_enabled=debug_read_scmap, lazy_images=lazy_images )
 
     # ingame positions have width/height + 1
     # e.g. x,y in range (0,0) to (512,512)
     map_infos['ingame_map_size'] = ( map_infos['map_size'][0]+1, map_infos['map_size'][1]+1 )
-
-
-    def filter_constant_pixels( pixel_coord, mirror_axis, keep_side, size ):
-        if keep_side == -1:
-            return False
-        half_width = size[0]/2
-        half_height = size[1]/2
-        m = size[0] / size[1]
-        x,y = pixel_coord
-        if mirror_axis == 'x':
-            if keep_side == 1 and x >= half_width:
-                return False
-            if keep_side == 2 and x < half_width:
-                return False
-        elif mirror_axis == 'y':
-            if keep_side == 1 and y >= half_height:
-                return False
-            if keep_side == 2 and y < half_height:
-                return False
-        elif mirror_axis == 'xy':
-            if keep_side == 1 and x >= y*m:
-                return False
-            if keep_side == 2 and x < y*m:
-                return False
-        elif mirror_axis == 'yx':
-            if keep_side == 1 and x >= ( size[0] - 1 - (y*m) ):
-                return False
-            if keep_side == 2 and x < ( size[0] - 1 - (y*m) ):
-                return False
-        return True
-
-    def get_mirror_position( pixel_coord, mirror_axis, size ):
-        x,y = pixel_coord
-        m = size[0] / size[1]
+    return map_infos
+
+def load_images( map_infos ):
+    images = map_infos['images']
+    for name in images:
+        if isinstance( images[name], LazyEmbeddedImage ):
+            images[name] = images[name].load()
+
+# load one image for streaming output, mirror and dump it on the way,
+# mirrored images of unchanged sections are taken from cache
+def load_scmap_image( images, name, mirror_axis=None, mirror_keep_side=1, dump_options=None, cache=None ):
+    lazy_image = images[name]
+    # already final, e.g. a rendered preview
+    if not isinstance( lazy_image, LazyEmbeddedImage ):
+        if dump_options:
+            dump_images( { name: lazy_image }, *dump_options )
+        return lazy_image
+    if lazy_image.image_class is EmbeddedScMapGrayImage and not cache and not dump_options:
+        return TiledGrayImage( name, lazy_image, mirror_axis, mirror_keep_side )
+    if cache:
+        with profiler.phase('hash'):
+            metadata = cache.metadata( name, lazy_image.scmap_source, lazy_image.offset, lazy_image.length,
+                { 'args': lazy_image.args, 'kwargs': lazy_image.kwargs } )
+            cache_key = cache.key( metadata )
+        data = cache.get( cache_key )
+    if cache and data is not None:
+        reporter.debug( 'image_from_cache', "Using cached scmap image {}".format(name), image=name )
+        image = lazy_image.image_class( data, *lazy_image.args, **lazy_image.kwargs )
+        profiler.count('images_from_cache')
+    else:
+        image = lazy_image.load()
+        if mirror_axis:
+            with profiler.phase(name):
+                mirror_scmap_image( name, image, mirror_axis, mirror_keep_side )
+        if cache:
+            cache.put( cache_key, image.data, metadata )
+    if dump_options:
+        dump_images( { name: image }, *dump_options )
+    return image
+
+# memoryview of the data of a loaded or lazy image
+@contextmanager
+def image_view( image ):
+    if isinstance( image, LazyEmbeddedImage ):
+        with image.view() as section:
+            yield section
+    else:
+        with memoryview( image.data ) as section:
+            yield section
+
+# preview of the map rendered from its heightmap before that gets mirrored, the heights
+# are downsampled to preview size first and mirror_axis mirrors those instead
+def render_map_preview( map_infos, mirror_axis=None, mirror_keep_side=1 ):
+    images = map_infos['images']
+    preview = images['preview']
+    if isinstance( preview, LazyEmbeddedImage ):
+        preview = preview.load()
+    preview_size = preview.size
+    map_width, map_height = map_infos['map_size']
+    with image_view( images['height_map'] ) as section:
+        with section.cast('H') as heights:
+            downsampled = downsample_heights( heights, map_infos['map_size'], preview_size, map_infos['height_scale'] )
+    if mirror_axis:
+        mirror_spans( downsampled, list( downsampled ), preview_size, mirror_axis,
+            keep_side_spans( mirror_axis, mirror_keep_side, preview_size ) )
+    spacing = ( map_width / preview_size[0], map_height / preview_size[1] )
+    pixels = render_preview( downsampled, preview_size, spacing, map_infos['lighting'], map_infos['water'] )
+    return EmbeddedScMapDDSImage( uncompressed_dds( pixels, preview_size ) )
+
+# rows of gray images mirrored and written at once while streaming
+GRAY_TILE_BYTES = 4*1024*1024
+
+# gray image section which gets mirrored and written in tiles of rows, every tile reads its
+# mirror pixels from the mmap'd section, so memory use doesn't grow with the map size
+class TiledGrayImage( object ):
+    def __init__( self, name, lazy_image, mirror_axis=None, mirror_keep_side=1 ):
+        self.name = name
+        self.lazy_image = lazy_image
+        self.mirror_axis = mirror_axis
+        self.mirror_keep_side = mirror_keep_side
+        self.length = lazy_image.length
+    def tiles( self ):
+        size, depth = self.lazy_image.args
+        width, height = size
+        pixel_bytes = int(depth) // 8
+        row_bytes = width * pixel_bytes
+        rows = max( GRAY_TILE_BYTES // max( row_bytes, 1 ), 1 )
+        if self.mirror_axis:
+            reporter.debug( 'image_mirrored', "Mirroring scmap image {} in tiles of {} rows".format(self.name, rows), image=self.name, rows=rows )
+            spans = keep_side_spans( self.mirror_axis, self.mirror_keep_side, size )
+        with self.lazy_image.view() as section:
+            source = section[:height*row_bytes].cast( PIXEL_FORMATS[pixel_bytes] )
+            try:
+                for first_row in range( 0, height, rows ):
+                    tile_rows = min( rows, height - first_row )
+                    # kept pixels are where they were, everything else gets overwritten
+                    tile = bytearray( section[first_row*row_bytes:(first_row+tile_rows)*row_bytes] )
+                    if self.mirror_axis:
+                        with profiler.phase(self.name):
+                            mirror_spans( memoryview(tile).cast( PIXEL_FORMATS[pixel_bytes] ), source,
+                                size, self.mirror_axis, spans, first_row, tile_rows )
+                    yield tile
+                # anything behind the pixels goes along unchanged
+                if len(section) > height*row_bytes:
+                    yield bytes( section[height*row_bytes:] )
+            finally:
+                source.release()
+        if self.mirror_axis:
+            profiler.count('images_mirrored')
+
+# rough peak memory for mirroring an image relative to its size in scmap,
+# normal maps get mirrored uncompressed with 4 instead of 1 byte per pixel
+IMAGE_MEMORY_FACTORS = { 'gray': 3, 'dds': 3, 'normal_map': 10 }
+
+def image_section_size( map_infos, name ):
+    return map_infos['offsets']['{}_end'.format(name)] - map_infos['offsets']['{}_start'.format(name)]
+
+def is_gray_image( image ):
+    if isinstance( image, LazyEmbeddedImage ):
+        return image.image_class is EmbeddedScMapGrayImage
+    return image.extension == 'gray'
+
+def image_memory_estimate( map_infos, name ):
+    image = map_infos['images'][name]
+    is_gray = is_gray_image( image )
+    if isinstance( image, LazyEmbeddedImage ):
+        is_normal_map = image.kwargs.get( 'is_normal_map', False )
+    else:
+        is_normal_map = getattr( image, 'is_normal_map', False )
+    return image_section_size( map_infos, name ) * IMAGE_MEMORY_FACTORS[ 'gray' if is_gray else 'normal_map' if is_normal_map else 'dds' ]
+
+# estimated peak memory of mirroring with all images in memory and of streaming images
+def mirror_memory_estimate( map_infos ):
+    names = list( map_infos['images'] )
+    if not names:
+        return 0, 0
+    sizes = [ image_section_size( map_infos, name ) for name in names ]
+    estimates = [ image_memory_estimate( map_infos, name ) for name in names ]
+    in_memory = sum( sizes ) + max( estimate - size for size, estimate in zip( sizes, estimates ) )
+    # streamed gray images only hold a tile and its copy, unless they go through the cache
+    streamed = [ min( estimate, 2*GRAY_TILE_BYTES ) if is_gray_image( map_infos['images'][name] ) else estimate
+        for name, estimate in zip( names, estimates ) ]
+    return in_memory, max( streamed )
+
+# x range ( start, end ) of pixels kept in every row, computed from the half plane
+# the mirror axis and keep side define, keep side -1 keeps nothing and anything
+# else than 1 or 2 keeps every pixel
+def keep_side_spans( mirror_axis, keep_side, size ):
+    width, height = size
+    if keep_side == -1:
+        return [ ( 0, 0 ) ] * height
+    if keep_side not in ( 1, 2 ) or mirror_axis not in MIRROR_AXES:
+        return [ ( 0, width ) ] * height
+    if mirror_axis in ROTATION_MODES:
+        spans = rotation_keep_spans( mirror_axis, size )
+        # side 2 is side 1 turned by 180 degree
+        return spans if keep_side == 1 else [ ( width-end, width-start ) for start, end in reversed( spans ) ]
+    spans = []
+    m = width / height if height else 0
+    for y in range( height ):
+        # integer x < boundary is the same as x < ceil( boundary )
         if mirror_axis == 'x':
-            return ( size[0] - 1 - x, y )
+            boundary = width/2
         elif mirror_axis == 'y':
-            return ( x, size[1] - 1 - y )
+            boundary = width if y < height/2 else 0
         elif mirror_axis == 'xy':
-            return ( y*m, x/m )
-        elif mirror_axis == 'yx':
-            return ( size[0] - 1 - (y*m), size[1] - 1 - (x/m) )
-
-    def mirror_position3( position, axis, size ):
-        new_position_2d = get_mirror_position( ( position[0], position[2] ), axis, size )
-        return ( new_position_2d[0] , position[1], new_position_2d[1] )
-
-    def get_mirror_pixel_address( pixel_coord, mirror_axis, size ):
-        mirror_pixel = get_mirror_position( pixel_coord, mirror_axis, size )
-        return size[0]*int(mirror_pixel[1]) + int(mirror_pixel[0])
-
-    def mirror_gray_image( image, pixels, keep_pixels, mirror_axis, mirror_keep_side ):
-        image_data = bytearray(image.data)
-        mirror_source_data = bytearray(image_data)
-        depth_bytes = int( int(image.depth) / 8 )
-        for x,y in pixels:
-            pixel_address = ( image.size[0] * y + x ) * depth_bytes
-            mirror_pixel_address = get_mirror_pixel_address( (x,y), mirror_axis, image.size ) * depth_bytes
-            try:
-                image_data[pixel_address:pixel_address+depth_bytes] = image_data[pixel_address:pixel_address+depth_bytes] if (x,y) in keep_pixels else mirror_source_data[mirror_pixel_address:mirror_pixel_address+depth_bytes]
-            except IndexError as e:
-                print("IndexError for pixel {} and mirror pixel {} with image size {} for mirror axis {}".format((x,y), get_mirror_position( (x,y), mirror_axis, image.size ), image.size, mirror_axis))
-                raise e
-            if depth_bytes > 1:
-                image_data[pixel_address+1] = image_data[pixel_address+1] if (x,y) in keep_pixels else mirror_source_data[mirror_pixel_address+1]
-        image.data = image_data
-
-    def mirror_uncompressed_dds_image( image, mirror_axis, mirror_keep_side ):
-        image_data = bytearray(image.data)
-        mirror_source_data = bytearray(image_data)
-        depth_bytes = int( int(image.depth) / 8 )
-        mip_map_size = ( image.size[0], image.size[1] )
-        for mip_map_level in range(max(image.header.mip_map_count,1)):
-            mip_map_info = image.mip_map_infos[mip_map_level]
-            mip_map_size = mip_map_info[1]
-            offset = mip_map_info[0]
-            pixels = [(x,y) for x in range(mip_map_size[0]) for y in range(mip_map_size[1])]
-            keep_pixels = set([ pixel for pixel in pixels if filter_constant_pixels( pixel, mirror_axis, mirror_keep_side, mip_map_size ) ])
-            for x,y in pixels:
-                pixel_address = offset + ( mip_map_size[0] * y + x ) * depth_bytes
-                mirror_pixel_address = offset + get_mirror_pixel_address( (x,y), mirror_axis, mip_map_size ) * depth_bytes
-                try:
-                    image_data[pixel_address:pixel_address+depth_bytes] = image_data[pixel_address:pixel_address+depth_bytes] if (x,y) in keep_pixels else mirror_source_data[mirror_pixel_address:mirror_pixel_address+depth_bytes]
-                    if image.is_normal_map:
-                        normal_component = int(image_data[pixel_address+1])
-                        image_data[pixel_address+1] = int(image_data[pixel_address+3])
-                        image_data[pixel_address+3] = normal_component
-
-                except IndexError as e:
-                    print("IndexError for mip map {} pixel {} and mirror pixel {} with image size {} for mirror axis {}".format(mip_map_level, (x,y), get_mirror_position( (x,y), mirror_axis, mip_map_size ), mip_map_size, mirror_axis))
-                    raise e
-        image.data = image_data
-
-    def mirror_compressed_dds_image( image, mirror_axis, mirror_keep_side ):
-        pixels = [(x,y) for x in range(4) for y in range(4)]
-        keep_pixels = set([ pixel for pixel in pixels if filter_constant_pixels( pixel, mirror_axis, mirror_keep_side, (4,4) ) ])
-        old_image = EmbeddedScMapDDSImage( image.data )
-        x_blocks = image.size[0] // 4
-        y_blocks = image.size[1] // 4
-        for mip_map_level in range(max(image.header.mip_map_count,1)):
-            blocks_size = ( x_blocks, y_blocks )
-            blocks = [(x,y) for x in range(blocks_size[0]) for y in range(blocks_size[1])]
-            keep_blocks = set([ block for block in blocks if filter_constant_pixels( block, mirror_axis, mirror_keep_side, blocks_size ) ])
-            for block in keep_blocks:
-                mirror_block = get_mirror_position( block, mirror_axis, blocks_size )
-                x,y = block
-                mirror_x, mirror_y = mirror_block
-                try:
-                    block_data = list(old_image.get_block( x, y, mip_map_level ))
-                    old_alpha = block_data[2]
-                    old_color = block_data[5]
-                    new_alpha = old_alpha[:]
-                    new_color = old_color[:]
-                    if block == mirror_block:
-                        iter_over = keep_pixels
-                    else:
-                        iter_over = pixels
-                    for pixel in iter_over:
-                        mirror_pixel_address = get_mirror_pixel_address( pixel, mirror_axis, (4,4) )
-                        pixel_address = 4*pixel[1] + pixel[0]
-                        new_alpha[mirror_pixel_address] = old_alpha[pixel_address]
-                        new_color[mirror_pixel_address] = old_color[pixel_address]
-                    block_data[2] = new_alpha
-                    block_data[5] = new_color
-                    image.set_block( mirror_x, mirror_y, mip_map_level, block_data )
-                except Exception as e:
-                    print("x:{} y:{} mip_map_level:{}".format(x,y,mip_map_level))
-                    raise(e)
-            x_blocks //= 2
-            y_blocks //= 2
-
-
-    def mirror_image( image, mirror_axis, mirror_keep_side ):
-        pixels = [(x,y) for x in range(image.size[0]) for y in range(image.size[1])]
-        keep_pixels = set([ pixel for pixel in pixels if filter_constant_pixels( pixel, mirror_axis, mirror_keep_side, image.size ) ])
-        if image.extension == 'gray':
-            mirror_gray_image( image, pixels, keep_pixels, mirror_axis, mirror_keep_side )
-        elif image.extension == 'dds':
-            if image.has_uncompressed_rgb_data:
-                images = image.as_grays()
-                for _image in images:
-                    mirror_gray_image( _image, pixels, keep_pixels, mirror_axis, mirror_keep_side )
-                image.from_grays(images)
-            else:
-                if image.is_normal_map:
-                    new_image = image.as_uncompressed()
-                    mirror_uncompressed_dds_image( new_image, mirror_axis, mirror_keep_side )
-                    image.__init__( new_image.data, new_image.is_normal_map )
-                else:
-                    mirror_compressed_dds_image( image, mirror_axis, mirror_keep_side )
+            boundary = y*m
         else:
-            raise Exception("get_mirror_pixel_address: not implemented")
-
-    if mirror_scmap_images:
-        images = map_infos['images']
-        for name in images:
-            image = images[name]
-            try:
-                print("Mirroring scmap image {}".format(name))
-                mirror_image( image, mirror_axis, mirror_keep_side )
-            except EmbeddedScMapDDSImage.FormatException:
-                print("Warning: skipping image {} because of unsupported format error".format(name))
-
-
-    if dump_scmap_images:
-
-        images = map_infos['images']
-        for name in images:
-            image = images[name]
-
-            # build dump file path
-            path_prefix = "{}/{}_{}".format( new_map_directory, new_scmap_name, name )
-            raw_output_file_path = "{}.{}".format( path_prefix, image.extension )
-
-            # dump image data
-            print("Dumping scmap image {}".format(name))
-            open( raw_output_file_path, 'wb' ).write( image.data )
-
-            # build png file path
-            output_file_path = "{}.{}".format( path_prefix, 'png' )
-
-            # convert image dump to png
-            if os.path.exists(ImageMagicConvert):
-                cmd = [ ImageMagicConvert ]
-                if image.extension == 'gray':
-                    cmd += [ '-size',"{}x{}".format(*image.size),'-depth', image.depth ]
-                cmd += [ raw_output_file_path, output_file_path ]
-                print("running {}".format(' '.join(cmd)))
-                subprocess.run( cmd )
-
+            boundary = width - 1 - (y*m)
+        split = min( max( math.ceil( boundary ), 0 ), width )
+        spans.append( ( 0, split ) if keep_side == 1 else ( split, width ) )
+    return spans
+
+# kept pixels of side 1, every pixel of the image is a turn of exactly one of them,
+# only the center pixel of odd sizes is its own turn
+def rotation_keep_spans( mirror_axis, size ):
+    width, height = size
+    if mirror_axis == 'rot2':
+        # top half and left half of an odd middle row
+        return [ ( 0, width ) if y < (height-1)/2 else ( 0, math.ceil( width/2 ) ) if y == (height-1)/2 else ( 0, 0 )
+            for y in range( height ) ]
+    if width != height:
+        raise Exception("4-fold rotation needs square images, got {}x{}".format(width, height))
+    # top left quarter including the upper half of an odd middle column, plus the center pixel
+    return [ ( 0, (width+1)//2 ) if y < height//2 else ( y, y+1 ) if y == height//2 and height % 2 else ( 0, 0 )
+        for y in range( height ) ]
+
+def get_mirror_position( pixel_coord, mirror_axis, size ):
+    x,y = pixel_coord
+    m = size[0] / size[1]
     if mirror_axis == 'x':
-        def rotate_decal(rotation):
-            return ( rotation[2], math.pi/2 - rotation[1], -rotation[0] )
-        def rotate_prop( rotationX, rotationY, rotationZ ):
-            rad = math.acos( rotationX[0] ) + math.pi
-            new_rotationX = (  math.cos(rad),  rotationX[1], math.sin(rad) )
-            new_rotationY = (  rotationY[0],   rotationY[1], rotationY[2]  )
-            new_rotationZ = ( -math.sin(rad),  rotationZ[1], math.cos(rad) )
-            return ( new_rotationX, new_rotationY, new_rotationZ )
+        return ( size[0] - 1 - x, y )
     elif mirror_axis == 'y':
-        def rotate_decal(rotation):
-            return ( rotation[2], -math.pi/2 - rotation[1], rotation[0] )
-        def rotate_prop( rotationX, rotationY, rotationZ ):
-            rad = math.acos( rotationX[0] ) + math.pi
-            new_rotationX = (  math.cos(rad),  rotationX[1], math.sin(rad) )
-            new_rotationY = (  rotationY[0],   rotationY[1], rotationY[2]  )
-            new_rotationZ = ( -math.sin(rad),  rotationZ[1], math.cos(rad) )
-            return ( new_rotationX, new_rotationY, new_rotationZ )
+        return ( x, size[1] - 1 - y )
     elif mirror_axis == 'xy':
-        def rotate_decal(rotation):
-            return ( rotation[2], -rotation[1], -rotation[0] )
-        # not really posible to mirror the mesh by rotation...
-        def rotate_prop( rotationX, rotationY, rotationZ ):
-            rad = math.acos( rotationX[0] ) + math.pi
-            new_rotationX = (  math.cos(rad),  rotationX[1], math.sin(rad) )
-            new_rotationY = (  rotationY[0],   rotationY[1], rotationY[2]  )
-            new_rotationZ = ( -math.sin(rad),  rotationZ[1], math.cos(rad) )
-            return ( new_rotationX, new_rotationY, new_rotationZ )
+        return ( y*m, x/m )
     elif mirror_axis == 'yx':
-        def rotate_decal(rotation):
-            return ( rotation[2], math.pi - rotation[1], -rotation[0] )
-        # not really posible to mirror the mesh by rotation...
-        def rotate_prop( rotationX, rotationY, rotationZ ):
-            rad = math.acos( rotationX[0] ) + math.pi
-            new_rotationX = (  math.cos(rad),  rotationX[1], math.sin(rad) )
-            new_rotationY = (  rotationY[0],   rotationY[1], rotationY[2]  )
-            new_rotationZ = ( -math.sin(rad),  rotationZ[1], math.cos(rad) )
-            return ( new_rotationX, new_rotationY, new_rotationZ )
+        return ( size[0] - 1 - (y*m), size[1] - 1 - (x/m) )
+    elif mirror_axis == 'rot90':
+        return ( size[0] - 1 - (y*m), x/m )
+    elif mirror_axis == 'rot180':
+        return ( size[0] - 1 - x, size[1] - 1 - y )
+    elif mirror_axis == 'rot270':
+        return ( y*m, size[1] - 1 - (x/m) )
+
+def mirror_position3( position, axis, size ):
+    return mirror_transform( axis, size ).positions( [ position ] )[0]
+
+def get_mirror_pixel_address( pixel_coord, mirror_axis, size ):
+    mirror_pixel = get_mirror_position( pixel_coord, mirror_axis, size )
+    return size[0]*int(mirror_pixel[1]) + int(mirror_pixel[0])
+
+# memoryview formats with one item per pixel
+PIXEL_FORMATS = { 1: 'B', 2: 'H', 4: 'I', 8: 'Q' }
+
+# copy every pixel outside of the kept spans from its mirror pixel, dest and source are
+# memoryviews with one item per pixel, dest holds the rows first_row to first_row+rows,
+# rotations take the pixels of each turn from sources[target] when given
+def mirror_spans( dest, source, size, mirror_axis, spans, first_row=0, rows=None, sources=None ):
+    if mirror_axis in ROTATION_MODES:
+        return rotate_spans( dest, source, size, mirror_axis, spans, first_row, rows, sources )
+    width, height = size
+    rows = height - first_row if rows is None else rows
+    for y in range( first_row, first_row+rows ):
+        keep_start, keep_end = spans[y]
+        row = y*width
+        dest_row = (y-first_row)*width
+        for start, end in ( ( 0, keep_start ), ( keep_end, width ) ):
+            if start >= end:
+                continue
+            if mirror_axis == 'x':
+                dest[dest_row+start:dest_row+end] = source[row+width-end:row+width-start][::-1]
+            elif mirror_axis == 'y':
+                mirror_row = (height-1-y)*width
+                dest[dest_row+start:dest_row+end] = source[mirror_row+start:mirror_row+end]
+            elif mirror_axis == 'xy' and width == height:
+                # column y of source
+                dest[dest_row+start:dest_row+end] = source[width*start+y::width][:end-start]
+            elif mirror_axis == 'yx' and width == height:
+                # column width-1-y of source bottom up
+                dest[dest_row+start:dest_row+end] = source[width*(height-1-start)+width-1-y::-width][:end-start]
+            else:
+                for x in range( start, end ):
+                    dest[dest_row+x] = source[get_mirror_pixel_address( (x,y), mirror_axis, size )]
+
+def is_kept( spans, x, y ):
+    return spans[y][0] <= x < spans[y][1]
+
+# pixel which turns into ( x, y ) with target
+def turned_from( target, x, y, size ):
+    width, height = size
+    if target == 'rot90':
+        return ( y, width-1-x )
+    elif target == 'rot180':
+        return ( width-1-x, height-1-y )
+    return ( height-1-y, x )
+
+# copy every pixel outside of the kept spans from the kept pixel it is a turn of, rows get cut
+# where the quarters of 4-fold rotation meet so every piece comes from a single turn
+def rotate_spans( dest, source, size, mirror_axis, spans, first_row=0, rows=None, sources=None ):
+    width, height = size
+    rows = height - first_row if rows is None else rows
+    targets = symmetry_targets( mirror_axis )
+    cuts = sorted( set( [ width//2, (width+1)//2 ] ) )
+    for y in range( first_row, first_row+rows ):
+        keep_start, keep_end = spans[y]
+        dest_row = (y-first_row)*width
+        for start, end in ( ( 0, keep_start ), ( keep_end, width ) ):
+            points = [ start ] + [ cut for cut in cuts if start < cut < end ] + [ end ]
+            for a, b in zip( points, points[1:] ):
+                if a >= b:
+                    continue
+                target = next( target for target in targets if is_kept( spans, *turned_from( target, a, y, size ) ) )
+                turn = sources[target] if sources else source
+                if target == 'rot180':
+                    mirror_row = (height-1-y)*width
+                    dest[dest_row+a:dest_row+b] = turn[mirror_row+width-b:mirror_row+width-a][::-1]
+                elif target == 'rot90':
+                    # column y bottom up
+                    dest[dest_row+a:dest_row+b] = turn[y::width][width-b:width-a][::-1]
+                else:
+                    # column width-1-y top down
+                    dest[dest_row+a:dest_row+b] = turn[width-1-y::width][a:b]
+
+def mirror_gray_image( image, mirror_axis, mirror_keep_side ):
+    image_data = bytearray(image.data)
+    pixel_format = PIXEL_FORMATS[ int(image.depth) // 8 ]
+    # image.data stays untouched until it gets replaced below
+    mirror_spans(
+        memoryview(image_data).cast(pixel_format), memoryview(image.data).cast(pixel_format),
+        image.size, mirror_axis, keep_side_spans( mirror_axis, mirror_keep_side, image.size ) )
+    image.data = image_data
+
+# 8 bit normal components pointing the other way
+NEGATED_NORMAL_COMPONENTS = bytes( 255 - value for value in range( 256 ) )
+
+# normal map pixels with their normals turned like the map gets turned by target, normals
+# are x in alpha and z in green of every pixel like the terrain shader reads them
+def turned_normal_pixels( pixels, depth_bytes, target ):
+    turned = bytearray( pixels )
+    normal_x, normal_z = bytes( pixels[3::depth_bytes] ), bytes( pixels[1::depth_bytes] )
+    if target == 'rot180':
+        # ( x, z ) -> ( -x, -z )
+        turned[3::depth_bytes] = normal_x.translate( NEGATED_NORMAL_COMPONENTS )
+        turned[1::depth_bytes] = normal_z.translate( NEGATED_NORMAL_COMPONENTS )
+    elif target == 'rot90':
+        # ( x, z ) -> ( -z, x )
+        turned[3::depth_bytes] = normal_z.translate( NEGATED_NORMAL_COMPONENTS )
+        turned[1::depth_bytes] = normal_x
     else:
-        raise Exception("IMPLEMENT ME!!!")
-
-    def mirror_decals( map_infos, decals_archivePath, new_map_directory, decals_path_prefix ):
-
-        def generate_mirrored_decal( decals_archive, decal_to_mirror, is_normal_map ):
-            if not decal_to_mirror:
-                return b''
-            new_decal_path = new_map_directory + '/flop_and_rotate_90' + decal_to_mirror
-            new_decal_ingame_path = '{}/flop_and_rotate_90{}'.format( decals_path_prefix, decal_to_mirror )
-            if os.path.exists( new_decal_path ):
-                return new_decal_ingame_path.encode()
-
-            with decals_archive.open(decals_archive.decals_case_insensitive_lookup[decal_to_mirror[1:].lower()]) as decal_texture:
-                print("Mirroring decal {}".format(decal_to_mirror))
-                os.makedirs( os.path.dirname( new_decal_path ), exist_ok = True )
-                image = EmbeddedScMapDDSImage(decal_texture.read())
-                image.is_normal_map = is_normal_map
-                #image.debug_print()
-                mirror_image( image, 'xy', -1 )
-                open(new_decal_path,'wb').write(image.data)
-
-            return new_decal_ingame_path.encode()
-
-        new_decals = []
-        decals_count = len(map_infos['decals'])
-
-        map_infos['debug_props'] = []
-
-        with ZipFile( decals_archivePath, 'r' ) as decals_archive:
-            decals_archive.decals_case_insensitive_lookup = { s.lower():s for s in decals_archive.namelist() }
-
-            for decal in map_infos['decals']:
-                (
-                    decal_id,decalType,unknown15,
-                    decals_texture1_path,decals_texture2_path,
-                    scale,position,rotation,
-                    cut_off_lod,near_cut_off_lod,remove_tick
-                ) = decal
-
-                new_position = mirror_position3( position, mirror_axis, map_infos['ingame_map_size'] )
-                new_rotation = rotate_decal( rotation )
-
-                is_normal_map = ( decalType == 2 )
-
-                if debug_decals_position:
-                    # switch normals to albedo for debugging
-                    decalType = 1
-                    decal[1] = 1
-
-                    # place theta bridges at decal position with decal rotation
-                    map_infos['debug_props'] += [(
-                            b'/env/redrocks/props/thetabridge01_prop.bp',
-                            position,
-                            (-math.cos(rotation[1]),0,-math.sin(rotation[1])),
-                            (0,1,0),
-                            (math.sin(rotation[1]),0,-math.cos(rotation[1])),
-                            (1,1,1))]
-                    map_infos['debug_props'] += [(
-                            b'/env/redrocks/props/thetabridge01_prop.bp',
-                            new_position,
-                            (-math.cos(new_rotation[1]),0,-math.sin(new_rotation[1])),
-                            (0,1,0),
-                            (math.sin(new_rotation[1]),0,-math.cos(new_rotation[1])),
-                            (1,1,1))]
-
-                new_decals_texture1_path = generate_mirrored_decal( decals_archive, decals_texture1_path.decode(), is_normal_map )
-                new_decals_texture2_path = generate_mirrored_decal( decals_archive, decals_texture2_path.decode(), is_normal_map )
-
-                new_decals.append([
-                    decals_count+decal_id,decalType,unknown15,
-                    new_decals_texture1_path,new_decals_texture2_path,
-                    scale,new_position,new_rotation,
-                    cut_off_lod,near_cut_off_lod,remove_tick
-                ])
-
-        map_infos['decals'] += new_decals
-
-    def mirror_props( map_infos ):
-        new_props = []
-        for prop in map_infos['props']:
+        # ( x, z ) -> ( z, -x )
+        turned[3::depth_bytes] = normal_z
+        turned[1::depth_bytes] = normal_x.translate( NEGATED_NORMAL_COMPONENTS )
+    return turned
+
+def mirror_uncompressed_dds_image( image, mirror_axis, mirror_keep_side ):
+    image_data = bytearray(image.data)
+    depth_bytes = int( int(image.depth) / 8 )
+    pixel_format = PIXEL_FORMATS[depth_bytes]
+    turns_normals = image.is_normal_map and mirror_axis in ROTATION_MODES
+    if turns_normals and depth_bytes != 4:
+        raise image.FormatException()
+    for mip_map_level in range(max(image.header.mip_map_count,1)):
+        offset, mip_map_size = image.mip_map_infos[mip_map_level]
+        if not mip_map_size[0] or not mip_map_size[1]:
+            continue
+        end = offset + mip_map_size[0] * mip_map_size[1] * depth_bytes
+        # every turn copies pixels with normals turned the same way
+        sources = None
+        if turns_normals:
+            sources = { target: memoryview( turned_normal_pixels( image.data[offset:end], depth_bytes, target ) ).cast(pixel_format)
+                for target in symmetry_targets( mirror_axis ) }
+        mirror_spans(
+            memoryview(image_data)[offset:end].cast(pixel_format), memoryview(image.data)[offset:end].cast(pixel_format),
+            mip_map_size, mirror_axis, keep_side_spans( mirror_axis, mirror_keep_side, mip_map_size ), sources=sources )
+        if image.is_normal_map and not turns_normals:
+            # swap normal components of every pixel
+            mip_map_data = image_data[offset:end]
+            normal_component = mip_map_data[1::depth_bytes]
+            mip_map_data[1::depth_bytes] = mip_map_data[3::depth_bytes]
+            mip_map_data[3::depth_bytes] = normal_component
+            image_data[offset:end] = mip_map_data
+    image.data = image_data
+
+# for every row of 4 pixel indices in a DXT5 block the mirrored indices they contribute,
+# alpha indices have 3 bits and color indices 2 bits per pixel
+DXT5_INDEX_TABLES = {}
+
+def dxt5_index_tables( mirror_axis ):
+    tables = DXT5_INDEX_TABLES.get( mirror_axis )
+    if tables is None:
+        mirror_indices = block_mirror_indices( mirror_axis )
+        tables = DXT5_INDEX_TABLES[mirror_axis] = (
+            [ [ mirror_block_row( value, row, 3, mirror_indices ) for value in range( 1 << 12 ) ] for row in range(4) ],
+            [ [ mirror_block_row( value, row, 2, mirror_indices ) for value in range( 1 << 8 ) ] for row in range(4) ],
+        )
+    return tables
+
+# block pixel index 4*y+x to index of its mirror pixel
+def block_mirror_indices( mirror_axis ):
+    return [ get_mirror_pixel_address( ( i % 4, i // 4 ), mirror_axis, (4,4) ) for i in range(16) ]
+
+def mirror_block_row( value, row, bits, mirror_indices ):
+    mask = ( 1 << bits ) - 1
+    mirrored = 0
+    for column in range(4):
+        mirrored |= ( ( value >> column*bits ) & mask ) << mirror_indices[row*4+column]*bits
+    return mirrored
+
+# move only given pixels to their mirror pixels, the others keep their index
+# or the one they got in mirrored
+def mirror_block_pixels( value, bits, mirror_indices, pixels, mirrored=None ):
+    mask = ( 1 << bits ) - 1
+    if mirrored is None:
+        mirrored = value
+    for pixel in pixels:
+        mirror_shift = mirror_indices[pixel]*bits
+        mirrored = ( mirrored & ~( mask << mirror_shift ) ) | ( ( ( value >> pixel*bits ) & mask ) << mirror_shift )
+    return mirrored
+
+# normal maps don't get here, mirror_image() decompresses them so their components can be turned
+def mirror_compressed_dds_image( image, mirror_axis, mirror_keep_side ):
+    # every kept block is read once and written to each target
+    targets = [ ( target, block_mirror_indices( target ), dxt5_index_tables( target ) ) for target in symmetry_targets( mirror_axis ) ]
+    keep_pixels = [ 4*y+x for y, ( start, end ) in enumerate( keep_side_spans( mirror_axis, mirror_keep_side, (4,4) ) ) for x in range( start, end ) ]
+    old_data = bytes( image.data )
+    image_data = image.data
+    x_blocks = image.size[0] // 4
+    y_blocks = image.size[1] // 4
+    for mip_map_level in range(max(image.header.mip_map_count,1)):
+        blocks_size = ( x_blocks, y_blocks )
+        keep_blocks = [ (x,y) for y, ( start, end ) in enumerate( keep_side_spans( mirror_axis, mirror_keep_side, blocks_size ) ) for x in range( start, end ) ]
+        if keep_blocks and not image.is_DXT5:
+            raise image.FormatException()
+        if x_blocks != y_blocks and mirror_axis in ( 'xy', 'yx' ):
+            # several blocks can end up on the same mirror block, keep the order the last one wins in
+            keep_blocks = set( sorted( keep_blocks ) )
+        mip_map_offset, mip_map_size = image.mip_map_infos[mip_map_level]
+        row_blocks = mip_map_size[0]//4
+        for block in keep_blocks:
+            x,y = block
+            block_offset = mip_map_offset + ( row_blocks * y + x ) * 16
+            alphas = int.from_bytes( old_data[block_offset+2:block_offset+8], 'little' )
+            colors = int.from_bytes( old_data[block_offset+12:block_offset+16], 'little' )
+            # a block which is its own target collects the moved pixels of all targets
+            fixed_alphas = fixed_colors = None
+            for target, mirror_indices, ( alpha_tables, color_tables ) in targets:
+                mirror_x, mirror_y = get_mirror_position( block, target, blocks_size )
+                mirror_block_offset = mip_map_offset + ( row_blocks * int(mirror_y) + int(mirror_x) ) * 16
+                if block == ( mirror_x, mirror_y ):
+                    fixed_alphas = mirrored_alphas = mirror_block_pixels( alphas, 3, mirror_indices, keep_pixels, fixed_alphas )
+                    fixed_colors = mirrored_colors = mirror_block_pixels( colors, 2, mirror_indices, keep_pixels, fixed_colors )
+                else:
+                    alpha_0, alpha_1, alpha_2, alpha_3 = alpha_tables
+                    color_0, color_1, color_2, color_3 = color_tables
+                    mirrored_alphas = alpha_0[alphas & 0xfff] | alpha_1[(alphas >> 12) & 0xfff] | alpha_2[(alphas >> 24) & 0xfff] | alpha_3[alphas >> 36]
+                    mirrored_colors = color_0[colors & 0xff] | color_1[(colors >> 8) & 0xff] | color_2[(colors >> 16) & 0xff] | color_3[colors >> 24]
+                image_data[mirror_block_offset:mirror_block_offset+16] = (
+                    old_data[block_offset:block_offset+2] + mirrored_alphas.to_bytes( 6, 'little' ) +
+                    old_data[block_offset+8:block_offset+12] + mirrored_colors.to_bytes( 4, 'little' ) )
+        x_blocks //= 2
+        y_blocks //= 2
+
+
+def mirror_image( image, mirror_axis, mirror_keep_side ):
+    if image.extension == 'gray':
+        mirror_gray_image( image, mirror_axis, mirror_keep_side )
+    elif image.extension == 'dds':
+        if image.has_uncompressed_rgb_data and image.is_normal_map and mirror_axis in ROTATION_MODES:
+            # turned normals mix their components, which mirroring each channel alone can't do
+            mirror_uncompressed_dds_image( image, mirror_axis, mirror_keep_side )
+        elif image.has_uncompressed_rgb_data:
+            images = image.as_grays()
+            for _image in images:
+                mirror_gray_image( _image, mirror_axis, mirror_keep_side )
+            image.from_grays(images)
+        else:
+            if image.is_normal_map:
+                new_image = image.as_uncompressed()
+                mirror_uncompressed_dds_image( new_image, mirror_axis, mirror_keep_side )
+                image.__init__( new_image.data, new_image.is_normal_map )
+            else:
+                mirror_compressed_dds_image( image, mirror_axis, mirror_keep_side )
+    else:
+        raise Exception("get_mirror_pixel_address: not implemented")
+
+
+def mirror_scmap_image( name, image, mirror_axis, mirror_keep_side ):
+    try:
+        reporter.debug( 'image_mirrored', "Mirroring scmap image {}".format(name), image=name )
+        mirror_image( image, mirror_axis, mirror_keep_side )
+        profiler.count('images_mirrored')
+    except EmbeddedScMapDDSImage.FormatException:
+        reporter.warning( 'image_skipped', "skipping image {} because of unsupported format error".format(name), image=name )
+        profiler.count('images_skipped')
+
+def dump_images( images, new_map_directory, new_scmap_name, ImageMagicConvert ):
+    for name in images:
+        image = images[name]
+
+        # build dump file path
+        path_prefix = "{}/{}_{}".format( new_map_directory, new_scmap_name, name )
+        raw_output_file_path = "{}.{}".format( path_prefix, image.extension )
+
+        # dump image data
+        reporter.debug( 'image_dumped', "Dumping scmap image {}".format(name), image=name, path=raw_output_file_path )
+        open( raw_output_file_path, 'wb' ).write( image.data )
+
+        # build png file path
+        output_file_path = "{}.{}".format( path_prefix, 'png' )
+
+        # convert image dump to png
+        if os.path.exists(ImageMagicConvert):
+            cmd = [ ImageMagicConvert ]
+            if image.extension == 'gray':
+                cmd += [ '-size',"{}x{}".format(*image.size),'-depth', image.depth ]
+            cmd += [ raw_output_file_path, output_file_path ]
+            reporter.debug( 'imagemagick', "running {}".format(' '.join(cmd)), command=cmd )
+            subprocess.run( cmd )
+
+# mirrored copies within dedup_tolerance of a decal with the same textures are dropped
+# mirrored textures are written into package when given
+def mirror_decals( map_infos, mirror_axis, decals_archivePath, new_map_directory, decals_path_prefix, debug_decals_position=False, dedup_tolerance=0, workers=1, package=None ):
+
+    # new texture path to ( texture, is_normal_map ), every texture gets mirrored once after all decals are known
+    decal_textures = {}
+
+    def generate_mirrored_decal( decal_to_mirror, is_normal_map ):
+        if not decal_to_mirror:
+            return b''
+        new_decal_path = new_map_directory + '/flop_and_rotate_90' + decal_to_mirror
+        new_decal_ingame_path = '{}/flop_and_rotate_90{}'.format( decals_path_prefix, decal_to_mirror )
+        if new_decal_path in decal_textures or ( package.contains( new_decal_path ) if package else os.path.exists( new_decal_path ) ):
+            profiler.count('decal_textures_reused')
+        else:
+            decal_textures[new_decal_path] = ( decal_to_mirror, is_normal_map )
+        return new_decal_ingame_path.encode()
+
+    new_decals = []
+    # culled decals leave gaps in the ids, so count alone could collide
+    decals_count = max( [ len(map_infos['decals']) ] + [ decal[0]+1 for decal in map_infos['decals'] ] )
+
+    map_infos['debug_props'] = []
+
+    existing_decals = spatial_index.existing_entities(
+        [ ( ( decal[1], decal[3], decal[4] ), decal[6][0], decal[6][2] ) for decal in map_infos['decals'] ], dedup_tolerance )
+
+    # rotations write one copy per turn
+    for copy, target in enumerate( symmetry_targets( mirror_axis ), 1 ):
+        transform = mirror_transform( target, map_infos['ingame_map_size'] )
+        new_positions = transform.positions( [ decal[6] for decal in map_infos['decals'] ] )
+        new_rotations = transform.decal_rotations( [ decal[7] for decal in map_infos['decals'] ] )
+
+        for decal, new_position, new_rotation in zip( map_infos['decals'], new_positions, new_rotations ):
+            (
+                decal_id,decalType,unknown15,
+                decals_texture1_path,decals_texture2_path,
+                scale,position,rotation,
+                cut_off_lod,near_cut_off_lod,remove_tick
+            ) = decal
+
+            if existing_decals and existing_decals.contains( ( decalType, decals_texture1_path, decals_texture2_path ), new_position[0], new_position[2] ):
+                profiler.count('decals_deduplicated')
+                continue
+
+            is_normal_map = ( decalType == 2 )
+
+            if debug_decals_position:
+                # switch normals to albedo for debugging
+                decalType = 1
+                decal[1] = 1
+
+                # place theta bridges at decal position with decal rotation
+                map_infos['debug_props'] += [(
+                        b'/env/redrocks/props/thetabridge01_prop.bp',
+                        position,
+                        (-math.cos(rotation[1]),0,-math.sin(rotation[1])),
+                        (0,1,0),
+                        (math.sin(rotation[1]),0,-math.cos(rotation[1])),
+                        (1,1,1))]
+                map_infos['debug_props'] += [(
+                        b'/env/redrocks/props/thetabridge01_prop.bp',
+                        new_position,
+                        (-math.cos(new_rotation[1]),0,-math.sin(new_rotation[1])),
+                        (0,1,0),
+                        (math.sin(new_rotation[1]),0,-math.cos(new_rotation[1])),
+                        (1,1,1))]
+
+            if transform.mirrors:
+                new_decals_texture1_path = generate_mirrored_decal( decals_texture1_path.decode(), is_normal_map )
+                new_decals_texture2_path = generate_mirrored_decal( decals_texture2_path.decode(), is_normal_map )
+            else:
+                # turned decals use the same textures
+                new_decals_texture1_path, new_decals_texture2_path = decals_texture1_path, decals_texture2_path
+
+            new_decals.append([
+                copy*decals_count+decal_id,decalType,unknown15,
+                new_decals_texture1_path,new_decals_texture2_path,
+                scale,new_position,new_rotation,
+                cut_off_lod,near_cut_off_lod,remove_tick
+            ])
+
+    mirror_decal_textures( decals_archivePath, decal_textures, workers, package )
+
+    profiler.count('decals_mirrored', len(new_decals))
+    map_infos['decals'] += new_decals
+
+# zip handles of the archives the current thread opened, they are never shared between threads
+decal_archives = threading.local()
+
+# stays open for later maps with --serve, reopened when the archive changed
+def thread_decal_archive( decals_archivePath ):
+    archives = decal_archives.__dict__.setdefault( 'archives', {} )
+    stat = os.stat( decals_archivePath )
+    version = ( stat.st_mtime_ns, stat.st_size )
+    if decals_archivePath not in archives or archives[decals_archivePath][0] != version:
+        if decals_archivePath in archives:
+            archives[decals_archivePath][1].close()
+        decals_archive = ZipFile( decals_archivePath, 'r' )
+        decals_archive.decals_case_insensitive_lookup = { s.lower():s for s in decals_archive.namelist() }
+        archives[decals_archivePath] = ( version, decals_archive )
+    return archives[decals_archivePath][1]
+
+# worker processes live as long as this one, so they keep their archives open as well
+DECAL_POOLS = {}
+
+# forked workers inherit the archives of the parent, reading them would move the file offset
+# the parent's reads rely on, so every worker opens its own
+def forget_decal_archives():
+    decal_archives.__dict__.pop( 'archives', None )
+
+def decal_pool( workers ):
+    if workers not in DECAL_POOLS:
+        DECAL_POOLS[workers] = ProcessPoolExecutor( max_workers=workers, initializer=forget_decal_archives )
+    return DECAL_POOLS[workers]
+
+# with returned the texture isn't written but returned together with whether it's still block
+# compressed, which packages store as it is
+def mirror_decal_texture( decals_archive, member, decal_to_mirror, new_decal_path, is_normal_map, returned=False ):
+    with decals_archive.open( member ) as decal_texture:
+        image = EmbeddedScMapDDSImage(decal_texture.read())
+        image.is_normal_map = is_normal_map
+        #image.debug_print()
+        mirror_image( image, 'xy', -1 )
+    if returned:
+        return image.data, not image.has_uncompressed_rgb_data
+    os.makedirs( os.path.dirname( new_decal_path ), exist_ok = True )
+    open(new_decal_path,'wb').write(image.data)
+
+# runs in pool workers, which keep their archive open for the next texture
+def mirror_decal_texture_in_worker( decals_archivePath, *args ):
+    return mirror_decal_texture( thread_decal_archive( decals_archivePath ), *args )
+
+# read, mirror and write the textures in up to workers processes, as decoding
+# and mirroring is pure python threads wouldn't run them side by side,
+# textures for a package are sent back and written into it here
+def mirror_decal_textures( decals_archivePath, decal_textures, workers=1, package=None ):
+    if not decal_textures:
+        return
+    if decals_archivePath is None:
+        raise Exception("Mirrored decal textures need env.scd, pass the SC gamedata directory")
+    decals_archive = thread_decal_archive( decals_archivePath )
+    jobs = [ ( decals_archive.decals_case_insensitive_lookup[decal_to_mirror[1:].lower()], decal_to_mirror, new_decal_path, is_normal_map )
+        for new_decal_path, ( decal_to_mirror, is_normal_map ) in decal_textures.items() ]
+    returned = package is not None
+    # workers don't report, their textures are reported here once done
+    def report( done, job, texture ):
+        if returned:
+            data, block_compressed = texture
+            package.write( job[2], data, stored=block_compressed )
+        reporter.debug( 'decal_texture', "Mirroring decal {}".format(job[1]), texture=job[1], path=job[2] )
+        reporter.progress( 'decal_textures', done, len(jobs), "Mirroring decal textures" )
+    if workers <= 1 or len(jobs) == 1:
+        for done, job in enumerate( jobs, 1 ):
+            report( done, job, mirror_decal_texture( decals_archive, *job, returned ) )
+    else:
+        pool = decal_pool( workers )
+        futures = [ pool.submit( mirror_decal_texture_in_worker, decals_archivePath, *job, returned ) for job in jobs ]
+        for done, ( future, job ) in enumerate( zip( futures, jobs ), 1 ):
+            report( done, job, future.result() )
+    profiler.count('decal_textures_mirrored', len(jobs))
+
+# remove props and decals which are completely on the side that gets overwritten,
+# decals only if their whole footprint is there
+def cull_map_entities( map_infos, mirror_axis, keep_side, props=True, decals=True ):
+    entities = []
+    if props:
+        entities += [ ( ( 'props', i ), prop[1][0], prop[1][2], 0 ) for i, prop in enumerate( map_infos['props'] ) ]
+    if decals:
+        entities += [ ( ( 'decals', i ), decal[6][0], decal[6][2], math.hypot( decal[5][0], decal[5][2] ) ) for i, decal in enumerate( map_infos['decals'] ) ]
+    discarded = spatial_index.discarded_entities( entities, mirror_axis, keep_side, map_infos['ingame_map_size'] )
+    for kind in ( 'props', 'decals' ):
+        kept = [ entity for i, entity in enumerate( map_infos[kind] ) if ( kind, i ) not in discarded ]
+        profiler.count( '{}_culled'.format(kind), len( map_infos[kind] ) - len( kept ) )
+        map_infos[kind] = kept
+
+# mirrored copies within dedup_tolerance of a prop with the same blueprint are dropped
+def mirror_props( map_infos, mirror_axis, dedup_tolerance=0 ):
+    new_props = []
+    existing_props = spatial_index.existing_entities(
+        [ ( prop[0], prop[1][0], prop[1][2] ) for prop in map_infos['props'] ], dedup_tolerance )
+    for target in symmetry_targets( mirror_axis ):
+        # create mirrored parameters of all props at once
+        transform = mirror_transform( target, map_infos['ingame_map_size'] )
+        new_positions = transform.positions( [ prop[1] for prop in map_infos['props'] ] )
+        new_rotations = transform.prop_rotations( [ prop[2:5] for prop in map_infos['props'] ] )
+        for prop, new_position, new_rotation in zip( map_infos['props'], new_positions, new_rotations ):
             (blueprintPath,position,rotationX,rotationY,rotationZ,scale) = prop
-            # create mirrored parameters
-            new_position = mirror_position3( position, mirror_axis, map_infos['ingame_map_size'] )
-            new_rotation = rotate_prop(rotationX,rotationY,rotationZ)
+            if existing_props and existing_props.contains( blueprintPath, new_position[0], new_position[2] ):
+                profiler.count('props_deduplicated')
+                continue
             # add version with mirrored parameters to props list
             new_props.append( (blueprintPath,new_position,*new_rotation,scale) )
-        map_infos['props'] += new_props
-
-
-    if do_mirror_decals:
-        print("Mirroring decals")
-        mirror_decals( map_infos, decals_archivePath, new_map_directory, decals_path_prefix )
-
-    if do_mirror_props:
-        print("Mirroring props")
-        mirror_props( map_infos )
-
-    if 'debug_props' in map_infos:
-        map_infos['props'] += map_infos['debug_props']
+    profiler.count('props_mirrored', len(new_props))
+    map_infos['props'] += new_props
 
-    write_output_scmap( path_to_infile_scmap, path_to_new_scmap, map_infos )
 
-    if os.path.exists(path_to_infile_scmap_save_lua):
-        scenario = mirror_stuff_in_save_lua( path_to_infile_scmap_save_lua, path_to_new_scmap_save_lua, map_infos, mirror_axis, mirror_position3 )
-        with open(path_to_new_scmap_save_lua,'w') as newSaveLua:
-            writeSaveLua( newSaveLua, scenario, first=True )
-    else:
-        print("Warning: {} does not exist.".format(path_to_infile_scmap_save_lua))
+def mirror_stuff_in_save_lua( path_to_infile_scmap_save_lua, path_to_new_scmap_save_lua, map_infos, mirror_axis, mirror_position3, keep_side=None, dedup_tolerance=0 ):
+    if not os.path.exists( path_to_infile_scmap_save_lua ):
+        reporter.warning( 'save_lua_missing', "Couldn't find \"{}\".".format(path_to_infile_scmap_save_lua), path=path_to_infile_scmap_save_lua )
+        return
 
-def mirror_stuff_in_save_lua( path_to_infile_scmap_save_lua, path_to_new_scmap_save_lua, map_infos, mirror_axis, mirror_position3 ):
+    scenario = { 'Scenario': save_lua.load( path_to_infile_scmap_save_lua )['Scenario'] }
+    return mirror_scenario( scenario, map_infos, mirror_axis, mirror_position3, keep_side, dedup_tolerance )
+
+# mirror markers and units of { 'Scenario': ... } from save.lua in place,
+# with keep_side markers and units on the other side are removed before mirroring,
+# copies within dedup_tolerance of a marker or unit of the same type are dropped
+def mirror_scenario( scenario, map_infos, mirror_axis, mirror_position3, keep_side=None, dedup_tolerance=0 ):
+
+    # walls and such per target of the symmetry mode
+    def unit_translations( target ):
+        if target == 'x':
+            unitTypeTranslation = {
+                'xec8001': 'xec8003',
+                'xec8002': 'xec8004',
+                'xec8005': 'xec8008',
+                'xec8006': 'xec8007',
+                'xec8009': 'xec8012',
+                'xec8010': 'xec8011',
+                'xec8013': 'xec8018',
+                'xec8014': 'xec8017',
+                'xec8015': 'xec8016',
+                'xec8019': 'xec8020',
+            }
+            unitPositionFix = {
+                'xec8012': (-1, 0, 1), # -|
+                'xec8004': ( 1, 0, 0), # ---
+                'xec8008': (-1, 0, 1), #  |-
+                'xec8003': ( 0, 0,-1), #  |
+            }
+        elif target == 'y':
+            unitTypeTranslation = {
+            }
+            unitPositionFix = {
+            }
+        elif target == 'xy':
+            unitTypeTranslation = {
+                'xec8004': 'xec8003',
+                'xec8003': 'xec8004',
+            }
+            unitPositionFix = {
+            }
+        elif target == 'yx':
+            unitTypeTranslation = {
+            }
+            unitPositionFix = {
+            }
+        elif target in ( 'rot90', 'rot180', 'rot270' ):
+            unitTypeTranslation = {
+            }
+            unitPositionFix = {
+            }
+        else:
+            raise unknown_mirror_axis( target, SYMMETRY_COPIES )
 
-    if mirror_axis == 'x':
-        unitTypeTranslation = {
-            'xec8001': 'xec8003',
-            'xec8002': 'xec8004',
-            'xec8005': 'xec8008',
-            'xec8006': 'xec8007',
-            'xec8009': 'xec8012',
-            'xec8010': 'xec8011',
-            'xec8013': 'xec8018',
-            'xec8014': 'xec8017',
-            'xec8015': 'xec8016',
-            'xec8019': 'xec8020',
-        }
-        unitPositionFix = {
-            'xec8012': (-1, 0, 1), # -|
-            'xec8004': ( 1, 0, 0), # ---
-            'xec8008': (-1, 0, 1), #  |-
-            'xec8003': ( 0, 0,-1), #  |
-        }
-    elif mirror_axis == 'y':
-        unitTypeTranslation = {
-        }
-        unitPositionFix = {
-        }
-    elif mirror_axis == 'xy':
-        unitTypeTranslation = {
-            'xec8004': 'xec8003',
-            'xec8003': 'xec8004',
-        }
-        unitPositionFix = {
-        }
-    elif mirror_axis == 'yx':
-        unitTypeTranslation = {
-        }
-        unitPositionFix = {
-        }
-    else:
-        raise Exception("IMPLEMENT ME!!!")
+        return unitTypeTranslation, unitPositionFix
 
-    def translate_unit_position( unitType, position, mirror_axis, map_size ):
+    def translate_unit_position( unitPositionFix, unitType, position, mirror_axis, map_size ):
         position = mirror_position3( position, mirror_axis, map_size )
         if unitType in list(unitPositionFix):
             fix = unitPositionFix[unitType]
@@ -454,341 +1079,367 @@ def mirror_stuff_in_save_lua( path_to_infile_scmap_save_lua, path_to_new_scmap_s
     def dummyUnitRotation( unitType, rotation ):
         return ( rotation[0], rotation[1], rotation[2] )
 
+    # turned copies face where the original faces turned by the same angle, like decals do,
+    # kept within -pi to pi
+    def turnUnitRotation( yaw_offset, unitType, rotation ):
+        return ( rotation[0], math.remainder( rotation[1] + yaw_offset, 2*math.pi ), rotation[2] )
+
     def translateUnitType( unitTypeTranslation, unitType ):
         if unitType in list(unitTypeTranslation):
-            return unitTypeTranslation[unitType]
+            # keep STRING( ... ) values typed
+            return unitType.__class__( unitTypeTranslation[unitType] )
         else:
             return unitType
 
-    if not os.path.exists( path_to_infile_scmap_save_lua ):
-        print("Couldn't find \"{}\".".format(path_to_infile_scmap_save_lua))
-        return
-
-    path_to_old_scmap_save_module, _ = os.path.splitext( path_to_infile_scmap_save_lua )
-
-    old_working_directory = os.getcwd()
-    os.chdir(os.path.dirname(path_to_infile_scmap_save_lua))
-
-    # import map_save.lua with lupa
-    import lupa
-    lua = lupa.LuaRuntime(unpack_returned_tuples=False)
-    lua.execute('FLOAT=function(x) return string.format("FLOAT( %.6f )",x) end')
-    lua.execute('BOOLEAN=function(x) return string.format("BOOLEAN( %s )", x and "true" or "false" ) end')
-    lua.execute('STRING=function(x) return string.format("STRING( \'%s\' )",x) end')
-    lua.execute('VECTOR3=function(x,y,z) return "VECTOR3( "..x..", "..y..", "..z.." )" end')
-    lua.execute('RECTANGLE=function(a,b,c,d) return "RECTANGLE( "..a..", "..b..", "..c..", "..d.." )" end')
-    lua.execute('GROUP=function(x) return function() return x end end')
-    lua.require( os.path.relpath(os.path.basename( path_to_old_scmap_save_module )) )
-
-    os.chdir(old_working_directory)
-
-    scenario = lua.table_from({'Scenario': lua.eval('Scenario') })
-
-    # mirror Mexes
-    change_value_by_path_regex(
-        re.compile("/Scenario/MasterChain/[^/]*/Markers"),
-        partial(
-            partial(duplicate_mirror_and_rotate,re.compile("/[^/]*")),
-                mirror_axis,
-                partial(translate_unit_position,mirror_axis=mirror_axis,map_size=map_infos['ingame_map_size']),
-                dummyUnitRotation,
-                partial(translateUnitType,unitTypeTranslation),
-        ), scenario )
-
-    # mirror some armies
-    change_value_by_path_regex(
-        re.compile("/Scenario/Armies/[^/]*/[^/]*/Units/[^/]*/Units"),
-        partial(
-            partial(duplicate_mirror_and_rotate,re.compile("/[^/]*")),
-                mirror_axis,
-                partial(translate_unit_position,mirror_axis=mirror_axis,map_size=map_infos['ingame_map_size']),
-                dummyUnitRotation,
-                partial(translateUnitType,unitTypeTranslation),
-        ), scenario )
+    targets = []
+    for target in symmetry_targets( mirror_axis ):
+        unitTypeTranslation, unitPositionFix = unit_translations( target )
+        transform = mirror_transform( target, map_infos['ingame_map_size'] )
+        targets.append( (
+            target,
+            partial(translate_unit_position,unitPositionFix,mirror_axis=target,map_size=map_infos['ingame_map_size']),
+            partial(translateUnitType,unitTypeTranslation),
+            dummyUnitRotation if transform.mirrors else partial(turnUnitRotation,transform.decal_rotation_offset),
+        ) )
+
+    duplicate = partial(
+        partial(duplicate_mirror_and_rotate,"/[^/]*"),
+            targets,
+            dedup_tolerance,
+    )
+
+    mirror_rules = [
+        ( "/Scenario/MasterChain/[^/]*/Markers", duplicate ),
+        ( "/Scenario/Armies/[^/]*/[^/]*/Units/[^/]*/Units", duplicate ),
+    ]
+
+    # culling only changes the matched tables, so the rules are matched once for both passes
+    index = save_lua.PathIndex( scenario )
+    if keep_side is not None:
+        cull_save_lua_entities( [ parent[key] for _, parent, key, _ in save_lua.select( scenario, mirror_rules, index ) ],
+            mirror_axis, keep_side, map_infos['ingame_map_size'] )
+
+    # mirror Mexes and some armies in one pass
+    save_lua.update_selected( scenario, mirror_rules, index )
 
     return scenario
 
-# duplicate 'position' and 'Position' values for tables matched by regular expression
-def duplicate_mirror_and_rotate(regEx,mirror_axis,positionFunc,rotateFunc,translateUnitTypeFunc,k,v,rootTable):
-    old_tables = getTablesByPathRegex( regEx, v )
+# duplicate 'position' and 'Position' values for tables matched by path pattern,
+# once per ( target, positionFunc, translateUnitTypeFunc, rotateFunc ) of targets
+def duplicate_mirror_and_rotate(pattern,targets,dedup_tolerance,k,v,rootTable):
+    old_tables = save_lua.select_values( v, pattern )
     new_table = {}
-    for key in old_tables:
-        if key.startswith('ARMY_'):
-            new_key = 'ARMY_{}'.format(int(key[5:])+1)
-        else:
-            new_key = '{}m{}'.format(key,mirror_axis)
-        newParams = {}
-        newParams.update( old_tables[key] )
-        if 'type' in newParams:
-            unitType = newParams['type'] = translateUnitTypeFunc( newParams['type'] )
-        elif 'resource' in newParams:
-            unitType = 'mass'
-        else:
-            unitType = 'unknown'
-        if 'position' in newParams:
-            newParams['position'] = mapSaveLuaVector( partial(positionFunc,unitType), newParams['position'] )
-        elif 'Position' in newParams:
-            newParams['Position'] = mapSaveLuaVector( partial(positionFunc,unitType), newParams['Position'] )
-        if 'orientation' in newParams:
-            newParams['orientation'] = mapSaveLuaVector( partial(rotateFunc,unitType), newParams['orientation'] )
-        elif 'Orientation' in newParams:
-            newParams['Orientation'] = mapSaveLuaVector( partial(rotateFunc,unitType), newParams['Orientation'] )
-        new_table.update( {new_key: newParams} )
+    existing_entries = spatial_index.existing_entities( [ ( entry_type, x, z ) for entry_type, x, z in map( saveLuaEntryPosition, old_tables.values() ) if entry_type ], dedup_tolerance )
+    army_names = army_copy_names( [ key for key in old_tables if key.startswith('ARMY_') ], len(targets) )
+    for copy, ( mirror_axis, positionFunc, translateUnitTypeFunc, rotateFunc ) in enumerate( targets, 1 ):
+        for key in old_tables:
+            if key.startswith('ARMY_'):
+                new_key = army_names[( key, copy )]
+            else:
+                new_key = '{}m{}'.format(key,mirror_axis)
+            newParams = {}
+            newParams.update( old_tables[key] )
+            if 'type' in newParams:
+                unitType = newParams['type'] = translateUnitTypeFunc( newParams['type'] )
+            elif 'resource' in newParams:
+                unitType = 'mass'
+            else:
+                unitType = 'unknown'
+            if 'position' in newParams:
+                newParams['position'] = mapSaveLuaVector( partial(positionFunc,unitType), newParams['position'] )
+            elif 'Position' in newParams:
+                newParams['Position'] = mapSaveLuaVector( partial(positionFunc,unitType), newParams['Position'] )
+            if 'orientation' in newParams:
+                newParams['orientation'] = mapSaveLuaVector( partial(rotateFunc,unitType), newParams['orientation'] )
+            elif 'Orientation' in newParams:
+                newParams['Orientation'] = mapSaveLuaVector( partial(rotateFunc,unitType), newParams['Orientation'] )
+            # army start markers are referenced by name, so they always get their copy
+            if existing_entries and not key.startswith('ARMY_'):
+                entry_type, x, z = saveLuaEntryPosition( newParams )
+                if entry_type and existing_entries.contains( entry_type, x, z ):
+                    profiler.count('save_lua_entries_deduplicated')
+                    continue
+            new_table.update( {new_key: newParams} )
     for k2 in new_table:
         v[k2] = new_table[k2]
+    profiler.count('save_lua_entries_duplicated', len(new_table))
     return v
 
-# write the output _save.lua
-def writeSaveLua( oStream, luaTable, path='', first=False ):
-    import lupa
-    indent = "    "*(path.count('/'))
-    # try to make output look more like original
-    keys = orderedSaveLuaKeys( list(luaTable), path )
-    # iterate over lua table keys
-    for k in keys:
-        newPath = '/'.join([path,str(k)])
-        printPathDecorator(oStream,indent,newPath)
-        if keyIsWrittenAlternativly(newPath):
-            oStream.write("{}['{}'] = ".format(indent,k))
-        else:
-            oStream.write("{}{} = ".format(indent,k))
-        v = luaTable[k]
-        if lupa.lua_type(v) == 'table' or type(v) is dict:
-            if list(v) == [1,2,3]:
-                oStream.write("{{ {0:.6f}, {1:.6f}, {2:.6f} }}".format(v[1],v[2],v[3]))
-            else:
-                oStream.write("{\n")
-                writeSaveLua( oStream, v, newPath )
-                oStream.write("{}}}".format(indent))
-        elif type(v) is str:
-            if v[:5] in ['FLOAT','BOOLE','STRIN','VECTO']:
-                oStream.write("{}".format(v))
-            else:
-                oStream.write("'{}'".format(v))
-        elif type(v) is int:
-            oStream.write("{}".format(v))
-        elif lupa.lua_type(v) == 'function':
-            oStream.write("GROUP {\n")
-            writeSaveLua( oStream, v(), newPath )
-            oStream.write("{}}}".format(indent))
-        elif type(v) is tuple:
-            oStream.write("{{ {:.6f}, {:.6f}, {:.6f} }}".format(*v))
-        else:
-            raise Exception("Unknown format {} at {} ".format(type(v),newPath))
-        if not first:
-            oStream.write(",\n")
-
-# try to make output look more like original
-# by enforcing some predefined order
-def orderedSaveLuaKeys( keys, path ):
-    pathDepth = path.count('/')
-    oldKeys = copy.copy(sorted(keys))
-    new_keys = []
-    if path == '/Scenario':
-        for k in [
-            'next_area_id','Props','Areas',
-            'MasterChain','Chains',
-            'next_queue_id','Orders',
-            'next_platoon_id', 'Platoons',
-            'next_army_id','next_group_id','next_unit_id',
-            'Armies']:
-            if k in oldKeys:
-                oldKeys.remove(k)
-                new_keys.append(k)
-        new_keys += oldKeys
-        return new_keys
-    elif path.startswith('/Scenario/MasterChain/'):
-        for k in [
-            'size', 'resource', 'amount', 'color', 'editorIcon',
-            'type','prop',
-            'orientation','position']:
-            if k in oldKeys:
-                oldKeys.remove(k)
-                new_keys.append(k)
-        new_keys += oldKeys
-        return new_keys
-    elif path.startswith('/Scenario/Armies/'):
-        for k in [
-            'mass', 'energy',
-            'personality', 'plans', 'color', 'faction', 'Economy', 'Alliances',
-            'type', 'orders','platoon',
-            'Units','Position','Orientation',
-            'PlatoonBuilders', 'next_platoon_builder_id']:
-            if k in oldKeys:
-                oldKeys.remove(k)
-                new_keys.append(k)
-        new_keys += oldKeys
-        return new_keys
-    else:
-        return oldKeys
-
-# try to make output look more like original
-# by adding theses huge comment sections
-def printPathDecorator( oStream, indent, path ):
-    fmt = "{0:}--[["+" "*75+"]]--\n{0:}--[[  {1: <73}]]--\n{0:}--[["+" "*75+"]]--\n"
-    s = ''
-    if path == '/Scenario':
-        s += fmt.format( indent, "Automatically generated code (do not edit)" )
-        s += fmt.format( indent, "Scenario" )
-    elif path == '/Scenario/Props':
-        s += fmt.format( indent, "Props" )
-    elif path == '/Scenario/Areas':
-        s += fmt.format( indent, "Areas" )
-    elif path == '/Scenario/MasterChain':
-        s += fmt.format( indent, "Markers" )
-    elif path == '/Scenario/next_queue_id':
-        s += fmt.format( indent, "Orders" )
-    elif path == '/Scenario/next_platoon_id':
-        s += fmt.format( indent, "Platoons" )
-    elif path == '/Scenario/next_army_id':
-        s += fmt.format( indent, "Armies" )
-    elif path.startswith('/Scenario/Armies/') and path.count('/') == 3:
-        s += fmt.format( indent, "Army" )
-    if s:
-        oStream.write(s)
-
-# try to make output look more like original
-# by alternating writings e.g. Units and ['Units']
-def keyIsWrittenAlternativly(path):
-    pathDepth = path.count('/')
-    if path.startswith('/Scenario/MasterChain/'):
-        if pathDepth != 4:
-            return True
-    if path.startswith('/Scenario/Chains/'):
-        if pathDepth != 4:
-            return True
-    if path.startswith('/Scenario/Armies/'):
-        if pathDepth == 3:
-            return True
-        if pathDepth == 4 and path.endswith('/Units'):
-            return True
-        if pathDepth == 6:
-            return True
-        if pathDepth == 8:
-            return True
-    return False
+# names of the army start marker copies by ( army, copy ), armies of the kept side are followed
+# by their copies like ARMY_1 by ARMY_2 as long as no name is taken twice, otherwise the copies
+# are numbered after the highest kept army, one block of armies per copy
+def army_copy_names( armies, copies ):
+    names = { ( army, copy ): 'ARMY_{}'.format(int(army[5:])+copy) for army in armies for copy in range( 1, copies+1 ) }
+    if len( set( names.values() ) | set( armies ) ) == len( names ) + len( armies ):
+        return names
+    armies = sorted( armies, key=lambda army: int(army[5:]) )
+    highest = int(armies[-1][5:])
+    return { ( army, copy ): 'ARMY_{}'.format(highest+(copy-1)*len(armies)+index+1)
+        for index, army in enumerate( armies ) for copy in range( 1, copies+1 ) }
+
+def saveLuaVectorXZ( value ):
+    if type(value) is dict:
+        if list(value) == [1,2,3]:
+            return ( value[1], value[3] )
+    elif type(value) is save_lua.Vector3:
+        return ( value[0], value[2] )
+    return None
+
+# ( type, x, z ) of a marker or unit, type is None without position
+def saveLuaEntryPosition( entry ):
+    if not isinstance( entry, dict ):
+        return ( None, None, None )
+    position = saveLuaVectorXZ( entry.get( 'position', entry.get( 'Position' ) ) )
+    if position is None:
+        return ( None, None, None )
+    return ( entry.get( 'type', 'mass' if 'resource' in entry else 'unknown' ), position[0], position[1] )
+
+# remove markers and units on the side that gets overwritten from the given tables
+def cull_save_lua_entities( tables, mirror_axis, keep_side, map_size ):
+    entities = []
+    for table_index, table in enumerate( tables ):
+        for key, entry in table.items():
+            entry_type, x, z = saveLuaEntryPosition( entry )
+            if entry_type is not None:
+                entities.append( ( ( table_index, key ), x, z, 0 ) )
+    for table_index, key in spatial_index.discarded_entities( entities, mirror_axis, keep_side, map_size ):
+        del tables[table_index][key]
+        profiler.count('save_lua_entries_culled')
 
 def mapSaveLuaVector( mirrorFunc, value ):
-    import lupa
-    if lupa.lua_type(value) == 'table':
+    if type(value) is dict:
         if list(value) == [1,2,3]:
             value = mirrorFunc((value[1],value[2],value[3]))
-    elif value.startswith('VECTOR3'):
-        value = eval(value[7:])
-        value = mirrorFunc(value)
-        return "VECTOR3( {}, {}, {} )".format(*value)
+    elif type(value) is save_lua.Vector3:
+        value = save_lua.Vector3(*mirrorFunc(value))
     return value
 
-# helper function to traverse lua data by regular expression
-def getTablesByPathRegex( regEx, luaTable, path='' ):
-    import lupa
-    ret = {}
-    for key in list(luaTable):
-        v = luaTable[key]
-        newPath = '/'.join([path,str(key)])
-        if regEx.match( newPath ):
-            ret.update({key:v})
-        elif lupa.lua_type(v) == 'table':
-            ret.update(getTablesByPathRegex( regEx, v, newPath ))
-    return ret
-
-# update values for tables matched by regular expression
-def change_value_by_path_regex( regEx, func, luaTable, rootTable=None, path='' ):
-    import lupa
-    if not rootTable: rootTable = luaTable
-    for key in list(luaTable):
-        v = luaTable[key]
-        newPath = '/'.join([path,str(key)])
-        if regEx.match( newPath ):
-            luaTable[key] = func( key, v, rootTable )
-        elif lupa.lua_type(v) == 'table':
-            change_value_by_path_regex( regEx, func, v, rootTable, newPath )
-        elif lupa.lua_type(v) == 'function':
-            change_value_by_path_regex( regEx, func, v(), rootTable, newPath )
-
-class MapParsingException(Exception):
-    def __init__( self, subject, fileObject ):
-        self.offset = fileObject.tell()
-        self.message = "Couldn't parse {} before offset {} ".format( subject, self.offset )
-        super(Exception, self).__init__( self.message )
-
-def write_output_scmap( path_to_old_scmap, path_to_new_scmap, infos ):
-    with open(path_to_old_scmap,'rb') as scmap:
-        with open(path_to_new_scmap,'wb') as new_scmap:
-            decals_written = False
-
-            scmap.seek( 0, os.SEEK_END )
-            old_scmap_file_size = scmap.tell()
-            scmap.seek( 0 )
-
-            image_sections = list(infos['images'])
-            while len(image_sections) > 0:
-
-                # find image section with lowest start offset
-                read_cursor = scmap.tell()
-                min_start_offset = old_scmap_file_size
-                min_start_offset_image_name = 'invalid'
-                for image_name in image_sections:
-                    start_offset = infos['offsets']['{}_start'.format(image_name)]
-                    if start_offset < min_start_offset:
-                        min_start_offset = start_offset
-                        min_start_offset_image_name = image_name
-
-                assert( min_start_offset_image_name != 'invalid' )
-                image_sections.remove( min_start_offset_image_name )
-
-                image_name = min_start_offset_image_name
-
-                start_offset = infos['offsets']['{}_start'.format(image_name)]
-                has_length_prefix = infos['offsets']['{}_length_prefix'.format(image_name)]
-                end_offset = infos['offsets']['{}_end'.format(image_name)]
-                image = infos['images'][image_name]
-                want_seek = start_offset
-
-                while scmap.tell() < want_seek:
-                    # fill in decals
-                    if not decals_written and want_seek > infos['offsets']['decals_start']:
-                        new_scmap.write( scmap.read( infos['offsets']['decals_start'] - scmap.tell() ))
-                        write_decals( new_scmap, infos['decals'] )
-                        decals_written = True
-                        scmap.seek(infos['offsets']['decals_end'])
-                        continue
-                    else:
-                        new_scmap.write( scmap.read( want_seek - scmap.tell() ))
-                        break
-                if has_length_prefix:
-                    new_scmap.write(pack('I',len(image.data)))
-                new_scmap.write( image.data )
-                scmap.seek( end_offset )
-            if scmap.tell() < infos["propsBlockStartOffset"]:
-                new_scmap.write( scmap.read( infos["propsBlockStartOffset"] - scmap.tell() ))
-            write_props( new_scmap, infos['props'] )
-
-def write_decals( new_scmap, decalsList ):
-    new_scmap.write(pack('I',len(decalsList)))
-    for decal in decalsList:
+# unchanged byte range of the old scmap which goes to the new scmap as is
+CopyRange = namedtuple( 'CopyRange', [ 'start', 'end' ] )
+# image which gets loaded when it's written
+ImageSection = namedtuple( 'ImageSection', [ 'name', 'has_length_prefix' ] )
+
+# chunk size used when neither copy_file_range nor sendfile can be used
+COPY_BUFFER_SIZE = 1024*1024
+
+# best available way to copy unchanged byte ranges,
+# falls back to the next one if the file system doesn't support it
+COPY_RANGE_METHODS = [ m for m in [ 'copy_file_range', 'sendfile' ] if hasattr( os, m ) ] + [ 'read' ]
+COPY_RANGE_FALLBACK_ERRNOS = [ errno.EXDEV, errno.ENOSYS, errno.EINVAL, errno.EBADF, errno.ENOTSOCK, errno.ENOTSUP, errno.EOPNOTSUPP ]
+
+# max number of buffers passed to a single writev call
+try:
+    IOV_MAX = os.sysconf('SC_IOV_MAX')
+except ( AttributeError, ValueError, OSError ):
+    IOV_MAX = 1024
+
+# compute the layout of the new scmap as list of CopyRange and buffers
+def output_scmap_layout( infos, streaming=False ):
+    layout = []
+    decals_written = False
+    cursor = 0
+
+    # image sections ordered by start offset
+    image_sections = sorted( infos['images'], key=lambda image_name: infos['offsets']['{}_start'.format(image_name)] )
+    for image_name in image_sections:
+        start_offset = infos['offsets']['{}_start'.format(image_name)]
+        has_length_prefix = infos['offsets']['{}_length_prefix'.format(image_name)]
+        end_offset = infos['offsets']['{}_end'.format(image_name)]
+
+        if cursor < start_offset:
+            # fill in decals
+            if not decals_written and start_offset > infos['offsets']['decals_start']:
+                layout.append( CopyRange( cursor, infos['offsets']['decals_start'] ) )
+                layout += pack_decals( infos['decals'] )
+                decals_written = True
+                cursor = infos['offsets']['decals_end']
+            if cursor < start_offset:
+                layout.append( CopyRange( cursor, start_offset ) )
+        if streaming:
+            layout.append( ImageSection( image_name, has_length_prefix ) )
+        else:
+            image = infos['images'][image_name]
+            if has_length_prefix:
+                layout.append( pack('I',len(image.data)) )
+            layout.append( image.data )
+        cursor = end_offset
+
+    if cursor < infos["propsBlockStartOffset"]:
+        layout.append( CopyRange( cursor, infos["propsBlockStartOffset"] ) )
+    layout += pack_props( infos['props'] )
+    return layout
+
+# scmap_source as in read_scmap(), new_scmap_target is a path or a writable binary stream,
+# without it the output is returned as bytes,
+# with image_loader( name ) images are loaded one by one while writing
+def write_output_scmap( scmap_source, new_scmap_target, infos, image_loader=None ):
+    layout = output_scmap_layout( infos, streaming=image_loader is not None )
+    with open_scmap( scmap_source, buffering=0 ) as scmap:
+        if new_scmap_target is None:
+            new_scmap = io.BytesIO()
+            write_scmap_layout( scmap, new_scmap, layout, image_loader )
+            return new_scmap.getvalue()
+        elif hasattr( new_scmap_target, 'write' ):
+            write_scmap_layout( scmap, new_scmap_target, layout, image_loader )
+        else:
+            with open(new_scmap_target,'wb',buffering=0) as new_scmap:
+                write_scmap_layout( scmap, new_scmap, layout, image_loader )
+
+def write_scmap_layout( scmap, new_scmap, layout, image_loader=None ):
+    buffers = []
+    copy_method = COPY_RANGE_METHODS[0]
+    for item in layout:
+        if type(item) is CopyRange:
+            write_buffers( new_scmap, buffers )
+            buffers = []
+            copy_method = copy_range( scmap, new_scmap, item.start, item.end, copy_method )
+        elif type(item) is ImageSection:
+            image = image_loader( item.name )
+            if type(image) is TiledGrayImage:
+                if item.has_length_prefix:
+                    buffers.append( pack('I',image.length) )
+                for tile in image.tiles():
+                    buffers.append( tile )
+                    write_buffers( new_scmap, buffers )
+                    buffers = []
+                continue
+            if item.has_length_prefix:
+                buffers.append( pack('I',len(image.data)) )
+            buffers.append( image.data )
+            # write now, so only one image is in memory at a time
+            write_buffers( new_scmap, buffers )
+            buffers = []
+            image = None
+        else:
+            buffers.append( item )
+    write_buffers( new_scmap, buffers )
+
+# file descriptor of unbuffered files, other streams are only used through their methods
+def raw_fileno( stream ):
+    return stream.fileno() if isinstance( stream, io.FileIO ) else None
+
+# copy byte range of one file to the current position of another file,
+# kernel to kernel if the platform allows it, returns the method which worked
+# so further ranges between the same two files start with it
+def copy_range( scmap, new_scmap, start_offset, end_offset, copy_range_method=COPY_RANGE_METHODS[0] ):
+    offset = start_offset
+    if raw_fileno( scmap ) is None or raw_fileno( new_scmap ) is None:
+        while offset < end_offset:
+            copied = copy_range_buffered( scmap, new_scmap, offset, end_offset - offset )
+            if copied == 0:
+                raise Exception("Premature end of file at {} bytes offset".format(offset))
+            offset += copied
+        return copy_range_method
+    while offset < end_offset:
+        count = end_offset - offset
+        try:
+            if copy_range_method == 'copy_file_range':
+                copied = os.copy_file_range( scmap.fileno(), new_scmap.fileno(), count, offset )
+            elif copy_range_method == 'sendfile':
+                copied = os.sendfile( new_scmap.fileno(), scmap.fileno(), offset, count )
+            else:
+                copied = copy_range_buffered( scmap, new_scmap, offset, count )
+        except OSError as e:
+            if copy_range_method == 'read' or e.errno not in COPY_RANGE_FALLBACK_ERRNOS:
+                raise e
+            copied = 0
+        if copied == 0:
+            if copy_range_method == 'read':
+                raise Exception("Premature end of file at {} bytes offset".format(offset))
+            # not supported for this file system or file type, fall back to next method
+            copy_range_method = COPY_RANGE_METHODS[ COPY_RANGE_METHODS.index( copy_range_method ) + 1 ]
+            continue
+        offset += copied
+    return copy_range_method
+
+def copy_range_buffered( scmap, new_scmap, offset, count ):
+    buf = bytearray( min( count, COPY_BUFFER_SIZE ) )
+    scmap.seek( offset )
+    copied = scmap.readinto( buf )
+    write_buffers( new_scmap, [ memoryview(buf)[:copied] ] )
+    return copied
+
+# write all buffers with as few (vectored) writes as possible
+def write_buffers( new_scmap, buffers ):
+    buffers = [ memoryview(b).cast('B') for b in buffers if len(b) ]
+    if not hasattr( os, 'writev' ) or raw_fileno( new_scmap ) is None:
+        for b in buffers:
+            while len(b):
+                b = b[new_scmap.write( b ):]
+        return
+    first = 0
+    while first < len(buffers):
+        written = os.writev( new_scmap.fileno(), buffers[first:first+IOV_MAX] )
+        # skip fully written buffers, keep rest of a partially written one
+        while first < len(buffers) and written >= len(buffers[first]):
+            written -= len(buffers[first])
+            first += 1
+        if written:
+            buffers[first] = buffers[first][written:]
+
+COUNT_STRUCT = Struct('I')
+
+# precompiled structs for one decal or prop record, by length of the contained paths
+# standard sizes without alignment, paths are packed as part of the record
+record_structs = {}
+def decal_struct( texture1_path_length, texture2_path_length ):
+    key = ( 'decal', texture1_path_length, texture2_path_length )
+    if key not in record_structs:
+        record_structs[key] = Struct( '=IIII{}sI{}sfffffffffffI'.format( texture1_path_length, texture2_path_length ) )
+    return record_structs[key]
+
+def prop_struct( blueprint_path_length ):
+    key = ( 'prop', blueprint_path_length )
+    if key not in record_structs:
+        # blueprint path is zero terminated
+        record_structs[key] = Struct( '={}sxfffffffffffffff'.format( blueprint_path_length ) )
+    return record_structs[key]
+
+# serialize decals block into one exactly sized buffer
+def pack_decals( decalsList ):
+    lengths = [ ( len(decal[3]), len(decal[4]) ) for decal in decalsList ]
+    structs_by_lengths = { l: decal_struct( *l ) for l in set( lengths ) }
+    structs = [ structs_by_lengths[l] for l in lengths ]
+    buffer = bytearray( COUNT_STRUCT.size + sum( s.size for s in structs ) )
+    COUNT_STRUCT.pack_into( buffer, 0, len(decalsList) )
+    offset = COUNT_STRUCT.size
+    for decal, decal_struct_ in zip( decalsList, structs ):
         (
             decal_id,decalType,unknown15,
             decals_texture1_path,decals_texture2_path,
             scale,position,rotation,
             cut_off_lod,near_cut_off_lod,remove_tick
         ) = decal
-        decalRaw = pack('IIII',decal_id,decalType,unknown15,len(decals_texture1_path))
-        decalRaw += decals_texture1_path
-        decalRaw += pack('I',len(decals_texture2_path))
-        if decals_texture2_path:
-            decalRaw += decals_texture2_path
-        decalRaw += pack('fffffffff',*scale,*position,*rotation)
-        decalRaw += pack('ffI',cut_off_lod,near_cut_off_lod,remove_tick)
-        new_scmap.write(decalRaw)
-
-def write_props( new_scmap, propsList ):
-    new_scmap.write(pack('I',len(propsList)))
-    for prop in propsList:
+        # fields are passed one by one, unpacking with * is notably slower
+        decal_struct_.pack_into( buffer, offset,
+            decal_id, decalType, unknown15,
+            len(decals_texture1_path), decals_texture1_path,
+            len(decals_texture2_path), decals_texture2_path,
+            scale[0], scale[1], scale[2],
+            position[0], position[1], position[2],
+            rotation[0], rotation[1], rotation[2],
+            cut_off_lod, near_cut_off_lod, remove_tick )
+        offset += decal_struct_.size
+    return [ buffer ]
+
+# serialize props block into one exactly sized buffer
+def pack_props( propsList ):
+    lengths = [ len(prop[0]) for prop in propsList ]
+    structs_by_length = { l: prop_struct( l ) for l in set( lengths ) }
+    structs = [ structs_by_length[l] for l in lengths ]
+    buffer = bytearray( COUNT_STRUCT.size + sum( s.size for s in structs ) )
+    COUNT_STRUCT.pack_into( buffer, 0, len(propsList) )
+    offset = COUNT_STRUCT.size
+    for prop, prop_struct_ in zip( propsList, structs ):
         (blueprintPath,position,rotationX,rotationY,rotationZ,scale) = prop
-        new_scmap.write(blueprintPath)
-        new_scmap.write(b'\0')
-        new_scmap.write(pack('fffffffffffffff',*(*position,*rotationX,*rotationY,*rotationZ,*scale)))
+        prop_struct_.pack_into( buffer, offset, blueprintPath,
+            position[0], position[1], position[2],
+            rotationX[0], rotationX[1], rotationX[2],
+            rotationY[0], rotationY[1], rotationY[2],
+            rotationZ[0], rotationZ[1], rotationZ[2],
+            scale[0], scale[1], scale[2] )
+        offset += prop_struct_.size
+    return [ buffer ]
 
 if __name__ == '__main__':
     main()
@@ -0,0 +1,86 @@
+#!/usr/bin/env python
+# keeps mirror_map.py loaded and runs jobs given as JSON lines, one after another
+#
+# job:      { "id": ..., "cwd": "/path", "args": [ "in.scmap", "out.scmap", "--mirror-axis=x", ... ] }
+# response: { "id": ..., "status": "ok" | "error", "output": "...", "error": "...", "seconds": 1.5 }
+
+import contextlib
+import io
+import json
+import os
+import signal
+import socketserver
+import sys
+import time
+import traceback
+
+# --serve and the abbreviations docopt takes for it, a job starting another server would
+# read the jobs meant for this one
+def is_serve_option( arg ):
+    return len( arg ) > 3 and '--serve'.startswith( arg )
+
+def run_job( run, line ):
+    start = time.perf_counter()
+    output = io.StringIO()
+    response = { 'status': 'ok' }
+    try:
+        job = json.loads( line )
+        response['id'] = job.get( 'id' )
+        args = [ str(arg) for arg in job['args'] ]
+        if any( is_serve_option( arg ) for arg in args ):
+            raise Exception("--serve can't be run as a job")
+        cwd = os.getcwd()
+        try:
+            os.chdir( job.get( 'cwd', cwd ) )
+            with contextlib.redirect_stdout( output ):
+                run( args )
+        finally:
+            os.chdir( cwd )
+    except SystemExit as e:
+        # docopt exits on usage errors and --help
+        if e.code:
+            response.update( status='error', error=str(e.code) )
+    except Exception as e:
+        response.update( status='error', error='{}: {}'.format( e.__class__.__name__, e ), traceback=traceback.format_exc() )
+    response['output'] = output.getvalue()
+    response['seconds'] = time.perf_counter() - start
+    return json.dumps( response ) + '\n'
+
+def serve_stream( run, lines, out ):
+    for line in lines:
+        if line.strip():
+            out.write( run_job( run, line ) )
+            out.flush()
+
+def stop_serving( signum, frame ):
+    raise SystemExit( 0 )
+
+# one connection at a time, so jobs never run side by side in this process
+def serve_socket( run, socket_path ):
+    class JobHandler( socketserver.StreamRequestHandler ):
+        def handle( self ):
+            for line in self.rfile:
+                if line.strip():
+                    self.wfile.write( run_job( run, line.decode() ).encode() )
+                    self.wfile.flush()
+
+    if os.path.exists( socket_path ):
+        os.remove( socket_path )
+    with socketserver.UnixStreamServer( socket_path, JobHandler ) as server:
+        print("Waiting for jobs on {}".format(socket_path))
+        # service managers stop daemons with SIGTERM, which has to remove the socket as well,
+        # server.shutdown() would wait for serve_forever() in this very thread
+        previous_handler = signal.signal( signal.SIGTERM, stop_serving )
+        try:
+            server.serve_forever()
+        except KeyboardInterrupt:
+            pass
+        finally:
+            signal.signal( signal.SIGTERM, previous_handler )
+            os.remove( socket_path )
+
+def serve( run, socket_path=None ):
+    if socket_path:
+        serve_socket( run, socket_path )
+    else:
+        serve_stream( run, sys.stdin, sys.stdout )
@@ -0,0 +1,109 @@
+#!/usr/bin/env python
+# mirror axes as matrices, applied to positions and orientations of many props and decals at once
+
+import math
+
+# copies every symmetry mode writes, reflections write one and rotations one per turn
+SYMMETRY_TARGETS = {
+    'x': [ 'x' ],
+    'y': [ 'y' ],
+    'xy': [ 'xy' ],
+    'yx': [ 'yx' ],
+    'rot2': [ 'rot180' ],
+    'rot4': [ 'rot90', 'rot180', 'rot270' ],
+}
+
+ROTATION_MODES = [ 'rot2', 'rot4' ]
+
+# every copy a symmetry mode can write
+SYMMETRY_COPIES = [ 'x', 'y', 'xy', 'yx', 'rot90', 'rot180', 'rot270' ]
+
+# error for an axis or copy the caller doesn't know, expected lists the ones it does
+def unknown_mirror_axis( mirror_axis, expected ):
+    return ValueError("unknown mirror axis {!r}, expected one of {}".format( mirror_axis, ', '.join( expected ) ))
+
+def symmetry_targets( mirror_axis ):
+    if mirror_axis not in SYMMETRY_TARGETS:
+        raise unknown_mirror_axis( mirror_axis, SYMMETRY_TARGETS )
+    return SYMMETRY_TARGETS[mirror_axis]
+
+# ( x, z ) -> ( a*x + b*z + offset_x, c*x + d*z + offset_z ), offsets in ( width-1, height-1 ) units,
+# m is width / height which stretches the diagonals of non square maps
+def axis_position_matrix( mirror_axis, m ):
+    if mirror_axis == 'x':
+        return ( ( -1, 0 ), ( 0, 1 ) ), ( 1, 0 )
+    elif mirror_axis == 'y':
+        return ( ( 1, 0 ), ( 0, -1 ) ), ( 0, 1 )
+    elif mirror_axis == 'xy':
+        return ( ( 0, m ), ( 1/m, 0 ) ), ( 0, 0 )
+    elif mirror_axis == 'yx':
+        return ( ( 0, -m ), ( -1/m, 0 ) ), ( 1, 1 )
+    elif mirror_axis == 'rot90':
+        return ( ( 0, -m ), ( 1/m, 0 ) ), ( 1, 0 )
+    elif mirror_axis == 'rot180':
+        return ( ( -1, 0 ), ( 0, -1 ) ), ( 1, 1 )
+    elif mirror_axis == 'rot270':
+        return ( ( 0, m ), ( -1/m, 0 ) ), ( 0, 1 )
+    raise unknown_mirror_axis( mirror_axis, SYMMETRY_COPIES )
+
+# signs of decal rotation around x, taken over from the old per axis rotate_decal()
+DECAL_TILT_SIGNS = { 'x': -1, 'y': 1, 'xy': -1, 'yx': -1, 'rot90': 1, 'rot180': 1, 'rot270': 1 }
+
+# decal textures get mirrored at the xy diagonal once, every axis is that plus a rotation
+DECAL_TEXTURE_MIRROR = ( ( 0, 1 ), ( 1, 0 ) )
+
+PROP_LOCAL_MIRROR = ( ( -1, 0, 0 ), ( 0, 1, 0 ), ( 0, 0, 1 ) )
+
+def matrix_product( a, b ):
+    return tuple( tuple( sum( a[i][k]*b[k][j] for k in range( len(b) ) ) for j in range( len(b[0]) ) ) for i in range( len(a) ) )
+
+# 2d matrix in ( x, z ) as 3d matrix leaving y alone
+def xz_matrix( matrix ):
+    ( a, b ), ( c, d ) = matrix
+    return ( ( a, 0, b ), ( 0, 1, 0 ), ( c, 0, d ) )
+
+class MirrorTransform( object ):
+    def __init__( self, mirror_axis, size ):
+        width, height = size
+        self.mirror_axis = mirror_axis
+        self.linear, offset = axis_position_matrix( mirror_axis, width / height )
+        self.offset = ( offset[0] * (width-1), offset[1] * (height-1) )
+        # orientations only see the direction of the axis, not the stretch of non square maps
+        self.orientation = tuple( tuple( ( value > 0 ) - ( value < 0 ) for value in row ) for row in self.linear )
+        transposed3 = tuple( zip( *xz_matrix( self.orientation ) ) )
+        # prop rotation rows are the local axes, so the whole prop is turned by rows * transposed,
+        # reflections mirror the mesh at its local yz plane as well to stay a rotation, for
+        # left/right symmetric meshes that's the mirrored prop
+        ( a, b ), ( c, d ) = self.orientation
+        # only reflections need mirrored meshes and decal textures
+        self.mirrors = a*d - b*c < 0
+        self.prop_left = PROP_LOCAL_MIRROR if self.mirrors else xz_matrix( ( ( 1, 0 ), ( 0, 1 ) ) )
+        self.prop_right = transposed3
+        texture = matrix_product( self.orientation, DECAL_TEXTURE_MIRROR ) if self.mirrors else self.orientation
+        self.decal_rotation_offset = math.atan2( texture[1][0], texture[0][0] )
+        self.decal_tilt_sign = DECAL_TILT_SIGNS[mirror_axis]
+
+    def positions( self, positions ):
+        ( a, b ), ( c, d ) = self.linear
+        offset_x, offset_z = self.offset
+        return [ ( a*p[0] + b*p[2] + offset_x, p[1], c*p[0] + d*p[2] + offset_z ) for p in positions ]
+
+    # ( rotationX, rotationY, rotationZ ) rows of props
+    def prop_rotations( self, rotations ):
+        left, right = self.prop_left, self.prop_right
+        return [ matrix_product( matrix_product( left, rotation ), right ) for rotation in rotations ]
+
+    # ( x, y, z ) euler angles of decals, mirrored decal textures assumed for reflections
+    def decal_rotations( self, rotations ):
+        offset, tilt_sign = self.decal_rotation_offset, self.decal_tilt_sign
+        if not self.mirrors:
+            return [ ( r[0], r[1] + offset, r[2] ) for r in rotations ]
+        return [ ( r[2], offset - r[1], tilt_sign * r[0] ) for r in rotations ]
+
+MIRROR_TRANSFORMS = {}
+
+def mirror_transform( mirror_axis, size ):
+    key = ( mirror_axis, tuple(size) )
+    if key not in MIRROR_TRANSFORMS:
+        MIRROR_TRANSFORMS[key] = MirrorTransform( mirror_axis, size )
+    return MIRROR_TRANSFORMS[key]
@@ -0,0 +1,78 @@
+#!/usr/bin/env python
+# wall time, cpu time and peak traced memory of nested phases
+
+import contextlib
+import json
+import time
+import tracemalloc
+
+class PhaseProfiler( object ):
+    def __init__( self, enabled=False ):
+        self.started_tracemalloc = False
+        self.reset( enabled )
+    # forget phases and counters of an earlier run
+    def reset( self, enabled=False ):
+        self.enabled = enabled
+        self.phases = {}
+        self.counters = {}
+        self.stack = []
+        self.traced_memory = False
+    def start( self ):
+        if self.enabled and not tracemalloc.is_tracing():
+            tracemalloc.start()
+            self.started_tracemalloc = True
+        self.traced_memory = tracemalloc.is_tracing()
+    def stop( self ):
+        if self.started_tracemalloc:
+            tracemalloc.stop()
+            self.started_tracemalloc = False
+    def count( self, name, n=1 ):
+        if self.enabled:
+            self.counters[name] = self.counters.get( name, 0 ) + n
+    @contextlib.contextmanager
+    def phase( self, name ):
+        if not self.enabled:
+            yield
+            return
+        if self.stack:
+            name = '{}/{}'.format( self.stack[-1]['name'], name )
+        tracing = tracemalloc.is_tracing()
+        if tracing:
+            current, peak = tracemalloc.get_traced_memory()
+            if self.stack:
+                self.stack[-1]['peak'] = max( self.stack[-1]['peak'], peak )
+            # without reset_peak (python < 3.9) peaks of earlier phases leak into later ones
+            if hasattr( tracemalloc, 'reset_peak' ):
+                tracemalloc.reset_peak()
+        else:
+            current = 0
+        # phases are reported in the order they were entered
+        phase = self.phases.setdefault( name, { 'calls': 0, 'wall_seconds': 0.0, 'cpu_seconds': 0.0, 'peak_traced_bytes': 0, 'peak_traced_bytes_above_start': 0 } )
+        entry = { 'name': name, 'peak': current, 'start_traced': current }
+        self.stack.append( entry )
+        wall_start = time.perf_counter()
+        cpu_start = time.process_time()
+        try:
+            yield
+        finally:
+            wall = time.perf_counter() - wall_start
+            cpu = time.process_time() - cpu_start
+            self.stack.pop()
+            if tracing:
+                entry['peak'] = max( entry['peak'], tracemalloc.get_traced_memory()[1] )
+                if self.stack:
+                    self.stack[-1]['peak'] = max( self.stack[-1]['peak'], entry['peak'] )
+            phase['calls'] += 1
+            phase['wall_seconds'] += wall
+            phase['cpu_seconds'] += cpu
+            phase['peak_traced_bytes'] = max( phase['peak_traced_bytes'], entry['peak'] )
+            phase['peak_traced_bytes_above_start'] = max( phase['peak_traced_bytes_above_start'], entry['peak'] - entry['start_traced'] )
+    def report( self ):
+        return {
+            'phases': self.phases,
+            'counters': self.counters,
+            'traced_memory': self.traced_memory,
+        }
+    def write_report( self, path ):
+        with open( path, 'w' ) as report:
+            json.dump( self.report(), report, indent=2 )
@@ -0,0 +1,98 @@
+#!/usr/bin/env python
+# preview image rendered from the heightmap with the lighting and water of the map,
+# so the mirrored side isn't lit from the wrong direction
+
+import math
+from operator import add, itemgetter
+from struct import pack
+
+DDSMAGIC = b'DDS '
+
+# there are no textures in the heightmap, land is a plain gray lit by the map's lights
+LAND_COLOR = ( 0.5, 0.5, 0.5 )
+# water surface color at the shore, fading in towards the abyss elevation
+SHORE_WATER_OPACITY = 0.5
+
+# most heightmap pixels per preview pixel and axis which get averaged, big maps only
+# get a grid of samples out of every block
+MAX_BLOCK_SAMPLES = 4
+
+# first heightmap pixel of every preview row or column and the offsets sampled from there
+def block_samples( map_length, preview_length ):
+    block_length = max( map_length // preview_length, 1 )
+    samples = min( block_length, MAX_BLOCK_SAMPLES )
+    return [ i * map_length // preview_length for i in range( preview_length ) ], [ i * block_length // samples for i in range( samples ) ]
+
+# mean world height under every preview pixel, heights is a memoryview of the ( width+1 ) x ( height+1 )
+# heightmap, maps smaller than the preview repeat their pixels
+def downsample_heights( heights, map_size, preview_size, height_scale ):
+    map_width, map_height = map_size
+    preview_width, preview_height = preview_size
+    stride = map_width + 1
+    column_starts, column_offsets = block_samples( map_width, preview_width )
+    row_starts, row_offsets = block_samples( map_height, preview_height )
+    # one C level gather of a whole preview row per sampled column of a block
+    column_getters = [ itemgetter( *[ start + dx for start in column_starts ] ) for dx in column_offsets ]
+    scale = height_scale / ( len(column_offsets) * len(row_offsets) )
+    downsampled = []
+    for row_start in row_starts:
+        sums = [ 0 ] * preview_width
+        for dy in row_offsets:
+            row = heights[(row_start+dy)*stride:(row_start+dy+1)*stride]
+            for column_getter in column_getters:
+                sums = list( map( add, sums, column_getter( row ) ) )
+        downsampled += [ value * scale for value in sums ]
+    return downsampled
+
+def normalized( vector ):
+    length = math.sqrt( sum( c*c for c in vector ) ) or 1
+    return tuple( c / length for c in vector )
+
+# BGRA pixels of hillshaded heights, spacing is the distance of preview pixels in map units,
+# computed a row at a time
+def render_preview( heights, preview_size, spacing, lighting, water ):
+    width, height = preview_size
+    spacing_x, spacing_z = spacing
+    light_x, light_y, light_z = normalized( lighting['direction'] )
+    ambience = lighting['ambience_color']
+    light = [ c * lighting['multiplier'] for c in lighting['color'] ]
+    elevation = water['elevation'] if water['has_water'] else -math.inf
+    water_depth = max( elevation - water['elevation_abyss'], 1e-6 )
+    surface = [ min( c, 1 ) for c in water['surface_color'] ]
+    # central differences, one sided at the borders
+    columns = range( width )
+    lefts = [ max( x-1, 0 ) for x in columns ]
+    rights = [ min( x+1, width-1 ) for x in columns ]
+    x_factors = [ 1 / ( ( rights[x] - lefts[x] or 1 ) * spacing_x ) for x in columns ]
+    pixels = bytearray( width * height * 4 )
+    pixels[3::4] = b'\xff' * ( width * height )
+    for y in range( height ):
+        above, below = max( y-1, 0 ), min( y+1, height-1 )
+        z_factor = 1 / ( ( below - above or 1 ) * spacing_z )
+        row = heights[y*width:(y+1)*width]
+        row_above = heights[above*width:(above+1)*width]
+        row_below = heights[below*width:(below+1)*width]
+        slopes_x = [ ( row[r] - row[l] ) * f for l, r, f in zip( lefts, rights, x_factors ) ]
+        slopes_z = [ ( b - a ) * z_factor for a, b in zip( row_above, row_below ) ]
+        # surface normal ( -slope_x, 1, -slope_z ) against the light
+        shades = [ max( ( light_y - sx*light_x - sz*light_z ) / math.sqrt( 1 + sx*sx + sz*sz ), 0 ) for sx, sz in zip( slopes_x, slopes_z ) ]
+        # how much water covers the land, 0 above water elevation
+        opacities = [ 0 if h >= elevation else SHORE_WATER_OPACITY + ( 1 - SHORE_WATER_OPACITY ) * min( ( elevation - h ) / water_depth, 1 ) for h in row ]
+        offset = y*width*4
+        # red, green and blue are bytes 2, 1 and 0 of a pixel
+        for c in range( 3 ):
+            land, ambient, lit, water_color = LAND_COLOR[c], ambience[c], light[c], surface[c]
+            pixels[offset+2-c:offset+width*4:4] = bytes(
+                min( int( ( land * ( ambient + lit * shade ) * ( 1 - opacity ) + water_color * opacity ) * 255 ), 255 )
+                for shade, opacity in zip( shades, opacities ) )
+    return pixels
+
+# A8R8G8B8 dds without mip maps, like the previews the editor saves
+def uncompressed_dds( pixels, size ):
+    width, height = size
+    # DDSD_CAPS, DDSD_HEIGHT, DDSD_WIDTH, DDSD_PITCH, DDSD_PIXELFORMAT
+    flags = 0x1 | 0x2 | 0x4 | 0x8 | 0x1000
+    pixel_format = ( 32, 0x41, 0, 32, 255 << 16, 255 << 8, 255, 255 << 24 )
+    return DDSMAGIC + pack( '31I',
+        124, flags, height, width, width * 4, 0, 1,
+        *( [0] * 11 ), *pixel_format, 0x1000, 0, 0, 0, 0 ) + bytes( pixels )
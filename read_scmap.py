@@ -1,12 +1,21 @@
 #!/usr/bin/env python
 
 from collections import namedtuple
+from contextlib import contextmanager
+import io
+import mmap
 from struct import pack, unpack, calcsize
 import math
 
 SCMAPMAGIC = b'\x4d\x61\x70\x1a'
 DDSMAGIC = b'DDS '
 
+class MapParsingException(Exception):
+    def __init__( self, subject, fileObject ):
+        self.offset = fileObject.tell()
+        self.message = "Couldn't parse {} before offset {} ".format( subject, self.offset )
+        super(Exception, self).__init__( self.message )
+
 def read_c_string(f):
     buf = b''
     while True:
@@ -200,9 +209,8 @@ class EmbeddedScMapDDSImage( EmbeddedScMapImage ):
                 for in_x, in_y in in_block_iter:
                     x = in_x + block_pos_x * 4
                     y = in_y + block_pos_y * 4
+                    # blocks of mip maps smaller than 4x4 pixels
                     if x >= mip_map_size[0] or y >= mip_map_size[1]:
-                        # TODO FIXME remove print
-                        print("skip pixel {}x{}".format(x,y))
                         continue
                     absolute_pixel_address = mip_map_size[0] * y * pixel_bytes + x * pixel_bytes + current_offset
                     block_pixel_index = in_y*4 + in_x
@@ -404,15 +412,95 @@ class EmbeddedScMapDDSImage( EmbeddedScMapImage ):
             packed_color_pixels
             )
 
-def read_scmap( scmap_path, debug_print_enabled=False ):
+# scmap sources are paths, bytes like objects or seekable binary streams holding the map from offset 0,
+# streams are left open for the caller
+@contextmanager
+def open_scmap( scmap_source, buffering=-1 ):
+    if isinstance( scmap_source, ( bytes, bytearray, memoryview ) ):
+        yield io.BytesIO( scmap_source )
+    elif hasattr( scmap_source, 'read' ):
+        yield scmap_source
+    else:
+        with open( scmap_source, 'rb', buffering=buffering ) as scmap:
+            yield scmap
+
+def stream_size( stream ):
+    position = stream.tell()
+    size = stream.seek( 0, io.SEEK_END )
+    stream.seek( position )
+    return size
+
+# bytes of an scmap source, slices bytes like sources without copying all of them into a stream
+def read_scmap_range( scmap_source, offset, length ):
+    if isinstance( scmap_source, ( bytes, bytearray, memoryview ) ):
+        return bytes( memoryview( scmap_source ).cast('B')[offset:offset+length] )
+    with open_scmap( scmap_source ) as scmap:
+        scmap.seek( offset )
+        return scmap.read( length )
+
+# image section of a scmap file which is only read from its source when it's needed
+class LazyEmbeddedImage( object ):
+    def __init__( self, scmap_source, offset, length, image_class, *args, **kwargs ):
+        self.scmap_source = scmap_source
+        self.offset = offset
+        self.length = length
+        self.image_class = image_class
+        self.args = args
+        self.kwargs = kwargs
+    def load( self ):
+        data = read_scmap_range( self.scmap_source, self.offset, self.length )
+        if len(data) != self.length:
+            raise Exception("Premature end of file at {} bytes offset".format(self.offset+len(data)))
+        return self.image_class( data, *self.args, **self.kwargs )
+    # memoryview of the section without reading it, files get mmap'd and only streams
+    # without a file descriptor are read into memory
+    @contextmanager
+    def view( self ):
+        if isinstance( self.scmap_source, ( bytes, bytearray, memoryview ) ):
+            with memoryview( self.scmap_source ).cast('B') as source:
+                with source[self.offset:self.offset+self.length] as section:
+                    yield section
+            return
+        with open_scmap( self.scmap_source ) as scmap:
+            try:
+                fileno = scmap.fileno()
+            except ( AttributeError, OSError ):
+                fileno = None
+            if fileno is None:
+                with memoryview( self.load().data ) as section:
+                    yield section
+                return
+            with mmap.mmap( fileno, 0, access=mmap.ACCESS_READ ) as mapped:
+                with memoryview( mapped ) as source:
+                    with source[self.offset:self.offset+self.length] as section:
+                        yield section
+
+# scmap_source as in open_scmap(),
+# with lazy_images infos['images'] holds LazyEmbeddedImage instead of image data
+def read_scmap( scmap_source, debug_print_enabled=False, lazy_images=False ):
 
     def debug_print( label, text ):
         if debug_print_enabled:
             print("{}: {}".format(label,text))
 
+    def read_image( length, image_class, *args, **kwargs ):
+        if lazy_images:
+            offset = scmap.tell()
+            if offset + length > scmap_size:
+                raise MapParsingException( "image data ({} bytes)".format(length), scmap )
+            # only magic bytes for checks and debug output
+            data = scmap.read( min( length, 4 ) )
+            scmap.seek( offset + length )
+            return data, LazyEmbeddedImage( scmap_source, offset, length, image_class, *args, **kwargs )
+        data = scmap.read( length )
+        return data, image_class( data, *args, **kwargs )
+
     infos = {'offsets': {}, 'images': {}}
     listOfDebugProps = []
-    with open( scmap_path, 'rb' ) as scmap:
+    with open_scmap( scmap_source ) as scmap:
+        scmap.seek( 0 )
+        # only needed to check lazy images, for zip members it's a pass over the whole file
+        scmap_size = stream_size( scmap ) if lazy_images else None
 
         scmapMagic = scmap.read(4)
         if scmapMagic != SCMAPMAGIC:
@@ -448,10 +536,9 @@ def read_scmap( scmap_path, debug_print_enabled=False ):
         preview_data_length = unpack('I', scmap.read(4) )[0]
         if not preview_data_length:
             raise MapParsingException( "preview image data length", scmap )
-        preview_data = scmap.read(preview_data_length)
+        preview_data, infos['images']['preview'] = read_image( preview_data_length, EmbeddedScMapDDSImage )
         infos['offsets']['preview_end'] = scmap.tell()
-        infos['images']['preview'] = EmbeddedScMapDDSImage( preview_data )
-        if len(preview_data) != preview_data_length:
+        if not lazy_images and len(preview_data) != preview_data_length:
             raise MapParsingException( "preview image data ({} bytes)".format(preview_data_length), scmap )
         debug_print( "preview_data_length", "{} bytes".format(preview_data_length) )
         debug_print( "preview_dataMagic", preview_data[0:4].decode( ))
@@ -469,6 +556,7 @@ def read_scmap( scmap_path, debug_print_enabled=False ):
 
         if file_version_minor not in [60, 59, 56, 53]:
             raise MapParsingException( "unsupported file minor version", scmap )
+        infos['version'] = file_version_minor
 
         #######################################################################
 
@@ -487,15 +575,14 @@ def read_scmap( scmap_path, debug_print_enabled=False ):
         # Height Scale, usually 1/128
         heightScale = unpack('f', scmap.read(4) )[0]
         debug_print( "heightScale", heightScale )
+        infos['height_scale'] = heightScale
 
         height_map_data_length = ( map_height + 1 ) * ( map_width + 1 ) * calcsize('h')
         infos['offsets']['height_map_start'] = scmap.tell()
         infos['offsets']['height_map_length_prefix'] = False
-        height_map_data = scmap.read(height_map_data_length)
+        height_map_data, infos['images']['height_map'] = read_image( height_map_data_length, EmbeddedScMapGrayImage, (map_width+1,map_height+1), '16' )
         infos['offsets']['height_map_end'] = scmap.tell()
 
-        infos['images']['height_map'] = EmbeddedScMapGrayImage( height_map_data, (map_width+1,map_height+1), '16' )
-
         #######################################################################
         ### Some Shader
         #######################################################################
@@ -544,6 +631,12 @@ def read_scmap( scmap_path, debug_print_enabled=False ):
 
         lightColor = unpack('fff', scmap.read(12) )
         debug_print( "lightColor", lightColor )
+        infos['lighting'] = {
+            'multiplier': lightingMultiplier,
+            'direction': lightDirection,
+            'ambience_color': ambienceLightColor,
+            'color': lightColor,
+        }
 
         shadowFillColor = unpack('fff', scmap.read(12) )
         debug_print( "shadowFillColor", shadowFillColor )
@@ -578,6 +671,13 @@ def read_scmap( scmap_path, debug_print_enabled=False ):
 
         surfaceColor = unpack('fff', scmap.read(12) )
         debug_print( "surfaceColor", surfaceColor )
+        infos['water'] = {
+            'has_water': hasWater != b'\x00',
+            'elevation': waterElevation,
+            'elevation_deep': waterElevationDeep,
+            'elevation_abyss': waterElevationAbyss,
+            'surface_color': surfaceColor,
+        }
 
         colorLerpMin = unpack('f', scmap.read(4) )[0]
         debug_print( "colorLerpMin", colorLerpMin )
@@ -839,9 +939,8 @@ def read_scmap( scmap_path, debug_print_enabled=False ):
             infos['offsets']['{}_start'.format(name)] = scmap.tell()
             infos['offsets']['{}_length_prefix'.format(name)] = True
             normal_map_data_length = unpack('I', scmap.read(4) )[0]
-            normal_map_data = scmap.read(normal_map_data_length)
+            normal_map_data, infos['images'][name] = read_image( normal_map_data_length, EmbeddedScMapDDSImage, is_normal_map=True )
             infos['offsets']['{}_end'.format(name)] = scmap.tell()
-            infos['images'][name] = EmbeddedScMapDDSImage( normal_map_data, is_normal_map=True )
             debug_print( "normal_map_data_length", normal_map_data_length )
             debug_print( "normal_map_data", "{}...".format(normal_map_data[:4]) )
 
@@ -854,9 +953,8 @@ def read_scmap( scmap_path, debug_print_enabled=False ):
         infos['offsets']['stratum_1to4_length_prefix'] = True
         stratum_1to4_data_length = unpack('I', scmap.read(4) )[0]
         debug_print( "stratum_1to4_data_length", stratum_1to4_data_length )
-        stratum_1to4_data = scmap.read(stratum_1to4_data_length)
+        stratum_1to4_data, infos['images']['stratum_1to4'] = read_image( stratum_1to4_data_length, EmbeddedScMapDDSImage )
         infos['offsets']['stratum_1to4_end'] = scmap.tell()
-        infos['images']['stratum_1to4'] = EmbeddedScMapDDSImage( stratum_1to4_data )
         debug_print( "stratum_1to4_data", "{}...".format(stratum_1to4_data[:4]) )
 
         if file_version_minor < 56:
@@ -868,9 +966,8 @@ def read_scmap( scmap_path, debug_print_enabled=False ):
         infos['offsets']['stratum_5to8_length_prefix'] = True
         stratum_5to8_data_length = unpack('I', scmap.read(4) )[0]
         debug_print( "stratum_5to8_data_length", stratum_5to8_data_length )
-        stratum_5to8_data = scmap.read(stratum_5to8_data_length)
+        stratum_5to8_data, infos['images']['stratum_5to8'] = read_image( stratum_5to8_data_length, EmbeddedScMapDDSImage )
         infos['offsets']['stratum_5to8_end'] = scmap.tell()
-        infos['images']['stratum_5to8'] = EmbeddedScMapDDSImage( stratum_5to8_data )
         debug_print( "stratum_5to8_data", "dds{}...".format(stratum_5to8_data[:4]) )
 
         if file_version_minor > 53:
@@ -880,9 +977,8 @@ def read_scmap( scmap_path, debug_print_enabled=False ):
             infos['offsets']['water_brush_start'] = scmap.tell()
             infos['offsets']['water_brush_length_prefix'] = True
             water_brush_data_length = unpack('I', scmap.read(4) )[0]
-            water_brush_data = scmap.read(water_brush_data_length)
+            water_brush_data, infos['images']['water_brush'] = read_image( water_brush_data_length, EmbeddedScMapDDSImage )
             infos['offsets']['water_brush_end'] = scmap.tell()
-            infos['images']['water_brush'] = EmbeddedScMapDDSImage( water_brush_data )
             debug_print( "water_brush_data_length", water_brush_data_length )
             debug_print( "water_brush_data", "{}...".format(water_brush_data[:4]) )
 
@@ -890,31 +986,27 @@ def read_scmap( scmap_path, debug_print_enabled=False ):
 
         infos['offsets']['water_foam_map_start'] = scmap.tell()
         infos['offsets']['water_foam_map_length_prefix'] = False
-        water_foam_map_data = scmap.read(someWaterMapLength)
+        water_foam_map_data, infos['images']['water_foam_map'] = read_image( someWaterMapLength, EmbeddedScMapGrayImage, half_map_size, '8' )
         infos['offsets']['water_foam_map_end'] = scmap.tell()
-        infos['images']['water_foam_map'] = EmbeddedScMapGrayImage( water_foam_map_data, half_map_size, '8' )
         debug_print( "water_foam_map_data", "{}...".format(water_foam_map_data[:4]) )
 
         infos['offsets']['water_flatness_map_start'] = scmap.tell()
         infos['offsets']['water_flatness_map_length_prefix'] = False
-        water_flatness_map_data = scmap.read(someWaterMapLength)
+        water_flatness_map_data, infos['images']['water_flatness_map'] = read_image( someWaterMapLength, EmbeddedScMapGrayImage, half_map_size, '8' )
         infos['offsets']['water_flatness_map_end'] = scmap.tell()
-        infos['images']['water_flatness_map'] = EmbeddedScMapGrayImage( water_flatness_map_data, half_map_size, '8' )
         debug_print( "water_flatness_map_data", "{}...".format(water_flatness_map_data[:4]) )
 
         infos['offsets']['water_depth_bias_map_start'] = scmap.tell()
         infos['offsets']['water_depth_bias_map_length_prefix'] = False
-        water_depth_bias_map_data = scmap.read(someWaterMapLength)
+        water_depth_bias_map_data, infos['images']['water_depth_bias_map'] = read_image( someWaterMapLength, EmbeddedScMapGrayImage, half_map_size, '8' )
         infos['offsets']['water_depth_bias_map_end'] = scmap.tell()
-        infos['images']['water_depth_bias_map'] = EmbeddedScMapGrayImage( water_depth_bias_map_data, half_map_size, '8' )
         debug_print( "water_depth_bias_map_data", "{}...".format(water_depth_bias_map_data[:4]) )
 
         terrain_type_data_length = map_width * map_height
         infos['offsets']['terrain_type_start'] = scmap.tell()
         infos['offsets']['terrain_type_length_prefix'] = False
-        terrain_type_data = scmap.read(terrain_type_data_length)
+        terrain_type_data, infos['images']['terrain_type'] = read_image( terrain_type_data_length, EmbeddedScMapGrayImage, map_size, '8' )
         infos['offsets']['terrain_type_end'] = scmap.tell()
-        infos['images']['terrain_type'] = EmbeddedScMapGrayImage( terrain_type_data, map_size, '8' )
         debug_print( "terrain_type_data_length", "{}...".format(terrain_type_data_length) )
         debug_print( "terrain_type_data", "{}...".format(terrain_type_data[:4]) )
 
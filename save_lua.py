@@ -0,0 +1,702 @@
+#!/usr/bin/env python
+
+# tokenizer and parser for the data subset of lua used by _save.lua files
+#
+#   Scenario = {
+#       next_area_id = '1',
+#       ['AREA_1'] = { ['rectangle'] = RECTANGLE( 0, 0, 512, 512 ) },
+#       ['Mass 00'] = { ['size'] = FLOAT( 1.000000 ), ['position'] = VECTOR3( 52.5, 21.9, 186.5 ) },
+#       ['Units'] = GROUP { orders = '', Units = { ... } },
+#   }
+#
+# tables become dicts, calls of the save file helper functions become typed values
+
+import re
+
+# FLOAT( x )
+class Float( float ):
+    def __repr__( self ):
+        return "FLOAT( {:.6f} )".format(self)
+
+# BOOLEAN( x )
+class Boolean( object ):
+    def __init__( self, value ):
+        self.value = bool(value)
+    def __bool__( self ):
+        return self.value
+    def __eq__( self, other ):
+        return bool(self) == bool(other)
+    def __hash__( self ):
+        return hash(self.value)
+    def __repr__( self ):
+        return "BOOLEAN( {} )".format( 'true' if self.value else 'false' )
+
+# STRING( 'x' )
+class String( str ):
+    def __repr__( self ):
+        return "STRING( '{}' )".format(self)
+
+# VECTOR3( x, y, z )
+class Vector3( tuple ):
+    def __new__( cls, x, y, z ):
+        return super().__new__( cls, ( x, y, z ) )
+    def __repr__( self ):
+        return "VECTOR3( {}, {}, {} )".format( *map( lua_number_to_string, self ) )
+
+# RECTANGLE( x0, y0, x1, y1 )
+class Rectangle( tuple ):
+    def __new__( cls, x0, y0, x1, y1 ):
+        return super().__new__( cls, ( x0, y0, x1, y1 ) )
+    def __repr__( self ):
+        return "RECTANGLE( {}, {}, {}, {} )".format( *map( lua_number_to_string, self ) )
+
+# GROUP { ... }
+class Group( dict ):
+    pass
+
+# format numbers like lua's tostring() does, floats keep a '.0' when they look integral
+def lua_number_to_string( number ):
+    if type(number) is int:
+        return str(number)
+    text = '%.14g' % number
+    if text.lstrip( '-' ).isdigit():
+        return text + '.0'
+    return text
+
+class SaveLuaParsingException(Exception):
+    def __init__( self, subject, text, offset ):
+        self.line = text.count( '\n', 0, offset ) + 1
+        self.message = "Couldn't parse {} at line {}".format( subject, self.line )
+        super(Exception, self).__init__( self.message )
+
+TOKEN_REGEX = re.compile(r'''
+    (?P<space>\s+)
+  | (?P<comment>--(?:\[(?P<comment_level>=*)\[.*?\](?P=comment_level)\]|[^\n]*))
+  | (?P<name>[A-Za-z_][A-Za-z0-9_]*)
+  | (?P<number>0[xX][0-9a-fA-F]+|(?:[0-9]+\.?[0-9]*|\.[0-9]+)(?:[eE][+-]?[0-9]+)?)
+  | (?P<string>'(?:[^'\\\n]|\\.)*'|"(?:[^"\\\n]|\\.)*")
+  | (?P<long_string>\[(?P<string_level>=*)\[.*?\](?P=string_level)\])
+  | (?P<symbol>[{}\[\]=,;()-])
+''', re.VERBOSE | re.DOTALL)
+
+STRING_ESCAPE_REGEX = re.compile(r'\\(?:([0-9]{1,3})|(.))', re.DOTALL)
+STRING_ESCAPES = {
+    'a': '\a', 'b': '\b', 'f': '\f', 'n': '\n', 'r': '\r', 't': '\t', 'v': '\v',
+    '\\': '\\', '"': '"', "'": "'", '\n': '\n',
+}
+
+def unescape_string( s ):
+    def replace( match ):
+        if match.group(1):
+            return chr( int(match.group(1)) )
+        return STRING_ESCAPES.get( match.group(2), match.group(2) )
+    if '\\' not in s:
+        return s
+    return STRING_ESCAPE_REGEX.sub( replace, s )
+
+class SaveLuaParser( object ):
+
+    def __init__( self, text, position=0 ):
+        self.text = text
+        self.position = position
+        self.token = None
+
+    def error( self, subject, offset=None ):
+        raise SaveLuaParsingException( subject, self.text, self.position if offset is None else offset )
+
+    # current token as ( kind, value, offset ), whitespace and comments are skipped
+    def peek( self ):
+        if self.token is None:
+            text = self.text
+            while True:
+                offset = self.position
+                if offset >= len(text):
+                    self.token = ( 'eof', None, offset )
+                    break
+                m = TOKEN_REGEX.match( text, offset )
+                if not m:
+                    self.error( "token" )
+                self.position = m.end()
+                kind = m.lastgroup
+                if kind == 'space' or kind == 'comment':
+                    continue
+                if kind == 'name':
+                    self.token = ( 'name', m.group(kind), offset )
+                elif kind == 'symbol':
+                    self.token = ( m.group(kind), None, offset )
+                elif kind == 'string':
+                    self.token = ( 'string', unescape_string( m.group(kind)[1:-1] ), offset )
+                elif kind == 'number':
+                    self.token = ( 'number', parse_number( m.group(kind) ), offset )
+                elif kind == 'long_string':
+                    level = len(m.group('string_level'))
+                    s = m.group(kind)[level+2:-level-2]
+                    # first newline of long strings is skipped
+                    if s[:1] == '\n':
+                        s = s[1:]
+                    self.token = ( 'string', s, offset )
+                break
+        return self.token
+
+    def next( self ):
+        token = self.peek()
+        self.token = None
+        return token
+
+    def expect( self, kind ):
+        token = self.next()
+        if token[0] != kind:
+            self.error( "'{}'".format(kind), token[2] )
+        return token
+
+    # position right behind the last consumed token
+    def end_position( self ):
+        return self.token[2] if self.token else self.position
+
+    # field := '[' exp ']' '=' exp | Name '=' exp | exp
+    def parse_field( self, table, array_index ):
+        kind, value, offset = self.peek()
+        if kind == '[':
+            self.next()
+            key = self.parse_expression()
+            self.expect( ']' )
+            self.expect( '=' )
+        elif kind == 'name' and self.peek_behind_name() == '=':
+            key = self.next()[1]
+            self.next()
+        else:
+            key = array_index
+            array_index += 1
+        value = self.parse_expression()
+        # lua tables don't hold nil values
+        if value is not None:
+            table[key] = value
+        return array_index
+
+    def peek_behind_name( self ):
+        m = NAME_FOLLOWER_REGEX.match( self.text, self.position )
+        return m.group(1) if m else None
+
+    def parse_expression( self ):
+        kind, value, offset = self.next()
+        if kind == 'string' or kind == 'number':
+            return value
+        elif kind == '{':
+            return self.parse_table()
+        elif kind == '-':
+            value = self.parse_expression()
+            if type(value) not in ( int, float ):
+                self.error( "negative number", offset )
+            # -0 stays the integer 0, -0.0 keeps its sign like in lua
+            return -value
+        elif kind == 'name':
+            if value == 'true':
+                return True
+            elif value == 'false':
+                return False
+            elif value == 'nil':
+                return None
+            return self.parse_call( value )
+        self.error( "expression", offset )
+
+    # table := '{' [ field { sep field } [sep] ] '}'
+    def parse_table( self ):
+        table = {}
+        array_index = 1
+        while self.peek()[0] != '}':
+            array_index = self.parse_field( table, array_index )
+            if self.peek()[0] in ( ',', ';' ):
+                self.next()
+            elif self.peek()[0] != '}':
+                self.error( "table field separator" )
+        self.next()
+        return table
+
+    # call := Name '(' [ exp { ',' exp } ] ')' | Name table | Name String
+    def parse_call( self, name ):
+        kind, value, offset = self.peek()
+        if kind == '(':
+            self.next()
+            arguments = []
+            while self.peek()[0] != ')':
+                arguments.append( self.parse_expression() )
+                if self.peek()[0] == ',':
+                    self.next()
+                elif self.peek()[0] != ')':
+                    self.error( "argument separator" )
+            self.next()
+        elif kind == '{':
+            self.next()
+            arguments = [ self.parse_table() ]
+        elif kind == 'string':
+            arguments = [ self.next()[1] ]
+        else:
+            self.error( "value of {}".format(name), offset )
+        if name not in SAVE_LUA_FUNCTIONS:
+            self.error( "unknown function {}".format(name), offset )
+        try:
+            return SAVE_LUA_FUNCTIONS[name]( *arguments )
+        except TypeError:
+            self.error( "arguments of {}".format(name), offset )
+
+NAME_FOLLOWER_REGEX = re.compile(r'\s*(=(?!=))')
+
+SAVE_LUA_FUNCTIONS = {
+    'FLOAT': lambda x: Float( x ),
+    'BOOLEAN': lambda x: Boolean( x is not None and x is not False ),
+    'STRING': lambda x: String( lua_number_to_string(x) if type(x) in ( int, float ) else x ),
+    'VECTOR3': Vector3,
+    'RECTANGLE': Rectangle,
+    'GROUP': lambda x: Group( x ),
+}
+
+# the editor writes one field per line, most lines are parsed by this single
+# expression, everything else is left to SaveLuaParser
+NUMBER_PATTERN = r'-?(?:[0-9]+\.?[0-9]*|\.[0-9]+)(?:[eE][+-]?[0-9]+)?'
+LINE_REGEX = re.compile(r"""[ \t]*(?:
+    (?P<close>\})
+  | --\[\[[^\n\]]*\]\]--
+  | (?:\[(?:'(?P<string_key>[^'\\\n]*)'|(?P<number_key>[0-9]+))\]|(?P<name_key>[A-Za-z_][A-Za-z0-9_]*))[ \t]*=[ \t]*(?:
+        (?P<empty_table>\{[ \t]*\})
+      | (?P<table>(?P<group>GROUP[ \t]*)?\{)
+      | FLOAT\([ \t]*(?P<float>NUMBER)[ \t]*\)
+      | STRING\([ \t]*'(?P<string>[^'\\\n]*)'[ \t]*\)
+      | BOOLEAN\([ \t]*(?P<boolean>true|false)[ \t]*\)
+      | VECTOR3\([ \t]*(?P<vector3_x>NUMBER)[ \t]*,[ \t]*(?P<vector3_y>NUMBER)[ \t]*,[ \t]*(?P<vector3_z>NUMBER)[ \t]*\)
+      | \{[ \t]*(?P<vector_x>NUMBER)[ \t]*,[ \t]*(?P<vector_y>NUMBER)[ \t]*,[ \t]*(?P<vector_z>NUMBER)[ \t]*,?[ \t]*\}
+      | '(?P<plain_string>[^'\\\n]*)'
+      | (?P<number>NUMBER)
+      | (?P<boolean_literal>true|false)
+    )
+)?[ \t]*[,;]?[ \t]*(?:\r?\n|\Z)""".replace( 'NUMBER', NUMBER_PATTERN ), re.VERBOSE)
+
+# integer and float literals as lua tells them apart, floats keep their type and the sign of zero
+def parse_number( s ):
+    if s[:2] in ( '0x', '0X' ):
+        return int( s, 16 )
+    if '.' in s or 'e' in s or 'E' in s:
+        return float( s )
+    return int( s )
+
+# parse save file contents and return all global variables
+def loads( text ):
+    chunk_globals = {}
+    # stack of [ table, next array index ], chunk globals at the bottom
+    stack = [ [ chunk_globals, 1 ] ]
+    frame = stack[-1]
+    position = 0
+    end = len(text)
+    match = LINE_REGEX.match
+    while position < end:
+        m = match( text, position )
+        if m and m.end() > position:
+            position = m.end()
+            kind = m.lastgroup
+            if kind is None:
+                # empty line or comment
+                continue
+            if kind == 'close':
+                if len(stack) == 1:
+                    raise SaveLuaParsingException( "'}'", text, m.start(kind) )
+                stack.pop()
+                frame = stack[-1]
+                continue
+            key = m.group('string_key')
+            if key is None:
+                key = m.group('name_key')
+                if key is None:
+                    key = int( m.group('number_key') )
+                elif key in ( 'true', 'false', 'nil' ):
+                    raise SaveLuaParsingException( "key", text, m.start() )
+            if kind == 'string':
+                value = String( m.group(kind) )
+            elif kind == 'float':
+                value = Float( parse_number( m.group(kind) ) )
+            elif kind == 'vector3_z':
+                value = Vector3( parse_number( m.group('vector3_x') ), parse_number( m.group('vector3_y') ), parse_number( m.group('vector3_z') ) )
+            elif kind == 'plain_string':
+                value = m.group(kind)
+            elif kind == 'table':
+                value = Group() if m.group('group') else {}
+                frame[0][key] = value
+                frame = [ value, 1 ]
+                stack.append( frame )
+                continue
+            elif kind == 'empty_table':
+                value = {}
+            elif kind == 'vector_z':
+                value = { 1: parse_number( m.group('vector_x') ), 2: parse_number( m.group('vector_y') ), 3: parse_number( m.group('vector_z') ) }
+            elif kind == 'boolean':
+                value = Boolean( m.group(kind) == 'true' )
+            elif kind == 'number':
+                value = parse_number( m.group(kind) )
+            elif kind == 'boolean_literal':
+                value = m.group(kind) == 'true'
+            frame[0][key] = value
+        else:
+            # anything else, parse one field with the generic parser
+            parser = SaveLuaParser( text, position )
+            kind = parser.peek()[0]
+            if kind == 'eof':
+                break
+            elif kind == '}':
+                if len(stack) == 1:
+                    parser.error( "'}'" )
+                parser.next()
+                stack.pop()
+                frame = stack[-1]
+            elif len(stack) == 1:
+                # chunk := { Name '=' exp [';'] }
+                name = parser.expect( 'name' )[1]
+                if name == 'local':
+                    name = parser.expect( 'name' )[1]
+                parser.expect( '=' )
+                chunk_globals[name] = parser.parse_expression()
+            else:
+                frame[1] = parser.parse_field( frame[0], frame[1] )
+            if parser.peek()[0] in ( ',', ';' ):
+                parser.next()
+            position = parser.end_position()
+    if len(stack) > 1:
+        raise SaveLuaParsingException( "'}'", text, end )
+    return chunk_globals
+
+def load( path_to_save_lua ):
+    with open( path_to_save_lua, 'r' ) as save_lua:
+        return loads( save_lua.read() )
+
+###############################################################################
+### Writing
+###############################################################################
+
+# the editor writes some tables in a fixed key order, other keys follow sorted
+SCENARIO_KEYS_ORDER = [
+    'next_area_id','Props','Areas',
+    'MasterChain','Chains',
+    'next_queue_id','Orders',
+    'next_platoon_id', 'Platoons',
+    'next_army_id','next_group_id','next_unit_id',
+    'Armies']
+MARKER_KEYS_ORDER = [
+    'size', 'resource', 'amount', 'color', 'editorIcon',
+    'type','prop',
+    'orientation','position']
+ARMY_KEYS_ORDER = [
+    'mass', 'energy',
+    'personality', 'plans', 'color', 'faction', 'Economy', 'Alliances',
+    'type', 'orders','platoon',
+    'Units','Position','Orientation',
+    'PlatoonBuilders', 'next_platoon_builder_id']
+
+# huge comment sections in front of some keys
+DECORATOR_FORMAT = "{0:}--[["+" "*75+"]]--\n{0:}--[[  {1: <73}]]--\n{0:}--[["+" "*75+"]]--\n"
+SCENARIO_DECORATORS = {
+    'Props': [ "Props" ],
+    'Areas': [ "Areas" ],
+    'MasterChain': [ "Markers" ],
+    'next_queue_id': [ "Orders" ],
+    'next_platoon_id': [ "Platoons" ],
+    'next_army_id': [ "Armies" ],
+}
+
+# formatting of the keys of one table, depends on where the table is located
+# in the scenario only, so rules are built once for every kind of location
+class TableFormatRule( object ):
+
+    def __init__( self, in_scenario, section, depth ):
+        self.in_scenario = in_scenario
+        self.section = section
+        self.depth = depth
+        self.indent = "    "*depth
+        self.children = {}
+        self.key_prefixes = {}
+
+        # depth of the paths of the keys, e.g. 3 for /Scenario/Armies/ARMY_1
+        key_depth = depth + 1
+        self.keys_order = None
+        self.alternative_keys = set()
+        self.all_keys_alternative = False
+        self.decorators = {}
+        self.all_keys_decorator = ''
+
+        if not in_scenario:
+            if depth == 0:
+                self.decorators['Scenario'] = self.decorator( "Automatically generated code (do not edit)" ) + self.decorator( "Scenario" )
+            return
+
+        if depth == 1:
+            self.keys_order = SCENARIO_KEYS_ORDER
+            for k in SCENARIO_DECORATORS:
+                self.decorators[k] = ''.join( self.decorator( title ) for title in SCENARIO_DECORATORS[k] )
+        elif section == 'MasterChain' and depth >= 3:
+            self.keys_order = MARKER_KEYS_ORDER
+        elif section == 'Armies' and depth >= 3:
+            self.keys_order = ARMY_KEYS_ORDER
+
+        if section == 'Armies' and key_depth == 3:
+            self.all_keys_decorator = self.decorator( "Army" )
+
+        # alternating writings e.g. Units and ['Units']
+        if section in ( 'MasterChain', 'Chains' ) and key_depth >= 3:
+            self.all_keys_alternative = key_depth != 4
+        elif section == 'Armies':
+            self.all_keys_alternative = key_depth in ( 3, 6, 8 )
+            if key_depth == 4:
+                self.alternative_keys.add( 'Units' )
+
+    def decorator( self, title ):
+        return DECORATOR_FORMAT.format( self.indent, title )
+
+    # rule of the table found at key
+    def child( self, key ):
+        if self.in_scenario and self.depth == 1:
+            section = key
+        else:
+            section = self.section
+        in_scenario = self.in_scenario or ( self.depth == 0 and key == 'Scenario' )
+        cache_key = ( in_scenario, section, self.depth + 1 )
+        if cache_key not in self.children:
+            if cache_key not in TABLE_FORMAT_RULES:
+                TABLE_FORMAT_RULES[cache_key] = TableFormatRule( *cache_key )
+            self.children[cache_key] = TABLE_FORMAT_RULES[cache_key]
+        return self.children[cache_key]
+
+    def ordered_keys( self, keys ):
+        keys = sorted( keys )
+        if not self.keys_order:
+            return keys
+        present = set( keys )
+        first = [ k for k in self.keys_order if k in present ]
+        first_set = set( first )
+        return first + [ k for k in keys if k not in first_set ]
+
+    # text in front of the value of key, cached as most keys repeat
+    def key_prefix( self, key ):
+        prefix = self.key_prefixes.get( key )
+        if prefix is None:
+            decorator = self.all_keys_decorator or self.decorators.get( key, '' )
+            if self.all_keys_alternative or key in self.alternative_keys:
+                prefix = "{}{}['{}'] = ".format( decorator, self.indent, key )
+            else:
+                prefix = "{}{}{} = ".format( decorator, self.indent, key )
+            self.key_prefixes[key] = prefix
+        return prefix
+
+TABLE_FORMAT_RULES = {}
+
+def root_format_rule():
+    if ( False, None, 0 ) not in TABLE_FORMAT_RULES:
+        TABLE_FORMAT_RULES[( False, None, 0 )] = TableFormatRule( False, None, 0 )
+    return TABLE_FORMAT_RULES[( False, None, 0 )]
+
+format_number = lua_number_to_string
+
+def format_float( v ):
+    return "FLOAT( %.6f )" % v
+
+def format_boolean_call( v ):
+    return "BOOLEAN( true )" if v else "BOOLEAN( false )"
+
+def format_string_call( v ):
+    return "STRING( '%s' )" % v
+
+def format_vector3_call( v ):
+    return "VECTOR3( %s, %s, %s )" % ( format_number(v[0]), format_number(v[1]), format_number(v[2]) )
+
+def format_rectangle_call( v ):
+    return "RECTANGLE( %s, %s, %s, %s )" % ( format_number(v[0]), format_number(v[1]), format_number(v[2]), format_number(v[3]) )
+
+def format_boolean( v ):
+    return "true" if v else "false"
+
+def format_string( v ):
+    return "'%s'" % v
+
+def format_vector( v ):
+    return "{ %.6f, %.6f, %.6f }" % ( v[0], v[1], v[2] )
+
+SCALAR_FORMATTERS = {
+    Float: format_float,
+    Boolean: format_boolean_call,
+    String: format_string_call,
+    Vector3: format_vector3_call,
+    Rectangle: format_rectangle_call,
+    str: format_string,
+    bool: format_boolean,
+    int: format_number,
+    float: format_number,
+    tuple: format_vector,
+}
+
+def dump_table( chunks, table, rule, first=False ):
+    append = chunks.append
+    key_prefix = rule.key_prefix
+    formatters = SCALAR_FORMATTERS
+    separator = "" if first else ",\n"
+    for k in rule.ordered_keys( table ):
+        append( key_prefix( k ) )
+        v = table[k]
+        value_type = type(v)
+        formatter = formatters.get( value_type )
+        if formatter:
+            append( formatter( v ) )
+        elif value_type is dict and len(v) == 3 and list(v) == [1,2,3]:
+            append( "{ %.6f, %.6f, %.6f }" % ( v[1], v[2], v[3] ) )
+        elif value_type is dict or value_type is Group:
+            append( "GROUP {\n" if value_type is Group else "{\n" )
+            dump_table( chunks, v, rule.child( k ) )
+            append( rule.indent )
+            append( "}" )
+        else:
+            raise Exception("Unknown format {} at {} ".format(value_type,k))
+        append( separator )
+
+# serialize global variables like the editor writes them to _save.lua
+def dumps( save_lua_globals ):
+    chunks = []
+    dump_table( chunks, save_lua_globals, root_format_rule(), first=True )
+    return ''.join( chunks )
+
+def dump( oStream, save_lua_globals ):
+    oStream.write( dumps( save_lua_globals ) )
+
+# path patterns like "/Scenario/Armies/[^/]*/[^/]*/Units" compiled to one matcher per segment
+PATH_SEGMENT_SPECIAL_CHARS = set('.^$*+?{}[]\\|()')
+PATH_SEGMENT_ANY = ('[^/]*','.*')
+PATH_SEGMENT_REGEX = re.compile(r'(?:\[\^?\]?[^\]]*\]|[^/\[])+')
+
+class PathSelector( object ):
+    def __init__( self, pattern ):
+        self.pattern = pattern
+        self.segments = []
+        for segment in PATH_SEGMENT_REGEX.findall( pattern ):
+            if segment in PATH_SEGMENT_ANY:
+                self.segments.append( None )
+            elif PATH_SEGMENT_SPECIAL_CHARS.isdisjoint( segment ):
+                self.segments.append( segment )
+            else:
+                self.segments.append( re.compile( segment ) )
+        self.length = len( self.segments )
+    # literal name of segment at depth or None if the segment must be matched against every key
+    def literal( self, depth ):
+        segment = self.segments[depth]
+        return segment if type(segment) is str else None
+    def matches( self, depth, key ):
+        segment = self.segments[depth]
+        if segment is None:
+            return True
+        if type(segment) is str:
+            return segment == str(key)
+        return segment.fullmatch( str(key) ) is not None
+
+PATH_SELECTORS = {}
+
+def path_selector( pattern ):
+    selector = PATH_SELECTORS.get( pattern )
+    if selector is None:
+        selector = PATH_SELECTORS[pattern] = PathSelector( pattern )
+    return selector
+
+# key of table named by a path segment, array entries have integer keys
+def segment_key( table, segment ):
+    if segment in table:
+        return segment
+    if type(segment) is str and segment.isdigit() and int(segment) in table:
+        return int(segment)
+    return None
+
+# remembers nodes by path of keys and what select() matched, so repeated lookups and
+# selections don't walk the tree again; invalidate() after adding or removing matched nodes
+class PathIndex( object ):
+    def __init__( self, root ):
+        self.root = root
+        self.invalidate()
+    def add( self, path, node ):
+        self.nodes[path] = node
+    def get( self, path, default=None ):
+        if type(path) is str:
+            path = tuple( path.strip('/').split('/') ) if path.strip('/') else ()
+        node = self.nodes.get( path )
+        if node is not None:
+            return node
+        # walk from the longest known parent
+        depth = len( path )
+        while depth and path[:depth] not in self.nodes:
+            depth -= 1
+        node = self.nodes[path[:depth]]
+        for depth in range( depth, len(path) ):
+            key = segment_key( node, path[depth] ) if isinstance( node, dict ) else None
+            if key is None:
+                return default
+            node = node[key]
+            self.nodes[path[:depth+1]] = node
+        return node
+    def invalidate( self ):
+        self.nodes = { (): self.root }
+        self.selections = {}
+
+def select_into( active, table, depth, path, matched, index ):
+    keys = None
+    for selector, payload in active:
+        literal = selector.literal( depth )
+        if literal is None:
+            keys = list( table )
+            break
+        if keys is None:
+            keys = []
+        key = segment_key( table, literal )
+        if key is not None and key not in keys:
+            keys.append( key )
+    for key in keys:
+        value = table[key]
+        key_path = path + (key,)
+        descend = []
+        for rule in active:
+            selector = rule[0]
+            if not selector.matches( depth, key ):
+                continue
+            if selector.length == depth + 1:
+                matched.append( ( rule[1], table, key, key_path ) )
+                if index is not None:
+                    index.add( key_path, value )
+            elif isinstance( value, dict ):
+                descend.append( rule )
+        if descend:
+            if index is not None:
+                index.add( key_path, value )
+            select_into( descend, value, depth+1, key_path, matched, index )
+
+# find all nodes matched by any of the (pattern, payload) rules in one traversal,
+# subtrees no pattern can match are skipped; returns (payload, parent, key, path) per match,
+# path being the keys from table on; with an index the same patterns are only matched once
+def select( table, rules, index=None ):
+    patterns = tuple( pattern for pattern, _ in rules )
+    payloads = [ payload for _, payload in rules ]
+    if index is not None and patterns in index.selections:
+        return [ ( payloads[rule], index.get( path[:-1] ), path[-1], path ) for rule, path in index.selections[patterns] ]
+    matched = []
+    active = [ ( path_selector( pattern ), rule ) for rule, pattern in enumerate( patterns ) ]
+    if active:
+        select_into( active, table, 0, (), matched, index )
+    if index is not None:
+        index.selections[patterns] = [ ( rule, path ) for rule, _, _, path in matched ]
+    return [ ( payloads[rule], parent, key, path ) for rule, parent, key, path in matched ]
+
+# values of all nodes matched by pattern
+def select_values( table, pattern ):
+    return { key: parent[key] for _, parent, key, _ in select( table, [(pattern,None)] ) }
+
+# replace matched values by func( key, value, table ), rules are applied in given order
+def update_selected( table, rules, index=None ):
+    for func, parent, key, path in select( table, rules, index ):
+        parent[key] = func( key, parent[key], table )
+        if index is not None:
+            index.add( path, parent[key] )
+
+def main():
+    import sys
+    import pprint
+    pprint.pprint( load( sys.argv[1] ) )
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,59 @@
+#!/usr/bin/env python
+# mirrored scmap sections stored by hash of the input section and mirror options
+
+import hashlib
+import json
+import os
+import tempfile
+from read_scmap import open_scmap
+
+# bump when mirrored output of unchanged input changes
+SECTION_CACHE_VERSION = 1
+HASH_BUFFER_SIZE = 1024*1024
+
+class SectionCache( object ):
+    def __init__( self, directory, options ):
+        self.directory = directory
+        self.options = options
+        os.makedirs( directory, exist_ok=True )
+
+    # hash of a byte range of a scmap source, read in chunks so big sections don't need to fit in memory
+    def section_hash( self, scmap_source, offset, length ):
+        section_hash = hashlib.sha256()
+        with open_scmap( scmap_source ) as scmap:
+            scmap.seek( offset )
+            while length > 0:
+                data = scmap.read( min( length, HASH_BUFFER_SIZE ) )
+                if not data:
+                    raise Exception("Premature end of file at {} bytes offset".format(scmap.tell()))
+                section_hash.update( data )
+                length -= len(data)
+        return section_hash.hexdigest()
+
+    # image is how the section gets interpreted, e.g. size and depth of gray images
+    def metadata( self, name, scmap_source, offset, length, image=None ):
+        return {
+            'version': SECTION_CACHE_VERSION,
+            'name': name,
+            'image': image,
+            'section_sha256': self.section_hash( scmap_source, offset, length ),
+            'options': self.options,
+        }
+
+    def key( self, metadata ):
+        return hashlib.sha256( json.dumps( metadata, sort_keys=True ).encode() ).hexdigest()
+
+    def get( self, key ):
+        try:
+            with open( os.path.join( self.directory, '{}.section'.format(key) ), 'rb' ) as section:
+                return section.read()
+        except FileNotFoundError:
+            return None
+
+    def put( self, key, data, metadata ):
+        # write to a temporary file first, so an interrupted run doesn't leave half a section
+        for extension, content in ( ( 'json', json.dumps( metadata, sort_keys=True, indent=2 ).encode() ), ( 'section', data ) ):
+            fd, temporary_path = tempfile.mkstemp( dir=self.directory )
+            with os.fdopen( fd, 'wb' ) as section:
+                section.write( content )
+            os.replace( temporary_path, os.path.join( self.directory, '{}.{}'.format( key, extension ) ) )
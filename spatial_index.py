@@ -0,0 +1,99 @@
+#!/usr/bin/env python
+# uniform grid over map positions to find entities on the discarded mirror side
+
+import math
+from mirror_transform import unknown_mirror_axis
+
+GRID_CELLS_PER_SIDE = 64
+
+# signed distance of ( x, z ) to the line get_mirror_position() mirrors at,
+# negative on keep side 1 and positive on keep side 2
+def mirror_side_distance( x, z, mirror_axis, size ):
+    width, height = size
+    if mirror_axis == 'x':
+        return x - (width-1)/2
+    elif mirror_axis == 'y':
+        return z - (height-1)/2
+    m = width / height
+    if mirror_axis == 'xy':
+        return ( x - z*m ) / math.sqrt( 1 + m*m )
+    elif mirror_axis == 'yx':
+        return ( x + z*m - (width-1) ) / math.sqrt( 1 + m*m )
+    raise unknown_mirror_axis( mirror_axis, [ 'x', 'y', 'xy', 'yx' ] )
+
+# distance of ( x, z ) into the part of the map keep_side discards, not above 0 on the kept part,
+# rotations keep the top half or the top left quarter for keep side 1 and the opposite one for 2
+def discarded_side_distance( x, z, mirror_axis, keep_side, size ):
+    width, height = size
+    if mirror_axis == 'rot2':
+        mirror_axis = 'y'
+    elif mirror_axis == 'rot4':
+        if keep_side == 1:
+            return max( x - (width-1)/2, z - (height-1)/2 )
+        return max( (width-1)/2 - x, (height-1)/2 - z )
+    sign = 1 if keep_side == 1 else -1
+    return sign * mirror_side_distance( x, z, mirror_axis, size )
+
+class UniformGrid( object ):
+    def __init__( self, size, cells_per_side=GRID_CELLS_PER_SIDE ):
+        self.cell_width = max( size[0] / cells_per_side, 1 )
+        self.cell_height = max( size[1] / cells_per_side, 1 )
+        self.cells = {}
+    def cell( self, x, z ):
+        return ( int( x // self.cell_width ), int( z // self.cell_height ) )
+    def insert( self, key, x, z, radius=0 ):
+        self.cells.setdefault( self.cell( x, z ), [] ).append( ( key, x, z, radius ) )
+    def cell_corners( self, cell ):
+        x0, z0 = cell[0] * self.cell_width, cell[1] * self.cell_height
+        x1, z1 = x0 + self.cell_width, z0 + self.cell_height
+        return ( ( x0, z0 ), ( x1, z0 ), ( x0, z1 ), ( x1, z1 ) )
+
+# keys of ( key, x, z, radius ) entities which are completely on the side keep_side discards,
+# cells far enough from the mirror line are decided as a whole
+def discarded_entities( entities, mirror_axis, keep_side, size ):
+    discarded = set()
+    if keep_side not in ( 1, 2 ):
+        return discarded
+    grid = UniformGrid( size )
+    for key, x, z, radius in entities:
+        grid.insert( key, x, z, radius )
+    for cell, cell_entities in grid.cells.items():
+        # for the rot4 quarter the extremes over a cell are at corners as well
+        distances = [ discarded_side_distance( x, z, mirror_axis, keep_side, size ) for x, z in grid.cell_corners( cell ) ]
+        if max( distances ) <= 0:
+            continue
+        if min( distances ) > max( entity[3] for entity in cell_entities ):
+            discarded.update( entity[0] for entity in cell_entities )
+            continue
+        for key, x, z, radius in cell_entities:
+            if discarded_side_distance( x, z, mirror_axis, keep_side, size ) > radius:
+                discarded.add( key )
+    return discarded
+
+# hash of ( kind, x, z ) points in cells of tolerance size, so looking for a point
+# closer than tolerance only needs the 3x3 cells around it
+class SpatialHash( object ):
+    def __init__( self, tolerance ):
+        self.tolerance = tolerance
+        self.cells = {}
+    def cell( self, x, z ):
+        return ( int( x // self.tolerance ), int( z // self.tolerance ) )
+    def insert( self, kind, x, z ):
+        self.cells.setdefault( ( kind, ) + self.cell( x, z ), [] ).append( ( x, z ) )
+    def contains( self, kind, x, z ):
+        cell_x, cell_z = self.cell( x, z )
+        for dx in ( -1, 0, 1 ):
+            for dz in ( -1, 0, 1 ):
+                for other_x, other_z in self.cells.get( ( kind, cell_x+dx, cell_z+dz ), () ):
+                    if math.hypot( x - other_x, z - other_z ) <= self.tolerance:
+                        return True
+        return False
+
+# None disables dedup, otherwise a SpatialHash of the ( kind, x, z ) entities
+def existing_entities( entities, tolerance ):
+    if not tolerance or tolerance <= 0:
+        return None
+    spatial_hash = SpatialHash( tolerance )
+    for kind, x, z in entities:
+        spatial_hash.insert( kind, x, z )
+    return spatial_hash
@@ -0,0 +1,397 @@
+#!/usr/bin/env python
+# generate synthetic but valid scmap and _save.lua pairs
+
+import math
+import os
+import random
+import sys
+from struct import pack
+from zipfile import ZipFile
+
+from read_scmap import SCMAPMAGIC, DDSMAGIC
+
+SUPPORTED_FILE_VERSIONS_MINOR = [53, 56, 59, 60]
+
+def c_string( s ):
+    if isinstance( s, str ):
+        s = s.encode()
+    return s + b'\0'
+
+def random_bytes( rng, length ):
+    if length == 0:
+        return b''
+    return rng.getrandbits( 8*length ).to_bytes( length, 'little' )
+
+def dds_header( width, height, mip_map_count, dxt5 ):
+    if dxt5:
+        # DDSD_CAPS, DDSD_HEIGHT, DDSD_WIDTH, DDSD_PIXELFORMAT, DDSD_LINEARSIZE
+        flags = 0x1 | 0x2 | 0x4 | 0x1000 | 0x80000
+        pitch_or_linear_size = width * height
+        pixel_format = ( 32, 0x4, 894720068, 0, 0, 0, 0, 0 )
+    else:
+        # DDSD_CAPS, DDSD_HEIGHT, DDSD_WIDTH, DDSD_PITCH, DDSD_PIXELFORMAT
+        flags = 0x1 | 0x2 | 0x4 | 0x8 | 0x1000
+        pitch_or_linear_size = width * 4
+        pixel_format = ( 32, 0x41, 0, 32, 255 << 16, 255 << 8, 255, 255 << 24 )
+    caps = 0x1000
+    if mip_map_count > 1:
+        flags |= 0x20000
+        caps |= 0x8 | 0x400000
+    return DDSMAGIC + pack( '31I',
+        124, flags, height, width, pitch_or_linear_size, 0, mip_map_count,
+        *( [0] * 11 ), *pixel_format, caps, 0, 0, 0, 0 )
+
+def mip_map_sizes( width, height, mip_map_count ):
+    sizes = []
+    for _ in range( mip_map_count ):
+        sizes.append( ( width, height ) )
+        width //= 2
+        height //= 2
+    return sizes
+
+def max_mip_map_count( width, height, dxt5 ):
+    smallest = 4 if dxt5 else 1
+    count = 1
+    while width // 2 >= smallest and height // 2 >= smallest:
+        width //= 2
+        height //= 2
+        count += 1
+    return count
+
+# 4x4 DXT5 block with a random palette
+def dxt5_block( rng, is_normal_map=False ):
+    if is_normal_map:
+        # normal maps keep x in alpha and y in green, r and b are unused
+        a0, a1 = rng.randrange( 96, 160 ), rng.randrange( 96, 160 )
+        c0 = ( rng.randrange( 24, 40 ) << 5 )
+        c1 = ( rng.randrange( 24, 40 ) << 5 )
+    else:
+        a0, a1 = rng.randrange( 256 ), rng.randrange( 256 )
+        c0, c1 = rng.randrange( 65536 ), rng.randrange( 65536 )
+    return pack( 'BB', a0, a1 ) + random_bytes( rng, 6 ) + pack( 'HH', c0, c1 ) + random_bytes( rng, 4 )
+
+def dxt5_image( rng, width, height, is_normal_map=False, distinct_blocks=64 ):
+    mip_map_count = max_mip_map_count( width, height, True )
+    # reuse a pool of blocks, building every block on its own is slow for big sizes
+    pool = b''.join( dxt5_block( rng, is_normal_map ) for _ in range( distinct_blocks ) )
+    data = bytearray( dds_header( width, height, mip_map_count, True ) )
+    for size in mip_map_sizes( width, height, mip_map_count ):
+        blocks = ( size[0] // 4 ) * ( size[1] // 4 )
+        offsets = random_bytes( rng, blocks )
+        data += b''.join( pool[ ( o % distinct_blocks ) * 16 : ( o % distinct_blocks ) * 16 + 16 ] for o in offsets )
+    return bytes( data )
+
+def uncompressed_image( rng, width, height, mip_map_count=1 ):
+    data = bytearray( dds_header( width, height, mip_map_count, False ) )
+    for size in mip_map_sizes( width, height, mip_map_count ):
+        row = random_bytes( rng, size[0] * 4 )
+        data += row * size[1]
+    return bytes( data )
+
+def height_map( rng, width, height ):
+    data = bytearray()
+    row_format = '{}H'.format( width + 1 )
+    row_wave = [ 2048 * math.sin( x / 37.0 ) for x in range( width + 1 ) ]
+    for y in range( height + 1 ):
+        column_wave = math.cos( y / 53.0 )
+        data += pack( row_format, *[ int( 4096 + w * column_wave ) for w in row_wave ] )
+    return bytes( data )
+
+def synthetic_decal_texture( decal_id ):
+    # albedo(1), normals(2)
+    if decal_id % 2:
+        return 2, '/env/Common/decals/Normal_Decal_{:03d}.dds'.format( decal_id % 7 )
+    return 1, '/env/Common/decals/Albedo_Decal_{:03d}.dds'.format( decal_id % 5 )
+
+def generate_env_scd( rng, path_to_env_scd, decals_count=100, decal_size=64 ):
+    textures = {}
+    for decal_id in range( decals_count ):
+        decal_type, texture = synthetic_decal_texture( decal_id )
+        textures[texture] = decal_type == 2
+    if os.path.dirname( path_to_env_scd ):
+        os.makedirs( os.path.dirname( path_to_env_scd ), exist_ok=True )
+    with ZipFile( path_to_env_scd, 'w' ) as env_scd:
+        for texture in sorted( textures ):
+            env_scd.writestr( texture[1:].lower(), dxt5_image( rng, decal_size, decal_size, is_normal_map=textures[texture] ) )
+
+def generate_scmap( rng, size, file_version_minor, props_count=1000, decals_count=100,
+                    normal_maps_count=1, strata_uncompressed=False ):
+    if file_version_minor not in SUPPORTED_FILE_VERSIONS_MINOR:
+        raise Exception( "unsupported file minor version {}".format( file_version_minor ) )
+    map_width = map_height = size
+    out = bytearray()
+    out += SCMAPMAGIC
+    out += pack( 'I', 2 )
+    out += pack( 'I', 0xbeeffeed ) + pack( 'I', 2 )
+    out += pack( 'ff', float( map_width ), float( map_height ) )
+    out += pack( 'I', 0 ) + pack( 'H', 0 )
+
+    preview = uncompressed_image( rng, 256, 256 )
+    out += pack( 'I', len( preview ) ) + preview
+
+    out += pack( 'I', file_version_minor )
+    out += pack( 'II', map_width, map_height )
+    out += pack( 'f', 1/128 )
+    out += height_map( rng, map_width, map_height )
+
+    if file_version_minor >= 56:
+        out += c_string( '' )
+    out += c_string( '/env/evergreen/evergreen.scd' )
+    out += c_string( '/textures/environment/defaultbackground.dds' )
+    out += c_string( '/textures/environment/defaultskycube.dds' )
+    if file_version_minor < 56:
+        out += c_string( '/textures/environment/defaultenvcube.dds' )
+    else:
+        out += pack( 'I', 1 )
+        out += c_string( '<default>' ) + c_string( '/textures/environment/defaultenvcube.dds' )
+
+    # lighting multiplier, light direction, ambience, light color, shadow fill
+    out += pack( 'f', 1.5 )
+    out += pack( 'fff', 0.707, 0.707, 0.0 )
+    out += pack( 'fff', 0.2, 0.2, 0.2 )
+    out += pack( 'fff', 1.0, 1.0, 1.0 )
+    out += pack( 'fff', 0.5, 0.5, 0.5 )
+    out += pack( 'ffff', 0, 0, 0, 0 )
+    out += pack( 'f', 0.08 )
+    out += pack( 'fff', 1, 1, 1 )
+    out += pack( 'ff', 1000, 1000 )
+    # water
+    out += pack( 'c', b'\x01' )
+    out += pack( 'fff', 25, 20, 10 )
+    out += pack( 'fff', 0, 0.7, 1.5 )
+    out += pack( '12f', *( [0.5] * 12 ) )
+    out += pack( 'fff', 1.1, 0.7, 0.4 )
+    out += pack( 'ff', 1.5, 0 )
+    out += c_string( '/textures/engine/waterCubemap.dds' )
+    out += c_string( '/textures/engine/waterramp.dds' )
+    out += pack( '4f', 0.0009, 0.009, 0.05, 0.5 )
+    for i in range( 4 ):
+        out += pack( 'ff', 0.1, 0.2 ) + c_string( '/textures/engine/waves.dds' )
+    out += pack( 'I', 0 )
+    if file_version_minor >= 59:
+        out += bytes( 28 )
+    elif file_version_minor > 53:
+        out += bytes( 24 )
+    else:
+        out += c_string( '' )
+
+    if file_version_minor > 53:
+        for i in range( 10 ):
+            out += c_string( '/env/evergreen/layers/eg_grass001_albedo.dds' ) + pack( 'f', 4 )
+        for i in range( 9 ):
+            out += c_string( '/env/evergreen/layers/eg_grass001_normal.dds' ) + pack( 'f', 4 )
+    else:
+        out += pack( 'I', 1 )
+        out += c_string( '/env/evergreen/layers/eg_grass001_albedo.dds' )
+        out += c_string( '/env/evergreen/layers/eg_grass001_normal.dds' )
+        out += pack( 'ff', 4, 4 )
+
+    out += pack( 'II', 0, 0 )
+
+    out += pack( 'I', decals_count )
+    for decal_id in range( decals_count ):
+        decal_type, texture = synthetic_decal_texture( decal_id )
+        texture = texture.encode()
+        out += pack( 'IIII', decal_id, decal_type, 0, len( texture ) ) + texture
+        out += pack( 'I', 0 )
+        out += pack( 'fff', 16, 16, 16 )
+        out += pack( 'fff', rng.uniform( 0, map_width ), 20, rng.uniform( 0, map_height ) )
+        out += pack( 'fff', 0, rng.uniform( -math.pi, math.pi ), 0 )
+        out += pack( 'ffI', 1000, 0, 0 )
+    out += pack( 'I', 0 )
+
+    out += pack( 'II', map_width, map_height )
+    out += pack( 'I', normal_maps_count )
+    for _ in range( normal_maps_count ):
+        normal_map = dxt5_image( rng, map_width, map_height, is_normal_map=True )
+        out += pack( 'I', len( normal_map ) ) + normal_map
+
+    for _ in range( 2 ):
+        if file_version_minor < 56:
+            out += pack( 'I', 1 )
+        if strata_uncompressed:
+            stratum = uncompressed_image( rng, map_width // 2, map_height // 2 )
+        else:
+            stratum = dxt5_image( rng, map_width // 2, map_height // 2 )
+        out += pack( 'I', len( stratum ) ) + stratum
+
+    if file_version_minor > 53:
+        out += pack( 'I', 1 )
+        water_brush = dxt5_image( rng, map_width // 2, map_height // 2 )
+        out += pack( 'I', len( water_brush ) ) + water_brush
+
+    for _ in range( 3 ):
+        out += random_bytes( rng, ( map_width // 2 ) * ( map_height // 2 ) )
+    out += random_bytes( rng, map_width * map_height )
+
+    if file_version_minor >= 59:
+        out += bytes( 64 )
+        out += c_string( '' ) + c_string( '' )
+        out += pack( 'I', 1 ) + bytes( 40 )
+        out += bytes( 19 )
+        out += c_string( '' )
+        out += bytes( 88 )
+
+    out += pack( 'I', props_count )
+    for i in range( props_count ):
+        rad = rng.uniform( 0, 2*math.pi )
+        out += c_string( '/env/evergreen/props/trees/pine06_prop.bp' )
+        out += pack( 'fff', rng.uniform( 0, map_width ), 20, rng.uniform( 0, map_height ) )
+        out += pack( 'fff', math.cos( rad ), 0, math.sin( rad ) )
+        out += pack( 'fff', 0, 1, 0 )
+        out += pack( 'fff', -math.sin( rad ), 0, math.cos( rad ) )
+        out += pack( 'fff', 1, 1, 1 )
+    return bytes( out )
+
+def generate_save_lua( rng, size, markers_count=100, units_count=10 ):
+    lines = []
+    w = lines.append
+    def decorator( indent, title ):
+        w( "{0}--[[{1}]]--".format( indent, " "*75 ) )
+        w( "{0}--[[  {1: <73}]]--".format( indent, title ) )
+        w( "{0}--[[{1}]]--".format( indent, " "*75 ) )
+    decorator( '', 'Automatically generated code (do not edit)' )
+    decorator( '', 'Scenario' )
+    w( "Scenario = {" )
+    w( "    next_area_id = '1'," )
+    decorator( '    ', 'Props' )
+    w( "    Props = {" )
+    w( "    }," )
+    decorator( '    ', 'Areas' )
+    w( "    Areas = {" )
+    w( "        ['AREA_1'] = {" )
+    w( "            ['rectangle'] = RECTANGLE( 0, 0, {}, {} ),".format( size, size ) )
+    w( "        }," )
+    w( "    }," )
+    decorator( '    ', 'Markers' )
+    w( "    MasterChain = {" )
+    w( "        ['_MASTERCHAIN_'] = {" )
+    w( "            Markers = {" )
+    for i in range( markers_count ):
+        x, z = rng.uniform( 0, size ), rng.uniform( 0, size )
+        w( "                ['Mass {:02d}'] = {{".format( i ) )
+        w( "                    ['size'] = FLOAT( 1.000000 )," )
+        w( "                    ['resource'] = BOOLEAN( true )," )
+        w( "                    ['amount'] = FLOAT( 100.000000 )," )
+        w( "                    ['color'] = STRING( 'ff808080' )," )
+        w( "                    ['editorIcon'] = STRING( '/textures/editor/marker_mass.bmp' )," )
+        w( "                    ['type'] = STRING( 'Mass' )," )
+        w( "                    ['prop'] = STRING( '/env/common/props/markers/M_Mass_prop.bp' )," )
+        w( "                    ['orientation'] = VECTOR3( 0, -0, 0 )," )
+        w( "                    ['position'] = VECTOR3( {:.6g}, 20, {:.6g} ),".format( x, z ) )
+        w( "                }," )
+    w( "                ['ARMY_1'] = {" )
+    w( "                    ['color'] = STRING( 'ff800080' )," )
+    w( "                    ['type'] = STRING( 'Blank Marker' )," )
+    w( "                    ['prop'] = STRING( '/env/common/props/markers/M_Blank_prop.bp' )," )
+    w( "                    ['orientation'] = VECTOR3( 0, -0, 0 )," )
+    w( "                    ['position'] = VECTOR3( 32.5, 20, 32.5 )," )
+    w( "                }," )
+    w( "            }," )
+    w( "        }," )
+    w( "    }," )
+    w( "    Chains = {" )
+    w( "    }," )
+    decorator( '    ', 'Orders' )
+    w( "    next_queue_id = '1'," )
+    w( "    Orders = {" )
+    w( "    }," )
+    decorator( '    ', 'Platoons' )
+    w( "    next_platoon_id = '1'," )
+    w( "    Platoons = {" )
+    w( "    }," )
+    decorator( '    ', 'Armies' )
+    w( "    next_army_id = '2'," )
+    w( "    next_group_id = '2'," )
+    w( "    next_unit_id = '{}',".format( units_count ) )
+    w( "    Armies = {" )
+    for army in ( 'ARMY_1', 'ARMY_17' ):
+        decorator( '        ', 'Army' )
+        w( "        ['{}'] = {{".format( army ) )
+        w( "            personality = ''," )
+        w( "            plans = ''," )
+        w( "            color = 0," )
+        w( "            faction = 0," )
+        w( "            Economy = {mass = 0, energy = 0}," )
+        w( "            Alliances = {}," )
+        w( "            ['Units'] = GROUP {" )
+        w( "                orders = ''," )
+        w( "                platoon = ''," )
+        w( "                Units = {" )
+        w( "                    ['INITIAL'] = GROUP {" )
+        w( "                        orders = ''," )
+        w( "                        platoon = ''," )
+        w( "                        Units = {" )
+        if army == 'ARMY_17':
+            for i in range( units_count ):
+                x, z = rng.uniform( 0, size ), rng.uniform( 0, size )
+                w( "                            ['UNIT_{}'] = {{".format( i ) )
+                w( "                                type = 'xec80{:02d}',".format( 1 + i % 20 ) )
+                w( "                                orders = ''," )
+                w( "                                platoon = ''," )
+                w( "                                Position = {{ {:.6f}, 20.000000, {:.6f} }},".format( x, z ) )
+                w( "                                Orientation = { 0.000000, 3.141593, 0.000000 }," )
+                w( "                            }," )
+        w( "                        }," )
+        w( "                    }," )
+        w( "                }," )
+        w( "            }," )
+        w( "            PlatoonBuilders = {" )
+        w( "                next_platoon_builder_id = '0'," )
+        w( "                Builders = {" )
+        w( "                }," )
+        w( "            }," )
+        w( "        }," )
+    w( "    }," )
+    w( "}" )
+    return "\n".join( lines ) + "\n"
+
+def write_synthetic_map( directory, name, size, file_version_minor, seed=0, **kwargs ):
+    rng = random.Random( seed )
+    markers_count = kwargs.pop( 'markers_count', 100 )
+    units_count = kwargs.pop( 'units_count', 10 )
+    os.makedirs( directory, exist_ok=True )
+    path_to_scmap = os.path.join( directory, '{}.scmap'.format( name ) )
+    with open( path_to_scmap, 'wb' ) as scmap:
+        scmap.write( generate_scmap( rng, size, file_version_minor, **kwargs ) )
+    with open( os.path.join( directory, '{}_save.lua'.format( name ) ), 'w' ) as save_lua:
+        save_lua.write( generate_save_lua( rng, size, markers_count, units_count ) )
+    return path_to_scmap
+
+def main():
+
+    from docopt import docopt
+    doc = '''
+    Usage:
+        {name} <directory> [options]
+
+    Options:
+        -h, --help                    Show this screen and exit.
+        --name=<name>                 Map file name without extension [default: synthetic]
+        --size=<n>                    Map width and height [default: 512]
+        --file-version-minor=<n>      One of {versions} [default: 60]
+        --props=<n>                   Number of props [default: 1000]
+        --decals=<n>                  Number of decals [default: 100]
+        --markers=<n>                 Number of mass markers [default: 100]
+        --units=<n>                   Number of units [default: 10]
+        --normal-maps=<n>             Number of normal maps [default: 1]
+        --strata-uncompressed         Store strata masks as uncompressed dds
+        --seed=<n>                    Random seed [default: 0]
+        --env-scd=<path>              Also write env.scd with the used decal textures
+    '''.format(name=os.path.basename(sys.argv[0]),versions='|'.join(map(str,SUPPORTED_FILE_VERSIONS_MINOR)))
+    args = docopt(doc, sys.argv[1:])
+
+    seed = int(args['--seed'])
+    decals_count = int(args['--decals'])
+    path_to_scmap = write_synthetic_map(
+        args['<directory>'], args['--name'], int(args['--size']), int(args['--file-version-minor']), seed,
+        props_count=int(args['--props']), decals_count=decals_count,
+        markers_count=int(args['--markers']), units_count=int(args['--units']),
+        normal_maps_count=int(args['--normal-maps']), strata_uncompressed=args['--strata-uncompressed'] )
+    print("Written {}".format(path_to_scmap))
+    if args['--env-scd']:
+        generate_env_scd( random.Random( seed ), args['--env-scd'], decals_count )
+        print("Written {}".format(args['--env-scd']))
+
+if __name__ == '__main__':
+    main()